@@ -0,0 +1,58 @@
+"""
+Snapshot scoring benchmark for the anomaly engine.
+
+Evaluates a stream of synthetic snapshots and reports the mean and worst time
+per snapshot, against the 5 s budget of the snapshot cadence.
+
+    python benchmarks/bench_anomaly.py [--snapshots N]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+from anomaly import AnomalyEngine  # noqa: E402
+from wind_turbine_calculator import WindTurbineCalculator  # noqa: E402
+
+
+def make_snapshot(calculator, num_turbines, timestamp, wind):
+    turbines = {}
+    for i in range(num_turbines):
+        wind_speed = round(wind + random.uniform(-0.3, 0.3), 2)
+        temperature = round(10 + random.uniform(-0.5, 0.5), 2)
+        pressure = round(101000 + random.uniform(-50, 50), 2)
+        power = calculator.estimate_power_output(wind_speed, temperature, pressure) + random.gauss(0, 20)
+        turbines[f"turbine {i+1}"] = {
+            "temperature": temperature,
+            "wind_speed": wind_speed,
+            "pressure": pressure,
+            "power_output": round(power, 2),
+        }
+    return {"timestamp": timestamp, "turbine_id": 0, "turbines": turbines}
+
+
+def bench_engine(num_turbines, num_snapshots):
+    calculator = WindTurbineCalculator()
+    engine = AnomalyEngine(calculator)
+    now = time.time()
+    snapshots = [make_snapshot(calculator, num_turbines, now + i * 5, 8 + i * 0.05) for i in range(num_snapshots)]
+    timings = []
+    alerts = 0
+    for snapshot in snapshots:
+        start = time.perf_counter()
+        alerts += len(engine.evaluate(snapshot))
+        timings.append(time.perf_counter() - start)
+    return sum(timings) / len(timings), max(timings), alerts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--snapshots', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'turbines':>9} {'mean ms':>9} {'max ms':>9} {'budget used':>12} {'alerts':>7}")
+    for num_turbines in (30, 1_000, 10_000):
+        mean, worst, alerts = bench_engine(num_turbines, args.snapshots)
+        print(f"{num_turbines:>9} {mean * 1000:>9.2f} {worst * 1000:>9.2f} {worst / 5.0:>12.2%} {alerts:>7}")
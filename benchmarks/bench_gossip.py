@@ -0,0 +1,113 @@
+"""
+Convergence and bandwidth of membership gossip (src/gossip.py).
+
+Runs N Gossip instances in one process with an in-memory transport and a
+shared round clock. After the view has settled it times two events: a node
+joining through a single contact, and a node failing. For each it reports
+the rounds until every live node knows, and the gossip bytes (JSON request
+plus response) each node sent per round. For comparison it also shows what
+the scan and /down flood scheme costs: every node probing every port once a
+minute, and the detecting node telling every other node about a failure.
+
+    python benchmarks/bench_gossip.py [--sizes 10,100,500] [--seed 1]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+import gossip  # noqa: E402
+
+
+class Network:
+    """N gossiping nodes, addressed as ('10.0.x.y', id), stepped one round at a time"""
+
+    def __init__(self, size):
+        self.round_number = 0
+        self.nodes = {}
+        self.dead = set()
+        self.bytes_sent = 0
+        for node_id in range(size):
+            self.add(node_id)
+        everyone = {node_id: self.host(node_id) for node_id in self.nodes}
+        for node in self.nodes.values():
+            node.seed(everyone)
+
+    def host(self, node_id):
+        return (f"10.0.{node_id // 250}.{node_id % 250 + 1}", node_id)
+
+    def add(self, node_id):
+        node = gossip.Gossip(node_id, ('0.0.0.0', node_id), generation=1 + node_id,
+                             post=lambda host, payload, sender=node_id: self.post(sender, host, payload),
+                             clock=lambda: self.round_number)
+        self.nodes[node_id] = node
+        return node
+
+    def post(self, sender, host, payload):
+        target = host[1]
+        if target in self.dead:
+            raise requests.exceptions.ConnectionError(f"{target} is down")
+        response = self.nodes[target].handle(payload, self.host(sender)[0])
+        self.bytes_sent += len(json.dumps(payload)) + len(json.dumps(response))
+        return response
+
+    def step(self):
+        self.round_number += 1
+        live = [node for node_id, node in self.nodes.items() if node_id not in self.dead]
+        random.shuffle(live)
+        for node in live:
+            node.round()
+
+    def quiet(self):
+        """True once no node has changes left to resend"""
+        return all(member['sends'] == 0 for node_id, node in self.nodes.items() if node_id not in self.dead
+                   for member_id, member in node.members.items() if member_id != node_id)
+
+    def until(self, done, limit=200):
+        """Rounds until done() holds, and gossip bytes per live node per round over them"""
+        self.bytes_sent = 0
+        for rounds in range(1, limit + 1):
+            self.step()
+            if done():
+                live = len(self.nodes) - len(self.dead)
+                return rounds, self.bytes_sent / live / rounds
+        return None, None
+
+
+def status_everywhere(network, member_id, status):
+    return all(member_id in node.members and node.members[member_id]['version'][2] == status
+               for node_id, node in network.nodes.items() if node_id not in network.dead and node_id != member_id)
+
+
+def bench(size):
+    network = Network(size)
+    network.until(network.quiet, limit=1000)
+
+    joiner = network.add(size)
+    joiner.seed({0: network.host(0)})
+    join_rounds, join_bytes = network.until(lambda: status_everywhere(network, size, gossip.ALIVE))
+    network.until(network.quiet, limit=1000)
+
+    victim = random.randrange(1, size)
+    network.dead.add(victim)
+    fail_rounds, fail_bytes = network.until(lambda: status_everywhere(network, victim, gossip.DOWN))
+    return join_rounds, join_bytes, fail_rounds, fail_bytes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10,100,500', help="comma separated node counts")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    print(f"{'nodes':>6} {'join rounds':>12} {'B/node/round':>13} {'fail rounds':>12} {'B/node/round':>13}"
+          f" {'scan req/node/min':>18} {'flood msgs':>11}")
+    for size in (int(s) for s in args.sizes.split(',') if s):
+        join_rounds, join_bytes, fail_rounds, fail_bytes = bench(size)
+        print(f"{size:>6} {join_rounds:>12} {join_bytes:>13.0f} {fail_rounds:>12} {fail_bytes:>13.0f}"
+              f" {size:>18} {size - 2:>11}")
@@ -0,0 +1,119 @@
+"""
+Ground station ingest throughput against worker count.
+
+Starts src/ground_station.py with --workers N on 127.0.0.1:33999 (DATA_DIR
+in a temporary directory), posts pre-encrypted, FEC encoded status updates
+from a pool of client threads and reports delivered messages/s for each N,
+with the speed-up over one worker. Every run checks the rows that reached the
+sharded store. Scaling is bounded by the machine's cores, which are printed.
+
+    python benchmarks/bench_gs_workers.py [--workers 1,2,4] [--messages 200] [--turbines 30]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import rsa
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, 'src'))
+import codec  # noqa: E402
+import storage  # noqa: E402
+from dedup import MESSAGE_ID_HEADER  # noqa: E402
+
+GS_PORT = 33999
+
+
+def make_messages(count, turbines):
+    """Bodies as the ground station receives them: RSA encrypted in 245 byte blocks, then FEC encoded"""
+    with open(os.path.join(REPO_DIR, 'keys', 'public.pem')) as f:
+        public_key = rsa.PublicKey.load_pkcs1(f.read())
+    now = time.time()
+    messages = []
+    for i in range(count):
+        text = json.dumps({
+            "timestamp": now + i * 1e-3,
+            "turbine_id": 0,
+            "turbines": {
+                f"turbine {t + 1}": {
+                    "temperature": round(random.uniform(5, 15), 2),
+                    "wind_speed": round(random.uniform(0, 25), 2),
+                    "pressure": round(random.uniform(99000, 102000), 2),
+                    "power_output": round(random.uniform(0, 6000), 2),
+                } for t in range(turbines)
+            },
+        }).encode()
+        encrypted = b''.join(rsa.encrypt(text[j:j + 245], public_key) for j in range(0, len(text), 245))
+        messages.append(codec.encode(encrypted, codec.DEFAULT_FEC))
+    return messages
+
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+def bench(workers, messages, clients):
+    data_dir = tempfile.mkdtemp(prefix='gs-workers-')
+    env = dict(os.environ, DATA_DIR=data_dir, LOG_LEVEL='WARNING')
+    with open(os.path.join(data_dir, 'ground_station.log'), 'w') as log:
+        process = subprocess.Popen([sys.executable, os.path.join('src', 'ground_station.py'), '--workers', str(workers)],
+                                   cwd=REPO_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        if not wait_for_port(GS_PORT):
+            raise RuntimeError("Ground station did not come up")
+        time.sleep(0.5 * workers)  # the remaining workers bind a moment later
+
+        def post(body):
+            # A connection per message, as satellites send them, so the kernel spreads them over workers
+            return requests.post(f"http://127.0.0.1:{GS_PORT}/", data=body, headers={MESSAGE_ID_HEADER: uuid.uuid4().hex},
+                                 timeout=60, proxies={"http": None, "https": None}).status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(clients) as pool:
+            statuses = list(pool.map(post, messages))
+        elapsed = time.perf_counter() - started
+    finally:
+        process.send_signal(signal.SIGINT)
+        process.wait(timeout=30)
+
+    db_path = os.path.join(data_dir, 'turbine_data.sqlite')
+    rows = storage.ShardedStore(db_path).count() if storage.shard_paths(db_path) else 0
+    shutil.rmtree(data_dir, ignore_errors=True)
+    return elapsed, sum(status == 200 for status in statuses), rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default='1,2,4', help="comma separated worker counts")
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--turbines', type=int, default=30, help="turbines per status update (sets message size)")
+    parser.add_argument('--clients', type=int, help="concurrent client threads (default 4 per worker)")
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages, args.turbines)
+    print(f"{os.cpu_count()} CPUs, {args.messages} messages of {len(messages[0])} bytes")
+    print(f"{'workers':>7} {'seconds':>8} {'msg/s':>8} {'speed-up':>9} {'rows stored':>12}")
+    baseline = None
+    for workers in (int(w) for w in args.workers.split(',') if w):
+        elapsed, ok, rows = bench(workers, messages, args.clients or 4 * workers)
+        rate = ok / elapsed
+        baseline = baseline or rate
+        print(f"{workers:>7} {elapsed:>8.2f} {rate:>8.1f} {rate / baseline:>8.2f}x {rows:>12}")
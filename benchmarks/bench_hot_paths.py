@@ -0,0 +1,197 @@
+"""
+Micro-benchmarks for the code every message runs through.
+
+Each case is timed over several sizes (payload bytes, turbine count or
+satellite count) and reported as per-call latency percentiles and throughput.
+Results are written as JSON and can be compared against a stored baseline;
+a case whose median latency grew by more than --threshold is flagged as a
+regression and the script exits with status 1. Everything runs offline.
+
+    python benchmarks/bench_hot_paths.py                      # run and compare to baseline.json
+    python benchmarks/bench_hot_paths.py --output run.json    # also save this run
+    python benchmarks/bench_hot_paths.py --save-baseline      # overwrite the baseline
+    python benchmarks/bench_hot_paths.py --filter hamming     # only matching cases
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'src'))
+
+import update_satellite_positions  # noqa: E402
+from find_shortest_way import find_shortest_path  # noqa: E402
+from ground_station import GroundStationNode  # noqa: E402
+from wind_farm import WindTurbineNode  # noqa: E402
+from wind_turbine_calculator import WindTurbineCalculator  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+
+
+def make_nodes():
+    """Node objects with just the state the hot paths need, no network scan or Flask app"""
+    wind_farm = WindTurbineNode.__new__(WindTurbineNode)
+    wind_farm.public_key = wind_farm.load_rsa_key()
+    wind_farm.distance = 1500.0
+    ground_station = GroundStationNode.__new__(GroundStationNode)
+    ground_station.private_key = ground_station.load_rsa_key(private=True)
+    return wind_farm, ground_station
+
+
+def make_turbine_data(num_turbines):
+    return {
+        "timestamp": time.time(),
+        "turbine_id": 0,
+        "turbines": {
+            f"turbine {i+1}": {
+                "temperature": round(random.uniform(5, 15), 2),
+                "wind_speed": round(random.uniform(0, 25), 2),
+                "pressure": round(random.uniform(99000, 102000), 2),
+                "power_output": round(random.uniform(0, 6000), 2),
+            } for i in range(num_turbines)
+        }
+    }
+
+
+def build_cases():
+    """(name, size label, size, items per call, zero-argument callable) for every case"""
+    wind_farm, ground_station = make_nodes()
+    calculator = WindTurbineCalculator()
+    cases = []
+
+    for size in (256, 2048, 16384):
+        payload = random.randbytes(size)
+        encoded = wind_farm.hamming_encode_message(payload)
+        cases.append(('hamming_encode_message', 'bytes', size, size,
+                      lambda p=payload: wind_farm.hamming_encode_message(p)))
+        cases.append(('hamming_decode_message', 'bytes', size, size,
+                      lambda e=encoded: ground_station.hamming_decode_message(e)))
+        cases.append(('simulate_noise', 'bytes', size, size,
+                      lambda e=encoded: wind_farm.simulate_noise(e)))
+
+    for turbines in (10, 30, 300):
+        data = make_turbine_data(turbines)
+        encrypted = wind_farm.encrypt_rsa_turbine_data(data)
+        cases.append(('encrypt_rsa_turbine_data', 'turbines', turbines, turbines,
+                      lambda d=data: wind_farm.encrypt_rsa_turbine_data(d)))
+        cases.append(('decrypt_rsa_turbine_data', 'turbines', turbines, turbines,
+                      lambda e=encrypted: ground_station.decrypt_rsa_turbine_data(e)))
+
+    for satellites in (10, 50, 200):
+        ids = range(1, satellites + 1)
+        positions = update_satellite_positions.calculate_satellite_positions(ids)
+        cases.append(('calculate_satellite_positions', 'satellites', satellites, satellites,
+                      lambda i=ids: update_satellite_positions.calculate_satellite_positions(i)))
+        cases.append(('find_shortest_path', 'satellites', satellites, 1,
+                      lambda p=positions: find_shortest_path(p, 0, -1)))
+
+    for turbines in (30, 3000, 30000):
+        readings = [(random.uniform(0, 25), random.uniform(5, 15), random.uniform(99000, 102000))
+                    for _ in range(turbines)]
+        cases.append(('estimate_power_output', 'turbines', turbines, turbines,
+                      lambda r=readings: [calculator.estimate_power_output(*reading) for reading in r]))
+
+    return cases
+
+
+def time_case(func, min_runs=5, min_time=0.5, max_runs=1000):
+    """Per-call latencies in seconds, after one warmup call"""
+    func()
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < max_runs and (len(timings) < min_runs or time.perf_counter() - started < min_time):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def percentile(sorted_values, q):
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run(case_filter=None, min_time=0.5):
+    results = {}
+    for name, size_label, size, items, func in build_cases():
+        case_id = f"{name}[{size_label}={size}]"
+        if case_filter and case_filter not in case_id:
+            continue
+        # Hot paths print progress, keep it out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            timings = sorted(time_case(func, min_time=min_time))
+        median = statistics.median(timings)
+        results[case_id] = {
+            'function': name,
+            size_label: size,
+            'runs': len(timings),
+            'mean_s': statistics.fmean(timings),
+            'p50_s': median,
+            'p95_s': percentile(timings, 0.95),
+            'min_s': timings[0],
+            'calls_per_s': 1 / median,
+            'items_per_s': items / median,
+        }
+        print(f"{case_id:<48} p50 {median * 1000:>10.3f} ms  p95 {results[case_id]['p95_s'] * 1000:>10.3f} ms"
+              f"  {items / median:>14,.0f} {size_label if items > 1 else 'calls'}/s")
+    return {
+        'meta': {
+            'created': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Names of cases whose median latency regressed by more than threshold (a fraction)"""
+    regressions = []
+    for case_id, result in current['results'].items():
+        reference = baseline['results'].get(case_id)
+        if reference is None:
+            continue
+        change = result['p50_s'] / reference['p50_s'] - 1
+        status = 'REGRESSION' if change > threshold else 'ok'
+        print(f"{case_id:<48} {change:>+8.1%}  {status}")
+        if change > threshold:
+            regressions.append(case_id)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help="write this run's results to a JSON file")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the baseline")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed median slowdown (default 0.25 = 25%%)")
+    parser.add_argument('--filter', help="only run cases whose id contains this string")
+    parser.add_argument('--min-time', type=float, default=0.5, help="minimum seconds spent timing each case")
+    args = parser.parse_args()
+
+    random.seed(0)
+    current = run(args.filter, args.min_time)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nCompared to {args.baseline}:")
+        if compare(current, baseline, args.threshold):
+            sys.exit(1)
+    else:
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one")
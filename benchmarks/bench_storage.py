@@ -0,0 +1,58 @@
+"""
+Ingest benchmark for the telemetry store.
+
+Feeds synthetic turbine messages through TelemetryStore.append and reports
+sustained rows/s (including the final flush) for several fleet sizes.
+
+    python benchmarks/bench_storage.py [--messages N]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+import storage  # noqa: E402
+
+
+def make_message(num_turbines, timestamp):
+    return {
+        "timestamp": timestamp,
+        "turbine_id": 0,
+        "turbines": {
+            f"turbine {i+1}": {
+                "temperature": round(random.uniform(5, 15), 2),
+                "wind_speed": round(random.uniform(0, 25), 2),
+                "pressure": round(random.uniform(99000, 102000), 2),
+                "power_output": round(random.uniform(0, 6000), 2),
+            } for i in range(num_turbines)
+        }
+    }
+
+
+def bench_ingest(num_turbines, num_messages):
+    messages = [make_message(num_turbines, time.time() + i * 5) for i in range(num_messages)]
+    with tempfile.TemporaryDirectory() as tmp:
+        store = storage.TelemetryStore(os.path.join(tmp, 'bench.sqlite')).start()
+        start = time.perf_counter()
+        for message in messages:
+            store.append(message)
+        store.flush()
+        elapsed = time.perf_counter() - start
+        rows = store.count()
+        store.close()
+    return rows, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=None, help="messages per size (default: ~300k rows per size)")
+    args = parser.parse_args()
+
+    print(f"{'turbines/msg':>12} {'messages':>9} {'rows':>9} {'seconds':>8} {'rows/s':>12}")
+    for num_turbines in (30, 3_000, 30_000):
+        num_messages = args.messages or max(10, 300_000 // num_turbines)
+        rows, elapsed = bench_ingest(num_turbines, num_messages)
+        print(f"{num_turbines:>12} {num_messages:>9} {rows:>9} {elapsed:>8.3f} {rows / elapsed:>12,.0f}")
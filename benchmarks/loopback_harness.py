@@ -0,0 +1,324 @@
+"""
+End-to-end loopback load harness.
+
+Launches the real ground_station.py, N satellite.py processes and wind_farm.py
+on 127.0.0.1, with a local stub standing in for the Open-Meteo API, and lets
+the wind farm send status updates at a configurable rate. At the end it
+reports delivered message rate, end-to-end latency percentiles (GS receive
+time minus the payload timestamp), loss, the ground station's sequence gaps
+and dropped resends, and CPU time and peak RSS for every process. Results are
+printed and optionally written as JSON so topologies and codec settings can be
+compared.
+
+    python benchmarks/loopback_harness.py --satellites 1,2,3 --interval 1 --duration 60
+    python benchmarks/loopback_harness.py --config topology.json --output result.json
+
+A config file is JSON with any of the keys: satellites (list of ids, 1-10),
+turbines, interval, duration, settle (seconds to wait after the farm stops),
+env (extra environment variables passed to every node), farm_args (extra
+wind_farm.py arguments, e.g. ["--replay", "capture.csv", "--speedup", "20"]
+to replay a recording at a fixed rate) and gs_args (extra ground_station.py
+arguments, e.g. ["--workers", "4"]).
+"""
+import argparse
+import http.server
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(REPO_DIR, 'src')
+sys.path.insert(0, SRC_DIR)
+import storage  # noqa: E402
+
+GS_PORT = 33999
+WF_PORT = 33000
+DEFAULTS = {
+    'satellites': [1, 2, 3],
+    'turbines': 30,
+    'interval': 1.0,
+    'duration': 60.0,
+    'settle': 5.0,
+    'env': {},
+    'farm_args': [],
+    'gs_args': [],
+}
+
+
+class WeatherStub(http.server.BaseHTTPRequestHandler):
+    """Answers any GET with an Open-Meteo shaped 'current' block"""
+
+    def do_GET(self):
+        body = json.dumps({
+            'current': {
+                'temperature_2m': 11.5,
+                'surface_pressure': 1012.0,
+                'wind_speed_10m': 32.0,
+            }
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_weather_stub():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), WeatherStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_assets(run_dir):
+    """Network description that only contains this host"""
+    assets = os.path.join(run_dir, 'assets')
+    os.makedirs(assets)
+    shutil.copy(os.path.join(REPO_DIR, 'assets', 'device_positions.csv'), assets)
+    with open(os.path.join(assets, 'ip.txt'), 'w') as f:
+        f.write('127.0.0.1\n')
+    open(os.path.join(assets, 'other_satellites.txt'), 'w').close()
+    return assets
+
+
+def wait_for_port(port, timeout=120.0):
+    """Wait until something answers HTTP on the port (any status code)"""
+    # Probe a path no node serves, so the probe never registers as a device
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            opener.open(f"http://127.0.0.1:{port}/ready-probe", timeout=1)
+            return True
+        except urllib.error.HTTPError:
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def scrape_metrics(port):
+    """Unlabelled samples from a node's /metrics endpoint, or {} if it is not answering"""
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+    try:
+        with opener.open(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            text = response.read().decode()
+    except OSError:
+        return {}
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#') and '{' not in line:
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+def process_usage(pid):
+    """CPU seconds and peak RSS (MiB) of a live process and its child processes (workers), from /proc"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        ticks = os.sysconf('SC_CLK_TCK')
+        cpu = (int(fields[11]) + int(fields[12])) / ticks
+        peak_rss = None
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    peak_rss = int(line.split()[1]) / 1024
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except (OSError, IndexError, ValueError):
+        return {'cpu_s': None, 'peak_rss_mib': None}
+    for child in children:
+        usage = process_usage(child)
+        cpu += usage['cpu_s'] or 0
+        peak_rss = (peak_rss or 0) + (usage['peak_rss_mib'] or 0)
+    return {'cpu_s': round(cpu, 2), 'peak_rss_mib': round(peak_rss, 1) if peak_rss else None}
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Harness:
+    def __init__(self, config):
+        self.config = config
+        self.run_dir = tempfile.mkdtemp(prefix='loopback-')
+        self.processes = {}  # name -> (Popen, log path)
+        self.sent = 0
+        self.startup = {}
+        self.sequence = {}
+
+    def env(self, weather_url):
+        env = dict(os.environ)
+        env.update({
+            'PYTHONUNBUFFERED': '1',
+            'ASSETS_DIR': make_assets(self.run_dir),
+            'DATA_DIR': os.path.join(self.run_dir, 'data'),
+            'OPEN_METEO_URL': weather_url,
+            'NO_PROXY': '127.0.0.1,localhost',
+        })
+        env.update({key: str(value) for key, value in self.config['env'].items()})
+        return env
+
+    def launch(self, name, args, env):
+        log_path = os.path.join(self.run_dir, f"{name}.log")
+        log = open(log_path, 'w')
+        process = subprocess.Popen([sys.executable, *args], cwd=REPO_DIR, env=env,
+                                   stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT)
+        self.processes[name] = (process, log_path)
+        return process
+
+    def stop(self, name):
+        process, _ = self.processes[name]
+        usage = process_usage(process.pid)
+        if process.poll() is None:
+            process.send_signal(signal.SIGINT)
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        return usage
+
+    def run(self):
+        config = self.config
+        stub = start_weather_stub()
+        env = self.env(f"http://127.0.0.1:{stub.server_port}/v1/forecast")
+        print(f"Run directory: {self.run_dir}")
+
+        self.launch('ground_station', [os.path.join('src', 'ground_station.py'), *config['gs_args']], env)
+        if not wait_for_port(GS_PORT):
+            raise RuntimeError("Ground station did not come up")
+        for sat_id in config['satellites']:
+            self.launch(f"satellite_{sat_id}", [os.path.join('src', 'satellite.py'), str(sat_id)], env)
+            if not wait_for_port(WF_PORT + sat_id):
+                raise RuntimeError(f"Satellite {sat_id} did not come up")
+        print(f"Ground station and {len(config['satellites'])} satellites up")
+
+        self.launch('wind_farm', [
+            os.path.join('src', 'wind_farm.py'), '--no-prompt',
+            '--turbines', str(config['turbines']), '--interval', str(config['interval']),
+            *config['farm_args'],
+        ], env)
+        if not wait_for_port(WF_PORT):
+            raise RuntimeError("Wind farm did not come up")
+        started = time.time()
+        print(f"Wind farm sending every {config['interval']}s for {config['duration']}s")
+        time.sleep(config['duration'])
+
+        self.sent = int(scrape_metrics(WF_PORT).get('messages_sent_total', 0))
+        ports = {'ground_station': GS_PORT, 'wind_farm': WF_PORT,
+                 **{f"satellite_{sat_id}": WF_PORT + sat_id for sat_id in config['satellites']}}
+        self.startup = {}
+        for name, port in ports.items():
+            scraped = scrape_metrics(port)
+            self.startup[name] = {key: scraped.get(f"startup_{key}_seconds") for key in ('serving', 'discovery')}
+        usage = {'wind_farm': self.stop('wind_farm')}
+        time.sleep(config['settle'])
+        # With --workers this is whichever worker answers
+        scraped = scrape_metrics(GS_PORT)
+        self.sequence = {'missing': scraped.get('sequence_missing'), 'duplicates': scraped.get('sequence_duplicates_total')}
+        for name in list(self.processes):
+            if name != 'wind_farm':
+                usage[name] = self.stop(name)
+        stub.shutdown()
+        return self.report(started, usage)
+
+    def report(self, started, usage):
+        config = self.config
+        sent = self.sent
+
+        db_path = os.path.join(self.run_dir, 'data', 'turbine_data.sqlite')
+        received = {}
+        if storage.shard_paths(db_path):
+            for row in storage.ShardedStore(db_path).query():
+                received.setdefault((row['turbine_id'], row['timestamp']), row['received_at'])
+        latencies = sorted(received_at - timestamp for (_, timestamp), received_at in received.items())
+        delivered = len(latencies)
+
+        return {
+            'config': config,
+            'sent': sent,
+            'delivered': delivered,
+            'loss': round(1 - delivered / sent, 4) if sent else None,
+            'delivered_per_s': round(delivered / config['duration'], 3),
+            'latency_s': {
+                'p50': percentile(latencies, 0.50),
+                'p90': percentile(latencies, 0.90),
+                'p99': percentile(latencies, 0.99),
+                'max': latencies[-1] if latencies else None,
+            },
+            'processes': usage,
+            'startup_s': self.startup,
+            'sequence': self.sequence,
+            'run_dir': self.run_dir,
+            'started': started,
+        }
+
+
+def load_config(args):
+    config = dict(DEFAULTS)
+    if args.config:
+        with open(args.config) as f:
+            config.update(json.load(f))
+    if args.satellites:
+        config['satellites'] = [int(s) for s in args.satellites.split(',') if s]
+    for key in ('turbines', 'interval', 'duration', 'settle'):
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+    if not all(1 <= s <= 10 for s in config['satellites']):
+        raise SystemExit("Satellite ids must be between 1 and 10 (the scanned port range)")
+    return config
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', help="JSON topology/settings file")
+    parser.add_argument('--satellites', help="comma separated satellite ids")
+    parser.add_argument('--turbines', type=int)
+    parser.add_argument('--interval', type=float, help="seconds between wind farm status updates")
+    parser.add_argument('--duration', type=float, help="seconds the wind farm sends for")
+    parser.add_argument('--settle', type=float, help="seconds to wait for in-flight messages")
+    parser.add_argument('--output', help="write the report as JSON")
+    parser.add_argument('--keep', action='store_true', help="keep the run directory (logs and data)")
+    args = parser.parse_args()
+
+    harness = Harness(load_config(args))
+    try:
+        result = harness.run()
+    finally:
+        for name in harness.processes:
+            process, _ = harness.processes[name]
+            if process.poll() is None:
+                process.kill()
+
+    latency = result['latency_s']
+    fmt = lambda v: f"{v * 1000:.1f} ms" if v is not None else "n/a"
+    print(f"\nsent {result['sent']}  delivered {result['delivered']}  loss {result['loss']}"
+          f"  rate {result['delivered_per_s']} msg/s")
+    print(f"latency p50 {fmt(latency['p50'])}  p90 {fmt(latency['p90'])}  p99 {fmt(latency['p99'])}"
+          f"  max {fmt(latency['max'])}")
+    print(f"sequence gaps {result['sequence'].get('missing')}  resends dropped {result['sequence'].get('duplicates')}")
+    for name, stats in sorted(result['processes'].items()):
+        startup = result['startup_s'].get(name, {})
+        print(f"  {name:<16} cpu {stats['cpu_s']} s  peak rss {stats['peak_rss_mib']} MiB"
+              f"  serving {fmt(startup.get('serving'))}  discovery {fmt(startup.get('discovery'))}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    if not args.keep:
+        shutil.rmtree(harness.run_dir, ignore_errors=True)
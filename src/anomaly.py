@@ -0,0 +1,213 @@
+import threading
+from collections import deque
+
+import numpy as np
+
+# Default rate rule: power swinging by this fraction of rated power between two
+# status updates sent `interval` seconds apart
+RAMP_FRACTION = 0.25
+
+
+class AlertStore:
+    """
+    Bounded, queryable store of turbine alerts.
+
+    An alert for the same (farm, turbine, kind) raised again within cooldown
+    seconds is folded into the open alert (count and last_seen are updated)
+    instead of creating a new one.
+    """
+
+    def __init__(self, cooldown=300.0, max_alerts=10_000):
+        self.cooldown = cooldown
+        self._alerts = deque(maxlen=max_alerts)
+        self._open = {}  # (farm_id, turbine, kind) -> alert
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def add(self, farm_id, turbine, kind, timestamp, message, **details):
+        """Record an alert, returns it if it is new or None if it was deduplicated"""
+        key = (farm_id, turbine, kind)
+        with self._lock:
+            alert = self._open.get(key)
+            if alert is not None and timestamp - alert['last_seen'] < self.cooldown:
+                alert['count'] += 1
+                alert['last_seen'] = timestamp
+                alert['message'] = message
+                alert.update(details)
+                return None
+            alert = {
+                'id': self._next_id,
+                'farm_id': farm_id,
+                'turbine': turbine,
+                'kind': kind,
+                'first_seen': timestamp,
+                'last_seen': timestamp,
+                'count': 1,
+                'message': message,
+                **details
+            }
+            self._next_id += 1
+            self._open[key] = alert
+            self._alerts.append(alert)
+            return alert
+
+    def query(self, since=None, farm_id=None, turbine=None, kind=None, limit=100):
+        """Most recent alerts first, filtered by last_seen >= since and the given fields"""
+        with self._lock:
+            result = []
+            for alert in reversed(self._alerts):
+                if since is not None and alert['last_seen'] < since:
+                    continue
+                if farm_id is not None and alert['farm_id'] != farm_id:
+                    continue
+                if turbine is not None and alert['turbine'] != turbine:
+                    continue
+                if kind is not None and alert['kind'] != kind:
+                    continue
+                result.append(dict(alert))
+                if len(result) >= limit:
+                    break
+            return result
+
+
+class AnomalyEngine:
+    """
+    Streaming anomaly detection over turbine snapshots.
+
+    Every turbine gets a slot in a set of preallocated arrays holding an EWMA
+    of the residual (actual - estimated power), its EWMA variance, and the last
+    reading, so a whole snapshot is scored and the statistics updated with a
+    handful of vectorised operations. Three checks are applied:
+
+    - deviation: |residual| above residual_threshold kW (the original fixed rule)
+    - residual: residual more than z_threshold standard deviations from its
+      running mean, once a turbine has seen warmup readings
+    - rate: power changing faster than rate_threshold kW/s, by default
+      RAMP_FRACTION of the calculator's rated power per status update
+      interval (300 kW/s for 6 MW turbines reporting every 5 s)
+    """
+
+    def __init__(self, calculator, alerts=None, alpha=0.05, residual_threshold=200.0, z_threshold=4.0,
+                 rate_threshold=None, interval=5.0, warmup=20, min_std=10.0, capacity=1024):
+        self.calculator = calculator
+        self.alerts = alerts if alerts is not None else AlertStore()
+        self.alpha = alpha
+        self.residual_threshold = residual_threshold
+        self.z_threshold = z_threshold
+        if rate_threshold is None:
+            rate_threshold = RAMP_FRACTION * calculator.rated_power / interval
+        self.rate_threshold = rate_threshold
+        self.warmup = warmup
+        self.min_std = min_std
+
+        self._slots = {}  # (farm_id, turbine name) -> index into the arrays
+        self._keys = []
+        self.mean = np.zeros(capacity)
+        self.var = np.zeros(capacity)
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.last_power = np.zeros(capacity)
+        self.last_timestamp = np.zeros(capacity)
+        self._lock = threading.Lock()
+
+    def _grow(self, size):
+        capacity = len(self.mean)
+        while capacity < size:
+            capacity *= 2
+        for name in ('mean', 'var', 'count', 'last_power', 'last_timestamp'):
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def _slots_for(self, farm_id, names):
+        slots = self._slots
+        missing = [name for name in names if (farm_id, name) not in slots]
+        if missing:
+            if len(self._keys) + len(missing) > len(self.mean):
+                self._grow(len(self._keys) + len(missing))
+            for name in missing:
+                slots[(farm_id, name)] = len(self._keys)
+                self._keys.append((farm_id, name))
+        return np.fromiter((slots[(farm_id, name)] for name in names), dtype=np.int64, count=len(names))
+
+    def evaluate(self, data):
+        """Score one decrypted snapshot, update the statistics and return the new alerts"""
+        turbines = data['turbines']
+        names = list(turbines)
+        if not names:
+            return []
+        readings = turbines.values()
+        n = len(names)
+        wind_speed = np.fromiter((t['wind_speed'] for t in readings), dtype=np.float64, count=n)
+        temperature = np.fromiter((t['temperature'] for t in readings), dtype=np.float64, count=n)
+        pressure = np.fromiter((t['pressure'] for t in readings), dtype=np.float64, count=n)
+        actual = np.fromiter((t['power_output'] for t in readings), dtype=np.float64, count=n)
+        timestamp = float(data['timestamp'])
+        farm_id = data['turbine_id']
+
+        expected = np.round(self.calculator.estimate_power_output_array(wind_speed, temperature, pressure), 2)
+        residual = actual - expected
+
+        with self._lock:
+            idx = self._slots_for(farm_id, names)
+            mean = self.mean[idx]
+            var = self.var[idx]
+            count = self.count[idx]
+            seen = count > 0
+
+            std = np.maximum(np.sqrt(var), self.min_std)
+            z = (residual - mean) / std
+            dt = np.where(seen, timestamp - self.last_timestamp[idx], np.inf)
+            rate = np.where(dt > 0, (actual - self.last_power[idx]) / dt, 0.0)
+
+            deviation_flags = np.abs(residual) > self.residual_threshold
+            residual_flags = (count >= self.warmup) & (np.abs(z) > self.z_threshold)
+            rate_flags = seen & (np.abs(rate) > self.rate_threshold)
+
+            # EWMA update of residual mean and variance
+            diff = residual - mean
+            increment = self.alpha * diff
+            self.mean[idx] = np.where(seen, mean + increment, residual)
+            self.var[idx] = np.where(seen, (1 - self.alpha) * (var + diff * increment), 0.0)
+            self.count[idx] = count + 1
+            self.last_power[idx] = actual
+            self.last_timestamp[idx] = timestamp
+
+        new_alerts = []
+        for i in np.flatnonzero(deviation_flags | residual_flags | rate_flags):
+            name = names[i]
+            if deviation_flags[i]:
+                alert = self.alerts.add(
+                    farm_id, name, 'deviation', timestamp,
+                    f"Expected {expected[i]}kW from local weather variables but received {actual[i]}kW",
+                    expected=float(expected[i]), actual=float(actual[i]))
+                if alert:
+                    new_alerts.append(alert)
+            if residual_flags[i]:
+                alert = self.alerts.add(
+                    farm_id, name, 'residual', timestamp,
+                    f"Residual {residual[i]:.1f}kW is {z[i]:.1f} standard deviations from its recent mean",
+                    residual=float(residual[i]), z=float(z[i]))
+                if alert:
+                    new_alerts.append(alert)
+            if rate_flags[i]:
+                alert = self.alerts.add(
+                    farm_id, name, 'rate', timestamp,
+                    f"Power changing at {rate[i]:.1f}kW/s",
+                    rate=float(rate[i]))
+                if alert:
+                    new_alerts.append(alert)
+        return new_alerts
+
+    def statistics(self, farm_id, turbine):
+        """Current rolling statistics of one turbine, or None if it has not reported"""
+        slot = self._slots.get((farm_id, turbine))
+        if slot is None:
+            return None
+        return {
+            'residual_mean': float(self.mean[slot]),
+            'residual_std': float(np.sqrt(self.var[slot])),
+            'count': int(self.count[slot]),
+            'last_power': float(self.last_power[slot]),
+            'last_timestamp': float(self.last_timestamp[slot]),
+        }
@@ -0,0 +1,36 @@
+import random
+
+import numpy as np
+
+_rng = np.random.default_rng()
+
+
+def ground_sigma(rng=random):
+    """Transit time noise coefficient for a ground link, excellent to average atmospheric conditions"""
+    return rng.uniform(1e-9, 1e-8)
+
+
+def flip_bits(data: bytes, ber, rng=None):
+    """
+    Flip each bit of data independently with probability ber. Returns the
+    noisy bytes and the number of flipped bits. The flip count is drawn from
+    the binomial distribution and only those positions are touched, which is
+    equivalent to a per-bit coin toss but costs nothing on a clean link
+    """
+    rng = _rng if rng is None else rng
+    n_bits = len(data) * 8
+    flips = int(rng.binomial(n_bits, min(max(ber, 0.0), 1.0))) if n_bits else 0
+    if not flips:
+        return data, 0
+    positions = rng.choice(n_bits, flips, replace=False)
+    noisy = np.frombuffer(data, dtype=np.uint8).copy()
+    np.bitwise_xor.at(noisy, positions >> 3, (0x80 >> (positions & 7)).astype(np.uint8))
+    return noisy.tobytes(), flips
+
+
+def leo_delay(distance, rng=random):
+    """LEO transmission delay with jitter, in seconds"""
+    C = 299_792_458 / 1000.0*1000.0  # kilometres per millisecond
+    base_delay = distance / C # milliseconds
+    jitter = rng.uniform(2, 8) # milliseconds
+    return (base_delay + jitter) / 1000 # seconds
@@ -0,0 +1,229 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Unique per status update, shared by all copies of it sent over different paths
+MESSAGE_ID_HEADER = 'X-Message-ID'
+# "farm:epoch:seq" of a status update. seq counts a farm's snapshots and is kept
+# when one is resent from the outbox, which gets a new message id. The epoch is
+# the farm process' generation, so a restarted farm counting from 0 again is not
+# taken for a copy
+SEQUENCE_HEADER = 'X-Sequence'
+
+
+def format_sequence(farm_id, epoch, seq):
+    return f"{farm_id}:{epoch}:{seq}"
+
+
+def parse_sequence(value):
+    """(farm id, epoch, seq) from an X-Sequence header value, None if missing or malformed"""
+    try:
+        farm_id, epoch, seq = (int(part) for part in value.split(':'))
+    except (AttributeError, ValueError):
+        return None
+    return (farm_id, epoch, seq) if seq >= 0 else None
+
+
+def payload_sequence(data):
+    """(farm id, epoch, seq) of a decrypted status update, None if it predates sequence numbers"""
+    try:
+        return int(data['turbine_id']), int(data['epoch']), int(data['seq'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class RecentIds:
+    """
+    Bounded set of recently delivered message ids, evicting the least
+    recently added once capacity is reached. Used by the ground station to
+    keep the first intact copy of a message and drop the rest.
+    """
+
+    def __init__(self, capacity=100_000):
+        self.capacity = capacity
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, message_id):
+        return message_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, message_id):
+        """Record an id, returns False if it was already there"""
+        with self._lock:
+            if message_id in self._ids:
+                return False
+            self._ids[message_id] = None
+            if len(self._ids) > self.capacity:
+                self._ids.popitem(last=False)
+            return True
+
+
+class SharedIds:
+    """
+    RecentIds shared by several processes through a small SQLite table, for
+    ground station workers: copies of one message can reach different
+    workers, and only the first insert of an id succeeds. Ids older than
+    max_age seconds are pruned now and then.
+    """
+
+    def __init__(self, path, max_age=600.0, prune_every=1000):
+        self.path = path
+        self.max_age = max_age
+        self.prune_every = prune_every
+        self._adds = 0
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS delivered (id TEXT PRIMARY KEY, added REAL)')
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA synchronous=OFF')
+        return conn
+
+    def __contains__(self, message_id):
+        return self._conn().execute('SELECT 1 FROM delivered WHERE id = ?', (message_id,)).fetchone() is not None
+
+    def __len__(self):
+        return self._conn().execute('SELECT COUNT(*) FROM delivered').fetchone()[0]
+
+    def add(self, message_id):
+        """Record an id, returns False if it was already there (in any process)"""
+        conn = self._conn()
+        with conn:
+            added = conn.execute('INSERT OR IGNORE INTO delivered VALUES (?, ?)', (message_id, time.time())).rowcount == 1
+            self._adds += 1
+            if self._adds % self.prune_every == 0:
+                conn.execute('DELETE FROM delivered WHERE added < ?', (time.time() - self.max_age,))
+        return added
+
+
+class SequenceWindow:
+    """
+    Delivered sequence numbers per farm as a sliding bitmap over the last
+    `size` numbers up to the highest seen, bit i standing for highest - i, so
+    a farm costs size / 8 bytes however long it runs. A newer epoch starts the
+    farm's window over.
+
+    Numbers that fell out of the window, and numbers from an epoch older than
+    the farm's current one, are late: the bitmap can't tell them apart from a
+    copy. Every number added is also recorded in `ids` (RecentIds or
+    SharedIds) under its "farm:epoch:seq" key, and late ones are checked
+    against that instead. Without `ids` late numbers are refused as copies.
+
+    Per farm it also counts what arrived, the duplicates dropped, and the
+    numbers missing between the first and the highest seen. Those are lost
+    for good, or still on their way, whereas duplicates only cost bandwidth.
+    """
+
+    def __init__(self, size=16384, ids=None):
+        self.size = size
+        self.ids = ids
+        self._mask = (1 << size) - 1
+        self._farms = {}
+        self.missing = 0  # over all farms' current epochs
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._farms)
+
+    def _late(self, farm, epoch, seq):
+        """Whether the bitmap can't check seq, must be called with the lock held"""
+        return epoch < farm['epoch'] or (epoch == farm['epoch'] and farm['highest'] - seq >= self.size)
+
+    def seen(self, sequence):
+        """True if this (farm id, epoch, seq) was delivered already, counting it as a duplicate"""
+        farm_id, epoch, seq = sequence
+        with self._lock:
+            farm = self._farms.get(farm_id)
+            if farm is None or epoch > farm['epoch']:
+                return False
+            late = self._late(farm, epoch, seq)
+            offset = farm['highest'] - seq
+            if late and self.ids is None or not late and offset >= 0 and farm['bitmap'] >> offset & 1:
+                farm['duplicates'] += 1
+                return True
+        if self.ids is None or format_sequence(*sequence) not in self.ids:
+            return False
+        with self._lock:
+            farm['duplicates'] += 1
+        return True
+
+    def add(self, sequence):
+        """Record a delivered (farm id, epoch, seq), returns False if it was already there"""
+        farm_id, epoch, seq = sequence
+        # The id store decides for late numbers, and between workers sharing it
+        known = self.ids is not None and not self.ids.add(format_sequence(*sequence))
+        with self._lock:
+            farm = self._farms.get(farm_id)
+            if farm is None or epoch > farm['epoch']:
+                if known:
+                    return False
+                if farm is not None:
+                    self.missing -= farm['missing']
+                self._farms[farm_id] = {'epoch': epoch, 'first': seq, 'highest': seq, 'bitmap': 1,
+                                        'received': 1, 'duplicates': 0, 'late': 0, 'missing': 0}
+                return True
+            late = self._late(farm, epoch, seq)
+            offset = farm['highest'] - seq
+            if known or late and self.ids is None or not late and offset >= 0 and farm['bitmap'] >> offset & 1:
+                farm['duplicates'] += 1
+                return False
+            if late:
+                farm['late'] += 1
+                if epoch < farm['epoch']:
+                    return True
+            if offset < 0:
+                # Ahead of the window: slide it, everything skipped over is missing for now
+                farm['bitmap'] = ((farm['bitmap'] << -offset) | 1) & self._mask if -offset < self.size else 1
+                farm['highest'] = seq
+                self._count_missing(farm, -offset - 1)
+            else:
+                if not late:
+                    farm['bitmap'] |= 1 << offset
+                if seq < farm['first']:
+                    # Older than anything seen, e.g. outbox backlog sent after newer snapshots
+                    self._count_missing(farm, farm['first'] - seq - 1)
+                    farm['first'] = seq
+                else:
+                    self._count_missing(farm, -1)
+            farm['received'] += 1
+            return True
+
+    def _count_missing(self, farm, change):
+        change = max(change, -farm['missing'])
+        farm['missing'] += change
+        self.missing += change
+
+    def gaps(self, farm, limit):
+        """The most recent ranges [from, to] of missing numbers still in the window, newest first"""
+        gaps = []
+        end = None
+        for offset in range(min(self.size, farm['highest'] - farm['first'] + 1)):
+            received = farm['bitmap'] >> offset & 1
+            if not received and end is None:
+                end = farm['highest'] - offset
+            elif received and end is not None:
+                gaps.append([farm['highest'] - offset + 1, end])
+                end = None
+                if len(gaps) == limit:
+                    return gaps
+        if end is not None:
+            gaps.append([max(farm['first'], farm['highest'] - self.size + 1), end])
+        return gaps
+
+    def summary(self, max_gaps=10):
+        """Per farm id: epoch, first and highest number, received, duplicates, late, missing and recent gaps"""
+        with self._lock:
+            return {farm_id: {**{key: value for key, value in farm.items() if key != 'bitmap'},
+                              'gaps': self.gaps(farm, max_gaps)}
+                    for farm_id, farm in self._farms.items()}
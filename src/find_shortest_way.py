@@ -1,26 +1,40 @@
 import csv
 import heapq
 import math
+import time
 from math import radians, cos, sin, asin, sqrt, pi, erfc
 
+import numpy as np
+
+import link_budget
+import metrics
+from node_logging import get_logger
+
+logger = get_logger('routing')
+ROUTE_RECOMPUTES = metrics.counter('route_recomputes_total', 'Shortest path computations')
+ROUTE_SECONDS = metrics.histogram('route_compute_seconds', 'Time to compute a shortest path')
+
+# Source route chosen by the wind farm for one copy of a multipath message,
+# as comma separated device ids from the sender to the ground station
+ROUTE_HEADER = 'X-Route'
+
+
+def format_route(path):
+    return ','.join(str(device) for device in path)
+
+
+def parse_route(value):
+    """Device ids of a route header, or None if it is missing or malformed"""
+    if not value:
+        return None
+    try:
+        return [int(device) for device in value.split(',')]
+    except ValueError:
+        return None
+
 def calculate_link_quality(distance, is_ground_transmission=False):
-    # Constants (using reasonable approximations)
-    f = 2.4e8 # frequency (2.4GHz)
-    C = 3e8 # speed of light [m/s^2]
-    Pt = 50 # transmit power [50W used by Starlink to overcome high attenuation wrt distance]
-    Pr = Pt * (C/(4 * math.pi * distance * 1000 * f))**2 # receiver power using FSPL model
-    Pt = 10*math.log10(Pt) + 30
-    Pr = 10*math.log10(Pr) + 30
-    T = 290 # temperature (K) [Average temperature in thermosphere (85km - 690km) at LEO orbit (approx 550km) is roughly 290K]
-    k = 1.38e-23 # Boltzmann constant
-    B = 10e6 # bandwidth (10 MHz)
-    Nt = 10*math.log10(T*k*B) + 30 # AWGN for ambient temperature at receiver
-    sigma = 1e-8 if is_ground_transmission else 1e-9 # Coeficient for transit time noise, influenced by atmospheric conditions
-    Nphi = 10*math.log10(1+(2*math.pi*f*sigma)) # Transit time noise
-    SNR = Pr - (Nt + Nphi) # Signal to Noise Ratio
-    quality = 2 / max(math.erfc(SNR/math.sqrt(2)), 1e-100) # Inverse of Bit Error Rate, formula valid for BPKS/QPKS modulation
-
-    return quality
+    """Inverse bit error rate of a link, from the shared link budget tables"""
+    return link_budget.quality(distance, ground=is_ground_transmission)
 
 
 def haversine_alt_dist(pos1, pos2):
@@ -39,47 +53,59 @@ def haversine_alt_dist(pos1, pos2):
     return true_dist
 
 
+def pairwise_distances(positions):
+    """Matrix of haversine_alt_dist between every pair of positions"""
+    lon = np.radians([float(pos['long']) for pos in positions])
+    lat = np.radians([float(pos['lat']) for pos in positions])
+    alt = np.array([float(pos['alt']) for pos in positions])
+    dlon = lon[None, :] - lon[:, None]
+    dlat = lat[None, :] - lat[:, None]
+    a = np.sin(dlat/2)**2 + np.cos(lat[:, None]) * np.cos(lat[None, :]) * np.sin(dlon/2)**2
+    haversine_dist = 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0))) * 6371
+    return np.sqrt(haversine_dist**2 + (alt[:, None] - alt[None, :])**2)
+
+
 def find_shortest_path(positions_list, start_node, end_node, broken_devices=None):
-    if broken_devices is None:
-        broken_devices = set()
-    else:
-        broken_devices = set(broken_devices)
+    started = time.perf_counter()
+    ROUTE_RECOMPUTES.inc()
+    try:
+        return _find_shortest_path(positions_list, start_node, end_node, broken_devices)
+    finally:
+        ROUTE_SECONDS.observe(time.perf_counter() - started)
+
 
-    if start_node in broken_devices or end_node in broken_devices:
-        print("Error: Start or end node is in broken devices list")
-        return
+def _find_shortest_path(positions_list, start_node, end_node, broken_devices=None):
+    # Device ids are compared as strings, like the keys of positions below
+    broken_devices = {str(device) for device in broken_devices or ()}
+
+    if str(start_node) in broken_devices or str(end_node) in broken_devices:
+        logger.error("Start or end node is in broken devices list")
+        return None, None
 
     # Convert positions list to dictionary
     positions = {str(pos['id']): pos for pos in positions_list}
 
-    graph = {}
-    # Build graph based on positions and rules
-    for dev1 in positions:
-        for dev2 in positions:
-            if dev1 != dev2 and dev1 not in broken_devices and dev2 not in broken_devices:
-                pos1 = positions[dev1]
-                pos2 = positions[dev2]
-                distance = haversine_alt_dist(pos1, pos2)
-
-                # Apply connection rules
-                can_connect = True
-                # Rule 1: 0 & -1 can't connect directly
-                if (dev1 in ['-1', '0'] and dev2 in ['-1', '0']):
-                    can_connect = False
-
-
-                if can_connect:
-                    # Calculate link quality and use it to modify the weight
-                    is_ground_transmission = dev1 in ['-1', '0'] or dev2 in ['-1', '0']
-                    link_quality = calculate_link_quality(distance, is_ground_transmission)
-                    # Weight is now a combination of distance and signal quality
-                    # We use distance/link_quality so that:
-                    # - Higher distances increase the weight
-                    # - Better signal quality decreases the weight
-                    weight = distance / link_quality
-
-                    graph.setdefault(dev1, []).append((dev2, weight))
-                    graph.setdefault(dev2, []).append((dev1, weight))
+    # Build graph based on positions and rules, with all link weights computed as arrays
+    devices = [dev for dev in positions if dev not in broken_devices]
+    distances = pairwise_distances([positions[dev] for dev in devices])
+    ground = np.array([dev in ['-1', '0'] for dev in devices])
+    # Rule 1: 0 & -1 can't connect directly
+    can_connect = ~(ground[:, None] & ground[None, :])
+    np.fill_diagonal(can_connect, False)
+    # Calculate link quality and use it to modify the weight. Weight is
+    # distance/link_quality so that:
+    # - Higher distances increase the weight
+    # - Better signal quality decreases the weight
+    # Diagonal distances are 0, set to 1 km only to keep the lookups finite
+    lookup = np.where(distances > 0, distances, 1.0)
+    is_ground_transmission = ground[:, None] | ground[None, :]
+    link_quality = np.where(is_ground_transmission,
+                            link_budget.quality(lookup, ground=True), link_budget.quality(lookup, ground=False))
+    weights = (distances / link_quality).tolist()
+    graph = {
+        dev1: [(devices[j], weights[i][j]) for j in np.flatnonzero(can_connect[i]).tolist()]
+        for i, dev1 in enumerate(devices)
+    }
 
     # Rest of the pathfinding algorithm remains the same
     queue = [(0, str(start_node), [])]
@@ -90,7 +116,7 @@ def find_shortest_path(positions_list, start_node, end_node, broken_devices=None
             continue
         path = path + [node]
         if node == str(end_node):
-            print("Path:", " -> ".join(path))
+            logger.debug("Path: %s", " -> ".join(path))
             dist = haversine_alt_dist(positions[path[0]], positions[path[1]])
             return [int(node) for node in path], dist
         visited.add(node)
@@ -99,4 +125,23 @@ def find_shortest_path(positions_list, start_node, end_node, broken_devices=None
                 heapq.heappush(queue, (cost + weight, neighbor, path))
 
     # no viable path
-    return None, None
\ No newline at end of file
+    return None, None
+
+
+def find_disjoint_paths(positions_list, start_node, end_node, k, broken_devices=None):
+    """
+    Up to k node-disjoint paths from start_node to end_node, shortest first,
+    as (path, first hop distance) pairs. Paths are found greedily: the
+    intermediate nodes of each path are excluded from the next search. That
+    keeps the first path the true shortest one, at the cost of sometimes
+    finding fewer or longer alternatives than an optimal (Suurballe) search.
+    """
+    excluded = {str(device) for device in broken_devices or ()}
+    paths = []
+    for _ in range(k):
+        path, distance = find_shortest_path(positions_list, start_node, end_node, excluded)
+        if path is None:
+            break
+        paths.append((path, distance))
+        excluded.update(str(node) for node in path[1:-1])
+    return paths
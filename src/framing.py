@@ -0,0 +1,173 @@
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import codec
+import metrics
+from dedup import RecentIds, MESSAGE_ID_HEADER
+from node_logging import get_logger
+
+logger = get_logger('framing')
+FRAGMENTS_SENT = metrics.counter('fragments_sent_total', 'Fragments sent, including retransmissions')
+FRAGMENTS_RETRANSMITTED = metrics.counter('fragments_retransmitted_total', 'Fragments resent after a NACK')
+FRAGMENTS_REJECTED = metrics.counter('fragments_rejected_total', 'Received fragments that failed their CRC')
+SEND_GIVEUPS = metrics.counter('fragment_send_giveups_total', 'Messages with fragments still missing after every retransmission round')
+REASSEMBLED = metrics.counter('messages_reassembled_total', 'Messages reassembled from fragments')
+REASSEMBLY_EVICTED = metrics.counter('reassembly_evicted_total', 'Partially received messages dropped from the reassembly buffer')
+REASSEMBLY_PENDING = metrics.gauge('reassembly_pending', 'Partially received messages in the reassembly buffer')
+
+# A framed message is sent with these headers next to X-Message-ID. The body
+# is a run of fixed size FEC encoded fragments; retransmissions carry only
+# the fragments the receiver NACKed.
+FRAGMENT_SIZE_HEADER = 'X-Fragment-Size'
+FRAGMENT_COUNT_HEADER = 'X-Fragment-Count'
+
+FRAGMENT_SIZE = 256  # payload bytes per fragment, one RSA block
+MAX_ROUNDS = 4  # attempts per hop, the first send included
+
+# index, fragment count, payload length; followed by the payload zero padded
+# to the fragment size and a CRC32 over message id, header and payload
+HEADER = struct.Struct('!HHH')
+CRC = struct.Struct('!I')
+
+
+def encoded_size(fragment_size, fec=codec.DEFAULT_FEC):
+    """Bytes of one encoded fragment"""
+    return len(codec.encode(bytes(HEADER.size + fragment_size + CRC.size), fec))
+
+
+def _crc(message_id, raw):
+    return zlib.crc32(raw, zlib.crc32(message_id.encode()))
+
+
+def fragment(message_id, data, fragment_size=FRAGMENT_SIZE, fec=codec.DEFAULT_FEC):
+    """Split data into FEC encoded fragments, in index order"""
+    count = max(1, -(-len(data) // fragment_size))
+    fragments = []
+    for index in range(count):
+        payload = data[index * fragment_size:(index + 1) * fragment_size]
+        raw = HEADER.pack(index, count, len(payload)) + payload.ljust(fragment_size, b'\0')
+        fragments.append(codec.encode(raw + CRC.pack(_crc(message_id, raw)), fec))
+    return fragments
+
+
+def unpack(message_id, encoded, fragment_size=FRAGMENT_SIZE, fec=codec.DEFAULT_FEC):
+    """(index, count, payload) of an encoded fragment, or None if it is still corrupt after FEC"""
+    raw = codec.decode(encoded, fec)[:HEADER.size + fragment_size + CRC.size]
+    if len(raw) != HEADER.size + fragment_size + CRC.size:
+        return None
+    body, (crc,) = raw[:-CRC.size], CRC.unpack(raw[-CRC.size:])
+    if _crc(message_id, body) != crc:
+        return None
+    index, count, length = HEADER.unpack_from(body)
+    if index >= count or length > fragment_size:
+        return None
+    return index, count, body[HEADER.size:HEADER.size + length]
+
+
+def is_framed(headers):
+    """Whether a request carries the headers of a framed message, all of them well formed"""
+    try:
+        return bool(headers[MESSAGE_ID_HEADER]) and int(headers[FRAGMENT_SIZE_HEADER]) > 0 \
+            and int(headers[FRAGMENT_COUNT_HEADER]) > 0
+    except (KeyError, ValueError):
+        return False
+
+
+def nacks(response, count):
+    """Fragment indices the receiver asked for again; receivers that don't frame never NACK"""
+    try:
+        missing = response.json().get('nack', [])
+    except (ValueError, AttributeError):
+        return []
+    return [index for index in missing if isinstance(index, int) and 0 <= index < count]
+
+
+def send(post, fragments, rounds=MAX_ROUNDS):
+    """
+    Selective repeat over one hop. post(body) sends the concatenated encoded
+    fragments and returns the receiver's response, which NACKs the fragments
+    it is still missing; only those are sent again. Returns the indices still
+    missing after `rounds` attempts, empty once the hop has the whole message.
+    """
+    pending = list(range(len(fragments)))
+    for attempt in range(rounds):
+        if attempt:
+            FRAGMENTS_RETRANSMITTED.inc(len(pending))
+        FRAGMENTS_SENT.inc(len(pending))
+        pending = nacks(post(b''.join(fragments[index] for index in pending)), len(fragments))
+        if not pending:
+            return []
+    SEND_GIVEUPS.inc()
+    return pending
+
+
+class Reassembler:
+    """
+    Bounded buffer of partially received framed messages, keyed by message
+    id. At most max_messages are held; the oldest is dropped to make room and
+    any older than max_age seconds are dropped as abandoned. Ids of completed
+    messages are remembered so a late retransmission does not start over.
+    """
+
+    def __init__(self, max_messages=256, max_age=30.0, clock=time.monotonic):
+        self.max_messages = max_messages
+        self.max_age = max_age
+        self.clock = clock
+        self._pending = OrderedDict()
+        self._completed = RecentIds(capacity=4 * max_messages)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _evict(self, now):
+        while self._pending:
+            message_id, entry = next(iter(self._pending.items()))
+            if len(self._pending) < self.max_messages and now - entry['created'] <= self.max_age:
+                break
+            del self._pending[message_id]
+            REASSEMBLY_EVICTED.inc()
+            logger.warning("Dropped message %s with %d of %d fragments", message_id, len(entry['fragments']), entry['count'])
+
+    def receive(self, headers, body):
+        """
+        Check the fragments of one framed request. Returns (missing, payload):
+        the indices to NACK and, once every fragment has arrived, the
+        reassembled payload. A message that was already completed returns
+        ([], None).
+        """
+        message_id = headers[MESSAGE_ID_HEADER]
+        fragment_size = int(headers[FRAGMENT_SIZE_HEADER])
+        count = int(headers[FRAGMENT_COUNT_HEADER])
+        fec = headers.get(codec.FEC_HEADER, codec.DEFAULT_FEC)
+        step = encoded_size(fragment_size, fec)
+
+        # FEC decoding and CRC checks run outside the lock
+        received = {}
+        for offset in range(0, len(body) - step + 1, step):
+            parsed = unpack(message_id, body[offset:offset + step], fragment_size, fec)
+            if parsed is None or parsed[1] != count:
+                FRAGMENTS_REJECTED.inc()
+                continue
+            received[parsed[0]] = parsed[2]
+
+        with self._lock:
+            if message_id in self._completed:
+                return [], None
+            entry = self._pending.get(message_id)
+            if entry is None:
+                self._evict(self.clock())
+                entry = self._pending[message_id] = {'count': count, 'fragments': {}, 'created': self.clock()}
+            entry['fragments'].update(received)
+            fragments = entry['fragments']
+            if len(fragments) < count:
+                REASSEMBLY_PENDING.set(len(self._pending))
+                return [index for index in range(count) if index not in fragments], None
+            del self._pending[message_id]
+            self._completed.add(message_id)
+            REASSEMBLY_PENDING.set(len(self._pending))
+        REASSEMBLED.inc()
+        return [], b''.join(fragments[index] for index in range(count))
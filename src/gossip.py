@@ -0,0 +1,297 @@
+import math
+import random
+import threading
+import time
+
+from flask import jsonify, request
+
+import metrics
+from node_logging import get_logger
+
+logger = get_logger('gossip')
+ROUNDS = metrics.counter('gossip_rounds_total', 'Gossip rounds run')
+EXCHANGES = metrics.counter('gossip_exchanges_total', 'Gossip requests sent to peers')
+EXCHANGE_FAILURES = metrics.counter('gossip_exchange_failures_total', 'Gossip requests that got no answer')
+ENTRIES_SENT = metrics.counter('gossip_entries_sent_total', 'Membership entries sent in gossip requests and responses')
+UPDATES_APPLIED = metrics.counter('gossip_updates_applied_total', "Received membership entries that changed this node's view")
+FAILURES_DETECTED = metrics.counter('gossip_failures_detected_total', 'Members this node declared down itself')
+MEMBERS_ALIVE = metrics.gauge('gossip_members_alive', 'Members this node believes are up, itself included')
+
+GOSSIP_PATH = '/gossip'
+
+# A member's state is versioned by (generation, incarnation, down). The
+# generation is its process start time, so a restarted node supersedes what
+# is known about its previous run; the incarnation is bumped only by the
+# member itself, to refute a report that it is down. For equal generation and
+# incarnation a down report wins, so it spreads until refuted.
+ALIVE, DOWN = 0, 1
+
+FANOUT = 3  # peers contacted per round
+MAX_ENTRIES = 16  # membership entries per request or response, besides the sender's own
+RETRANSMIT_FACTOR = 3  # a change is sent about RETRANSMIT_FACTOR * log2(N) times, then only to joiners
+
+
+def generation(started):
+    """Generation number for a process started at `started` (seconds since the epoch)"""
+    return int(started * 1000)
+
+
+class Gossip:
+    """
+    Membership and failure dissemination by infection-style gossip. Every
+    interval the node exchanges deltas with `fanout` random live peers over
+    POST /gossip: each side sends the entries that changed recently, and a
+    change stops being resent once it has gone out about
+    RETRANSMIT_FACTOR * log2(N) times. That reaches every member in O(log N)
+    rounds with at most fanout * (MAX_ENTRIES + 1) entries per request. A
+    peer that does not know the sender gets the full view in its response,
+    which is how joiners catch up.
+
+    A peer that does not answer an exchange is declared down, as is one the
+    node failed to forward to (report_down). Members that have never gossiped,
+    such as devices found by a scan that run an older version or belong to
+    another network, are only ever declared down by report_down.
+
+    If routing_table is given, it is kept in step with the view: members come
+    up with set() and go down with discard().
+    """
+
+    def __init__(self, node_id, host, generation, routing_table=None, interval=1.0, fanout=FANOUT,
+                 max_entries=MAX_ENTRIES, forget_after=120.0, rescan=None, rescan_interval=60.0,
+                 post=None, clock=time.monotonic):
+        self.node_id = node_id
+        self.interval = interval
+        self.fanout = fanout
+        self.max_entries = max_entries
+        self.forget_after = forget_after
+        self.rescan = rescan
+        self.rescan_interval = rescan_interval
+        self.routing_table = routing_table
+        self.post = post or self.http_post
+        self.clock = clock
+        self._lock = threading.Lock()
+        # member id -> {'version': (generation, incarnation, status), 'host': (ip, port), 'sends': n, 'changed': t}
+        self.members = {}
+        self._no_gossip = set()  # peers that answered /gossip with an error, they run an older version
+        self._last_rescan = clock()
+        self._set(node_id, (generation, 0, ALIVE), tuple(host))
+
+    def __len__(self):
+        return len(self.members)
+
+    # Local view
+
+    def _retransmits(self):
+        return math.ceil(RETRANSMIT_FACTOR * math.log2(len(self.members) + 1))
+
+    def _set(self, member_id, version, host):
+        """Record a newer version of a member and queue it for dissemination; call with the lock held"""
+        self.members[member_id] = {'version': version, 'host': host, 'sends': self._retransmits(), 'changed': self.clock()}
+
+    def _alive(self):
+        """Number of members believed up, this node included; call with the lock held"""
+        return sum(1 for member in self.members.values() if member['version'][2] == ALIVE)
+
+    def _apply(self, changes, alive):
+        """
+        Mirror view changes [(member id, status, host)] into the routing table
+        and publish the alive count taken with them, outside the lock
+        """
+        if self.routing_table is not None:
+            for member_id, status, host in changes:
+                if member_id == self.node_id:
+                    continue
+                if status == ALIVE:
+                    self.routing_table.set(member_id, host)
+                elif self.routing_table.discard(member_id):
+                    logger.info("Removed device %s from routing table", member_id)
+        MEMBERS_ALIVE.set(alive)
+
+    def seed(self, devices):
+        """
+        Add devices found by a network scan that are not in the view yet.
+        They get generation 0, so the first entry they gossip themselves
+        replaces it.
+        """
+        changes = []
+        with self._lock:
+            for device_id, host in devices.items():
+                if device_id not in self.members:
+                    self.members[device_id] = {'version': (0, 0, ALIVE), 'host': tuple(host), 'sends': 0, 'changed': self.clock()}
+                    changes.append((device_id, ALIVE, tuple(host)))
+            alive = self._alive()
+        self._apply(changes, alive)
+
+    def report_down(self, member_id):
+        """Declare a member down, e.g. after failing to forward to it, and spread that"""
+        with self._lock:
+            member = self.members.get(member_id)
+            known = member is not None and member_id != self.node_id and member['version'][2] == ALIVE
+            if known:
+                generation, incarnation, _ = member['version']
+                self._set(member_id, (generation, incarnation, DOWN), member['host'])
+            alive = self._alive()
+        if known:
+            FAILURES_DETECTED.inc()
+            logger.info("Device %s is down", member_id)
+        # The routing table may have it even if the view doesn't, e.g. straight after a scan
+        self._apply([(member_id, DOWN, None)], alive)
+
+    def alive(self):
+        """Ids of the members believed up, this node excluded"""
+        with self._lock:
+            return [member_id for member_id, member in self.members.items()
+                    if member_id != self.node_id and member['version'][2] == ALIVE]
+
+    # Wire format: [id, ip, port, generation, incarnation, status]
+
+    def _entry(self, member_id):
+        member = self.members[member_id]
+        return [member_id, *member['host'], *member['version']]
+
+    def _delta(self, full=False):
+        """Entries to send: our own, then the most recently queued changes; call with the lock held"""
+        if full:
+            return [self._entry(member_id) for member_id in self.members]
+        pending = sorted((member for member in self.members.items() if member[1]['sends'] > 0 and member[0] != self.node_id),
+                         key=lambda member: member[1]['sends'], reverse=True)[:self.max_entries]
+        for _, member in pending:
+            member['sends'] -= 1
+        return [self._entry(self.node_id)] + [self._entry(member_id) for member_id, _ in pending]
+
+    def merge(self, entries, sender_ip=None):
+        """
+        Apply received entries, newest version wins. The sender's own entry
+        comes first, and is readdressed to the IP the request came from, as the
+        sender only knows the address it listens on. Returns True if the
+        sender was new to this node.
+        """
+        changes = []
+        sender_new = False
+        with self._lock:
+            for position, entry in enumerate(entries):
+                try:
+                    member_id, ip, port, generation, incarnation, status = entry
+                    member_id, host, version = int(member_id), (str(ip), int(port)), (int(generation), int(incarnation), int(status))
+                except (TypeError, ValueError):
+                    continue
+                direct = position == 0 and sender_ip is not None
+                if direct:
+                    host = (sender_ip, host[1])
+                    # A joiner, or a member that restarted or came back, gets the full view. One we
+                    # only know from a scan (generation 0) did a scan of its own
+                    known = self.members.get(member_id)
+                    sender_new = (known is None or known['version'][2] == DOWN or
+                                  0 < known['version'][0] < version[0])
+                    self._no_gossip.discard(member_id)
+                if member_id == self.node_id:
+                    own = self.members[member_id]['version']
+                    if version[2] == DOWN and version[:2] >= own[:2]:
+                        # Refute: we are up, and a higher incarnation supersedes the report
+                        self._set(member_id, (own[0], version[1] + 1, ALIVE), self.members[member_id]['host'])
+                        logger.info("Refuted a report that this node is down")
+                    continue
+                member = self.members.get(member_id)
+                # Relayed copies of what we already know are ignored; the sender's own
+                # entry can still readdress it
+                if member is not None and (member['version'] > version or
+                                           (member['version'] == version and (not direct or member['host'] == host))):
+                    continue
+                self._set(member_id, version, host)
+                if member is not None and member['version'][0] == 0 and member['host'] == host and version[2] == ALIVE:
+                    # First word from a device we found by scanning: the others found it too
+                    self.members[member_id]['sends'] = 0
+                    continue
+                changes.append((member_id, version[2], host))
+            alive = self._alive()
+        UPDATES_APPLIED.inc(len(changes))
+        self._apply(changes, alive)
+        return sender_new
+
+    def handle(self, payload, sender_ip):
+        """Body of the response to a POST /gossip request, payload being a dict"""
+        sender_new = self.merge(payload.get('entries', []), sender_ip)
+        with self._lock:
+            entries = self._delta(full=sender_new)
+        ENTRIES_SENT.inc(len(entries))
+        return {'entries': entries}
+
+    # Rounds
+
+    def http_post(self, host, payload):
+        import requests
+        response = requests.post(f"http://{host[0]}:{host[1]}{GOSSIP_PATH}", json=payload, timeout=1,
+                                 proxies={"http": None, "https": None})
+        response.raise_for_status()
+        return response.json()
+
+    def exchange(self, member_id):
+        """Push our delta to one peer and merge its delta from the response"""
+        # Rounds only start once the node is serving, so requests stays off the import path
+        import requests
+        with self._lock:
+            member = self.members.get(member_id)
+            if member is None:
+                # Forgotten by round() since it was picked
+                return
+            host = member['host']
+            entries = self._delta()
+        EXCHANGES.inc()
+        ENTRIES_SENT.inc(len(entries))
+        try:
+            response = self.post(host, {'entries': entries})
+        except requests.exceptions.HTTPError:
+            # Reachable, but it does not gossip
+            with self._lock:
+                self._no_gossip.add(member_id)
+            return
+        except (requests.exceptions.RequestException, ValueError):
+            EXCHANGE_FAILURES.inc()
+            with self._lock:
+                gossips = self.members.get(member_id, {'version': (0,)})['version'][0] > 0
+            if gossips:
+                self.report_down(member_id)
+            return
+        if isinstance(response, dict):
+            self.merge(response.get('entries', []), sender_ip=host[0])
+
+    def round(self):
+        """One gossip round: exchange with up to fanout random live peers, drop old tombstones"""
+        ROUNDS.inc()
+        now = self.clock()
+        with self._lock:
+            for member_id in [member_id for member_id, member in self.members.items()
+                              if member['version'][2] == DOWN and now - member['changed'] > self.forget_after]:
+                del self.members[member_id]
+            peers = [member_id for member_id, member in self.members.items()
+                     if member_id != self.node_id and member['version'][2] == ALIVE and member_id not in self._no_gossip]
+        if not peers and self.rescan is not None and now - self._last_rescan >= self.rescan_interval:
+            # Nobody to gossip with: cut off, or every peer left. Look for them the slow way
+            self._last_rescan = now
+            self.seed(self.rescan())
+            return
+        for member_id in random.sample(peers, min(self.fanout, len(peers))):
+            self.exchange(member_id)
+
+    def run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self.round()
+            except Exception:
+                logger.exception("Gossip round failed")
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+
+def register_gossip_endpoint(app, gossip):
+    """Expose POST /gossip on a node's Flask app"""
+    @app.route(GOSSIP_PATH, methods=['POST'])
+    def receive_gossip():
+        payload = request.get_json(force=True, silent=True)
+        if not isinstance(payload, dict) or not isinstance(payload.get('entries', []), list):
+            return jsonify({"message": "Expected a JSON object with a list of entries"}), 400
+        return jsonify(gossip.handle(payload, request.remote_addr))
@@ -1,19 +1,59 @@
 import time
 import json
-import rsa
+import functools
 import threading
 import os
-import csv
+import argparse
+import multiprocessing
+import signal
+import socket
 
 from flask import Flask, request, jsonify
+from werkzeug.serving import make_server
 import update_satellite_positions
 import network_manager
+import startup
+import storage
+import tracing
+import codec
+import metrics
+import profiling
+from node_logging import get_logger
 from wind_turbine_calculator import WindTurbineCalculator
+from anomaly import AnomalyEngine
+from dedup import RecentIds, SharedIds, SequenceWindow, MESSAGE_ID_HEADER, SEQUENCE_HEADER, parse_sequence, payload_sequence
+import framing
+import gossip
+import priority
+
+logger = get_logger('ground_station')
+MESSAGES_RECEIVED = metrics.counter('messages_received_total', 'Messages received from the network')
+MESSAGES_DELIVERED = metrics.counter('messages_delivered_total', 'Messages decoded, decrypted and stored')
+DUPLICATES = metrics.counter('duplicate_messages_total', 'Copies of already delivered messages that were dropped')
+SEQUENCE_DUPLICATES = metrics.counter('sequence_duplicates_total', 'Resent snapshots dropped by sequence number before decoding')
+SEQUENCE_MISSING = metrics.gauge('sequence_missing', 'Sequence numbers not received between the first and highest per farm')
+DECRYPT_FAILURES = metrics.counter('decrypt_failures_total', 'Messages that could not be decrypted')
+ROWS_STORED = metrics.counter('rows_stored_total', 'Turbine readings queued for storage')
+ALERTS_RAISED = metrics.counter('alerts_raised_total', 'Anomaly alerts raised')
+END_TO_END_SECONDS = metrics.histogram('end_to_end_latency_seconds', 'Receive time minus the payload timestamp')
+CLASS_END_TO_END_SECONDS = {traffic_class: metrics.histogram(f'end_to_end_latency_{traffic_class}_seconds',
+                                                             f'Receive time minus the payload timestamp of {traffic_class} traffic')
+                            for traffic_class in priority.PRIORITIES}
+RECEIVE_SECONDS = metrics.histogram('receive_handler_seconds', 'Time spent handling one received message')
 
 
 class GroundStationNode:
-    def __init__(self):
-        self.name = "Ground Station"
+    """
+    The ground station. With worker set, this is one of several processes
+    serving port 33999 together (see run_workers): it writes its own storage
+    shard, shares delivered message ids with the others, and only worker 0
+    announces itself and runs gossip rounds. Anomaly scoring, alerts, traces
+    and metrics cover the messages that worker received.
+    """
+
+    def __init__(self, worker=None, generation=None):
+        self.worker = worker
+        self.name = "Ground Station" if worker is None else f"Ground Station worker {worker}"
         self.gs_id = -1  # ground station always has ID -1
         self.gs_host = ('0.0.0.0', 33999)  # ground station always uses port 33999
 
@@ -24,27 +64,37 @@ class GroundStationNode:
         self.altitude = positions[0]['alt']
 
         self.turbine_calc = WindTurbineCalculator()
-        self.private_key = self.load_rsa_key(private=True)
-
-        # # Announce presence to network
-        network_manager.scan_network(device_id=self.gs_id, device_port=self.gs_host[1])
+        self.anomalies = AnomalyEngine(self.turbine_calc)
+        self.trace_stats = tracing.TraceStats()
+        # Ids of delivered messages, multipath copies after the first intact one are dropped.
+        # Copies can reach different workers, so workers share them
+        if worker is None:
+            self.delivered_ids = RecentIds()
+        else:
+            self.delivered_ids = SharedIds(os.path.join(storage.DATA_DIR, 'delivered_ids.sqlite'))
+        # Delivered sequence numbers per farm. They catch resends of a delivered snapshot, which carry a
+        # new message id, and count the numbers that never arrived. The numbers are kept in delivered_ids
+        # too, for the ones that fell out of the window and for workers to share, the window and its gap
+        # counts are per worker
+        self.sequences = SequenceWindow(ids=self.delivered_ids)
+        # Fragments of framed messages waiting for the rest, damaged ones are NACKed
+        self.reassembly = framing.Reassembler()
+        # Membership view shared with the network, the ground station does not route.
+        # Workers answer /gossip as one node, so they share the generation
+        if generation is None:
+            generation = gossip.generation(startup.STARTED)
+        self.gossip = gossip.Gossip(self.gs_id, self.gs_host, generation,
+                                    rescan=lambda: network_manager.scan_network(device_id=self.gs_id, device_port=self.gs_host[1]))
 
         self.app = Flask(self.name)
 
-        # Initialize CSV file (erase if exists)
-        data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
-        if not os.path.exists(data_dir):
-            os.makedirs(data_dir)
-        self.csv_file_path = os.path.join(data_dir, 'turbine_data.csv')
-        if os.path.exists(self.csv_file_path):
-            os.remove(self.csv_file_path)
-            print(f"Erased existing CSV file at {self.csv_file_path}")
-        # Create the CSV file with headers
-        with open(self.csv_file_path, mode='w', newline='') as csvfile:
-            fieldnames = ['timestamp', 'turbine_id', 'turbine', 'temperature', 'pressure', 'wind_speed', 'power_output']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            print(f"Created new CSV file at {self.csv_file_path}")
+        # Telemetry is batched to disk by a background writer and kept across restarts,
+        # each worker writes its own shard
+        if worker is None:
+            self.store = storage.TelemetryStore().start()
+        else:
+            self.store = storage.TelemetryStore(storage.shard_path(storage.DEFAULT_DB_PATH, worker)).start()
+        logger.info("Storing turbine data in %s", self.store.db_path)
 
         @self.app.route('/', methods=['GET'])
         def get_device():
@@ -56,60 +106,125 @@ class GroundStationNode:
 
         @self.app.route('/', methods=['POST'])
         def receive_data():
+            started = time.perf_counter()
+            MESSAGES_RECEIVED.inc()
+            message_id = request.headers.get(MESSAGE_ID_HEADER)
+            if message_id is not None and message_id in self.delivered_ids:
+                DUPLICATES.inc()
+                return jsonify({"message": "Duplicate of a delivered message"})
+            sequence = parse_sequence(request.headers.get(SEQUENCE_HEADER))
+            if sequence is not None and self.sequences.seen(sequence):
+                # A resend of a snapshot whose response was lost, dropped before decoding and decryption
+                DUPLICATES.inc()
+                SEQUENCE_DUPLICATES.inc()
+                return jsonify({"message": "Duplicate of a delivered message", "nack": []})
+            fec = request.headers.get(codec.FEC_HEADER, codec.DEFAULT_FEC)
+            if fec not in codec.FEC_SCHEMES:
+                logger.warning("Unknown FEC scheme %s", fec)
+                return jsonify({"message": f"Unknown FEC scheme {fec}"}), 400
+            if framing.FRAGMENT_COUNT_HEADER in request.headers and not framing.is_framed(request.headers):
+                return jsonify({"message": "Malformed fragment headers"}), 400
+            span = tracing.continue_trace(self.gs_id, request.headers)
             noisy_data = request.data
-            corrected_data = self.hamming_decode_message(noisy_data)
-            decrypted_data = self.decrypt_rsa_turbine_data(corrected_data)
+            if framing.FRAGMENT_COUNT_HEADER in request.headers:
+                # Fragments are FEC decoded and CRC checked, so corrupted data never reaches decryption
+                with tracing.stage(span, 'decode'):
+                    missing, corrected_data = self.reassembly.receive(request.headers, noisy_data)
+                if corrected_data is None:
+                    if not missing:
+                        DUPLICATES.inc()
+                        return jsonify({"message": "Duplicate of a delivered message", "nack": []})
+                    return jsonify({"message": "Fragments received at Ground Station", "nack": missing})
+            else:
+                with tracing.stage(span, 'decode'):
+                    corrected_data = self.fec_decode_message(noisy_data, fec)
+            with tracing.stage(span, 'decrypt'):
+                decrypted_data = self.decrypt_rsa_turbine_data(corrected_data)
 
             if decrypted_data is None:
-                print("Decryption failed or message is corrupted")
+                if span is not None:
+                    self.trace_stats.record(span.finish(), delivered=False)
+                DECRYPT_FAILURES.inc()
+                logger.warning("Decryption failed or message is corrupted")
                 return jsonify({"message":"Decryption failed or message is corrupted"})
 
+            # Another copy may have been decoded concurrently, only the first is kept
+            if message_id is not None and not self.delivered_ids.add(message_id):
+                DUPLICATES.inc()
+                return jsonify({"message": "Duplicate of a delivered message"})
+            sequence = payload_sequence(decrypted_data)
+            if sequence is not None and not self.add_sequence(sequence):
+                DUPLICATES.inc()
+                SEQUENCE_DUPLICATES.inc()
+                return jsonify({"message": "Duplicate of a delivered message"})
+
             end_to_end_delay = time.time() - decrypted_data['timestamp']
-            print(f"End-to-end delay: {end_to_end_delay:.4f}s")
-            print(f"Data received at Ground Station")
-            print(f"\033[92mData: {decrypted_data.keys()}\033[0m")
-
-             # Write data to CSV file
-            self.store_data_to_csv(decrypted_data)
-
-            # Define threshold values
-            thresholds = {
-                "power_output": 200
-            }
-
-            # Check if any parameter exceeds the threshold
-            alerts = {}
-            for turbine, turbine_data in decrypted_data['turbines'].items():
-                estimated_power = round(self.turbine_calc.estimate_power_output(turbine_data['wind_speed'], turbine_data['temperature'], turbine_data['pressure']), 2)
-                actual_power = turbine_data['power_output'] 
-                if abs(estimated_power-actual_power) > thresholds['power_output']:
-                    alerts[turbine] = f"Expected {estimated_power}kW from local weather variables but received {actual_power}kW"
+            END_TO_END_SECONDS.observe(max(0.0, end_to_end_delay))
+            CLASS_END_TO_END_SECONDS[priority.parse_priority(request.headers.get(priority.PRIORITY_HEADER))].observe(
+                max(0.0, end_to_end_delay))
+            logger.debug("Data received at Ground Station, end-to-end delay %.4fs: %s",
+                         end_to_end_delay, list(decrypted_data.keys()))
+
+            # Queue data for the batched storage writer
+            with tracing.stage(span, 'store'):
+                ROWS_STORED.inc(self.store.append(decrypted_data))
+
+            # Score the snapshot against each turbine's rolling statistics
+            with tracing.stage(span, 'anomaly'):
+                alerts = self.anomalies.evaluate(decrypted_data)
+
+            if span is not None:
+                self.trace_stats.record(span.finish())
+            MESSAGES_DELIVERED.inc()
+            RECEIVE_SECONDS.observe(time.perf_counter() - started)
 
             # Return the appropriate response based on checks
             if alerts:
-                print(f'"message": "Alert - Parameters exceeded thresholds"\n"Alerts": {alerts}')
+                ALERTS_RAISED.inc(len(alerts))
+                logger.info("Alert - Parameters exceeded thresholds: %s", [alert["message"] for alert in alerts])
             return jsonify({"message": "Data received at Ground Station"})
 
 
-    def store_data_to_csv(self, data):
-        """Store received data in a CSV file."""
-        with open(self.csv_file_path, mode='a', newline='') as csvfile:
-            fieldnames = ['timestamp', 'turbine_id', 'turbine', 'temperature', 'pressure', 'wind_speed', 'power_output']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            for turbine_name, turbine_data in data['turbines'].items():
-                row = {
-                    'timestamp': data['timestamp'],
-                    'turbine_id': data['turbine_id'],
-                    'turbine': turbine_name,
-                    'temperature': turbine_data['temperature'],
-                    'pressure': turbine_data['pressure'],
-                    'wind_speed': turbine_data['wind_speed'],
-                    'power_output': turbine_data['power_output']
-                }
-                writer.writerow(row)
+        gossip.register_gossip_endpoint(self.app, self.gossip)
+        metrics.register_metrics_endpoint(self.app)
+        profiling.register_profiling_endpoints(self.app)
+
+        @self.app.route('/trace_stats', methods=['GET'])
+        def get_trace_stats():
+            return jsonify(self.trace_stats.summary())
+
+
+        @self.app.route('/sequence_stats', methods=['GET'])
+        def get_sequence_stats():
+            return jsonify(self.sequences.summary())
+
+
+        @self.app.route('/alerts', methods=['GET'])
+        def get_alerts():
+            since = request.args.get('since', type=float)
+            farm_id = request.args.get('farm-id', type=int)
+            turbine = request.args.get('turbine')
+            kind = request.args.get('kind')
+            limit = request.args.get('limit', default=100, type=int)
+            return jsonify(self.anomalies.alerts.query(since, farm_id, turbine, kind, limit))
+
+
+    def add_sequence(self, sequence):
+        """Record a delivered snapshot's number, returns False if it was delivered already"""
+        added = self.sequences.add(sequence)
+        SEQUENCE_MISSING.set(self.sequences.missing)
+        return added
+
+
+    @functools.cached_property
+    def private_key(self):
+        """Loaded on first use, warm_up() does that once the node is serving"""
+        return self.load_rsa_key(private=True)
 
 
+    @profiling.timed('decrypt')
     def decrypt_rsa_turbine_data(self, encrypted_message):
+        import rsa
         try:
             decrypted_message = []
             for i in range(0, len(encrypted_message), 256):
@@ -123,46 +238,17 @@ class GroundStationNode:
 
 
     def hamming_decode_message(self, encoded_data: bytes) -> bytes:
-        decoded_nibbles = []
+        return codec.decode_message(encoded_data)
 
-        # Convert bytes into bit strings
-        bit_string = ''.join(f"{byte:08b}" for byte in encoded_data)
 
-        # Process each 7-bit block
-        for i in range(0, len(bit_string), 7):
-            block = bit_string[i:i+7].ljust(7, '0')  # Ensure block is 7 bits
-            decoded_nibble = self.hamming_decode(block)
-            decoded_nibbles.append(decoded_nibble)
-
-        # Combine decoded nibbles into bytes
-        decoded_message = []
-        for i in range(0, len(decoded_nibbles), 2):
-            if i + 1 < len(decoded_nibbles):
-                high_nibble = int(decoded_nibbles[i], 2) << 4
-                low_nibble = int(decoded_nibbles[i + 1], 2)
-                decoded_message.append(high_nibble | low_nibble)
-
-        return bytes(decoded_message)
-
-
-    def hamming_decode(str, encoded: str) -> str:
-        """Decodes a byte message using Hamming (7,4) code and corrects errors where possible"""
-        p1, p2, d1, p3, d2, d3, d4 = map(int, encoded)
-        c1 = p1 ^ d1 ^ d2 ^ d4  # Syndrome bit 1
-        c2 = p2 ^ d1 ^ d3 ^ d4  # Syndrome bit 2
-        c3 = p3 ^ d2 ^ d3 ^ d4  # Syndrome bit 3
-        err_pos = c1 * 1 + c2 * 2 + c3 * 4
-
-        corrected = list(encoded)
-        if err_pos != 0:  # If there is an error
-            corrected[err_pos-1] = '1' if corrected[err_pos-1] == '0' else '0'
-
-        # Extract original data bits
-        d1, d2, d3, d4 = corrected[2], corrected[4], corrected[5], corrected[6]
-        return f"{d1}{d2}{d3}{d4}"
+    @profiling.timed('decode')
+    def fec_decode_message(self, encoded_data: bytes, fec=codec.DEFAULT_FEC) -> bytes:
+        return codec.decode(encoded_data, fec)
 
 
     def load_rsa_key(self, private=False):
+        # rsa is imported here and in decrypt_rsa_turbine_data, off the path to serving
+        import rsa
         keypath = os.path.join(os.path.dirname(os.path.dirname(__file__)), "keys")
 
         if private:
@@ -175,21 +261,92 @@ class GroundStationNode:
 
 
     def start_flask_app(self):
-        threading.Thread(target=self.app.run, kwargs={
-            "host": self.gs_host[0],
-            "port": self.gs_host[1],
-            "use_reloader": False,
-            "debug": False
-        }, daemon=True).start()
-
-
-if __name__ == "__main__":
+        if self.worker is None:
+            threading.Thread(target=self.app.run, kwargs={
+                "host": self.gs_host[0],
+                "port": self.gs_host[1],
+                "use_reloader": False,
+                "debug": False
+            }, daemon=True).start()
+        else:
+            # Every worker binds the port with SO_REUSEPORT, the kernel spreads connections over them
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            listener.bind(self.gs_host)
+            listener.listen(128)
+            server = make_server(*self.gs_host, self.app, threaded=True, fd=listener.fileno())
+            listener.close()
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        startup.wait_until_serving(self.gs_host[1])
+        threading.Thread(target=self.warm_up, daemon=True).start()
+
+
+    def warm_up(self):
+        """Startup work deferred until serving: the RSA key, then announcing (one worker does that)"""
+        self.private_key  # loaded before the first message needs it
+        if self.worker in (None, 0):
+            self.announce()
+
+
+    def announce(self):
+        """Announce presence to the network, in the background once serving, then join the gossip"""
+        found = network_manager.scan_network(device_id=self.gs_id, device_port=self.gs_host[1])
+        startup.discovered(len(found))
+        self.gossip.seed(found)
+        self.gossip.start()
+
+
+def run_worker(worker=None, generation=None):
+    ground_station = None
     try:
-        ground_station = GroundStationNode()
+        ground_station = GroundStationNode(worker, generation)
         ground_station.start_flask_app()
-        print("Ground Station Online.")
+        print(f"{ground_station.name} Online.")
 
         while True:
             time.sleep(5)
     except KeyboardInterrupt:
-        print("-"*30+"\nSimulation stopped by user\n"+"-"*30)
\ No newline at end of file
+        if ground_station is not None:
+            # Workers can be interrupted twice, by the terminal and by run_workers
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            ground_station.store.close()
+
+
+def run_workers(count):
+    """
+    Serve port 33999 from `count` worker processes, so decoding and
+    decryption are not limited to one interpreter. Workers load the same key
+    from keys/ and store into shards read back with storage.ShardedStore.
+    Interrupting this process stops them all.
+    """
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        raise SystemExit("--workers needs SO_REUSEPORT, run a single process on this platform")
+    generation = gossip.generation(startup.STARTED)
+    # Spawned, not forked: the parent's logging and other background threads would not survive a fork
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=run_worker, args=(worker, generation), name=f"ground-station-{worker}")
+               for worker in range(count)]
+    for process in workers:
+        process.start()
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        for process in workers:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGINT)
+        for process in workers:
+            process.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ground station node")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes serving the port, more than 1 shards storage per worker")
+    args = parser.parse_args()
+    if args.workers > 1:
+        run_workers(args.workers)
+    else:
+        run_worker()
+    print("-"*30+"\nSimulation stopped by user\n"+"-"*30)
\ No newline at end of file
@@ -0,0 +1,136 @@
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from telemetry_index import TailingIndex, turbine_number
+
+METRICS = ('power_output', 'wind_speed', 'temperature', 'pressure')
+
+
+class RingBuffer:
+    """
+    Time series of (timestamp, METRICS) samples holding at most capacity, the
+    oldest overwritten first. Storage starts at `initial` samples and doubles
+    as they arrive, so a turbine costs memory for what it has actually sent.
+    """
+
+    def __init__(self, capacity, initial=64):
+        self.capacity = capacity
+        allocated = min(capacity, initial)
+        self.timestamps = np.zeros(allocated, dtype=np.float64)
+        self.values = np.zeros((allocated, len(METRICS)), dtype=np.float64)
+        self.head = 0  # next slot to write
+        self.size = 0
+
+    @property
+    def allocated(self):
+        return self.timestamps.size
+
+    def append(self, timestamp, values):
+        if self.size == self.allocated < self.capacity:
+            self._grow()
+        self.timestamps[self.head] = timestamp
+        self.values[self.head] = values
+        self.head = (self.head + 1) % self.allocated
+        self.size = min(self.size + 1, self.allocated)
+
+    def _grow(self):
+        # Only called while full and not yet wrapped, so head is 0 and the samples are in order
+        extra = min(self.capacity, 2 * self.allocated) - self.allocated
+        self.timestamps = np.concatenate([self.timestamps, np.zeros(extra)])
+        self.values = np.concatenate([self.values, np.zeros((extra, len(METRICS)))])
+        self.head = self.size
+
+    def ordered(self):
+        """Samples in insertion order (oldest first)"""
+        if self.size < self.allocated:
+            return self.timestamps[:self.size], self.values[:self.size]
+        order = np.roll(np.arange(self.allocated), -self.head)
+        return self.timestamps[order], self.values[order]
+
+    def window(self, start, end):
+        """Samples with start <= timestamp < end, sorted by timestamp"""
+        timestamps, values = self.ordered()
+        if timestamps.size > 1 and np.any(np.diff(timestamps) < 0):
+            order = np.argsort(timestamps, kind='stable')
+            timestamps, values = timestamps[order], values[order]
+        lo, hi = np.searchsorted(timestamps, [start, end], side='left')
+        return timestamps[lo:hi], values[lo:hi]
+
+
+def downsample(timestamps, values, start, bucket):
+    """
+    Bucket sorted samples into fixed-width time buckets starting at start.
+    Returns bucket start times and per-bucket min, max and mean for every metric.
+    """
+    if timestamps.size == 0:
+        empty = np.empty((0, values.shape[1]))
+        return np.empty(0), empty, empty, empty
+    bucket_ids = ((timestamps - start) // bucket).astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, np.diff(bucket_ids) != 0])
+    counts = np.diff(np.r_[starts, timestamps.size])
+    mins = np.minimum.reduceat(values, starts, axis=0)
+    maxs = np.maximum.reduceat(values, starts, axis=0)
+    means = np.add.reduceat(values, starts, axis=0) / counts[:, None]
+    return start + bucket_ids[starts] * bucket, mins, maxs, means
+
+
+class HistoryIndex(TailingIndex):
+    """
+    Per-turbine ring buffers of recent readings, keyed by (farm id, turbine number).
+    The default capacity holds 24 hours of readings at the 5 s snapshot cadence.
+    All buffers together hold at most max_samples (40 bytes each); past that the
+    turbines that reported least recently are dropped.
+    """
+
+    def __init__(self, store, capacity=24 * 60 * 60 // 5, max_samples=5_000_000, min_refresh_interval=0.5):
+        super().__init__(store, min_refresh_interval)
+        self.capacity = capacity
+        self.max_samples = max_samples
+        self.buffers = OrderedDict()  # least recently updated first
+        self.allocated = 0
+
+    def bootstrap(self):
+        rows, offset = self.store.window_with_offset(time.time() - self.capacity * 5)
+        self.apply(rows)
+        return offset
+
+    def apply(self, rows):
+        for row in rows:
+            key = (row['turbine_id'], turbine_number(row['turbine']))
+            buffer = self.buffers.get(key)
+            if buffer is None:
+                buffer = self.buffers[key] = RingBuffer(self.capacity)
+                self.allocated += buffer.allocated
+            else:
+                self.buffers.move_to_end(key)
+            allocated = buffer.allocated
+            buffer.append(row['timestamp'], [row[metric] for metric in METRICS])
+            self.allocated += buffer.allocated - allocated
+        while self.allocated > self.max_samples and len(self.buffers) > 1:
+            _, buffer = self.buffers.popitem(last=False)
+            self.allocated -= buffer.allocated
+
+    def query(self, turbine_ids, start, end, bucket, farm_id=0, max_buckets=2000):
+        """Downsampled min/max/mean series for each turbine over [start, end)"""
+        self.refresh()
+        bucket = max(bucket, (end - start) / max_buckets)
+        result = {}
+        for turbine_id in turbine_ids:
+            buffer = self.buffers.get((farm_id, turbine_id))
+            if buffer is None:
+                continue
+            timestamps, values = buffer.window(start, end)
+            bucket_times, mins, maxs, means = downsample(timestamps, values, start, bucket)
+            result[turbine_id] = {
+                'timestamps': bucket_times.round(3).tolist(),
+                **{
+                    metric: {
+                        'min': mins[:, i].round(2).tolist(),
+                        'max': maxs[:, i].round(2).tolist(),
+                        'mean': means[:, i].round(2).tolist(),
+                    } for i, metric in enumerate(METRICS)
+                }
+            }
+        return result, bucket
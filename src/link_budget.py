@@ -0,0 +1,156 @@
+import math
+
+import numpy as np
+
+# Transit time noise coefficients: links to or from the ground see average
+# atmospheric conditions, links between satellites excellent ones
+GROUND_SIGMA = 1e-8
+SPACE_SIGMA = 1e-9
+
+MIN_BER = 1e-300  # erfc underflows beyond this, table values are clamped here
+
+
+def closed_form(distance, sigma=SPACE_SIGMA):
+    """
+    Received power, noise and resulting bit error rate of a link of `distance`
+    km, computed directly. sigma is the transit time noise coefficient.
+    """
+    f = 2.4e8 # frequency (2.4GHz)
+    C = 3e8 # speed of light [m/s^2]
+    Pt = 50 # transmit power [50W used by Starlink to overcome high attenuation wrt distance]
+    Pr = Pt * (C/(4 * math.pi * distance * 1000 * f))**2 # receiver power using FSPL model
+    Pt = 10*math.log10(Pt) + 30 # convert to dBm
+    Pr = 10*math.log10(Pr) + 30 # convert to dBm
+    T = 290 # temperature (K) [Average temperature in thermosphere (85km - 690km) at LEO orbit (approx 550km) is roughly 290K]
+    k = 1.38e-23 # Boltzmann constant
+    B = 10e6 # bandwidth (10 MHz)
+    Nt = 10*math.log10(T*k*B) + 30 # AWGN for ambient temperature at receiver
+    Nphi = 10*math.log10(1+(2*math.pi*f*sigma)) # Transit time noise
+    SNR = Pr - (Nt + Nphi) # Signal to Noise Ratio (dBm calculation form)
+    erfc = math.erfc(SNR/math.sqrt(2))
+    return {
+        'Pt': Pt, 'Pr': Pr, 'Nt': Nt, 'Nphi': Nphi, 'SNR': SNR,
+        'BER': 0.5*erfc, # Bit Error Rate, formula valid for BPKS/QPKS modulation
+        'quality': 2 / max(erfc, 1e-100), # Inverse of Bit Error Rate, used as a routing weight divisor
+    }
+
+
+class LinkTable:
+    """
+    SNR and BER for one sigma, precomputed on a grid of distances evenly
+    spaced in log10(distance) and linearly interpolated. SNR is exactly linear
+    in log10(distance) and BER is stored as its logarithm, where it is smooth
+    enough for linear interpolation to stay within about 2e-5 relative error.
+    Link quality is derived from the interpolated BER, so routing weights and
+    simulated noise always agree. Distances outside the grid fall back to the
+    closed form.
+    """
+
+    def __init__(self, sigma, min_distance=1.0, max_distance=100_000.0, points=8192):
+        self.sigma = sigma
+        self.log_min = math.log10(min_distance)
+        self.log_max = math.log10(max_distance)
+        self.points = points
+        self.inv_step = (points - 1) / (self.log_max - self.log_min)
+
+        self.log_distances = np.linspace(self.log_min, self.log_max, points)
+        rows = [closed_form(10 ** x, sigma) for x in self.log_distances]
+        self.snr_values = np.array([row['SNR'] for row in rows])
+        self.ln_ber_values = np.log(np.maximum([row['BER'] for row in rows], MIN_BER))
+        # Plain lists index faster than numpy arrays on the scalar path
+        self._snr = self.snr_values.tolist()
+        self._ln_ber = self.ln_ber_values.tolist()
+
+    def _scalar(self, values, distance):
+        x = (math.log10(distance) - self.log_min) * self.inv_step
+        i = int(x)
+        if x < 0 or i >= self.points - 1:
+            return None
+        low = values[i]
+        return low + (values[i + 1] - low) * (x - i)
+
+    def _array(self, values, distances, key):
+        distances = np.asarray(distances, dtype=float)
+        log_distances = np.log10(distances)
+        result = np.interp(log_distances, self.log_distances, values)
+        outside = (log_distances < self.log_min) | (log_distances > self.log_max)
+        for index in np.flatnonzero(outside):
+            result.flat[index] = key(closed_form(distances.flat[index], self.sigma))
+        return result
+
+    def snr(self, distance):
+        if not isinstance(distance, (float, int)):
+            return self._array(self.snr_values, distance, lambda row: row['SNR'])
+        value = self._scalar(self._snr, distance)
+        return closed_form(distance, self.sigma)['SNR'] if value is None else value
+
+    def ber(self, distance):
+        if not isinstance(distance, (float, int)):
+            return np.exp(self._array(self.ln_ber_values, distance, lambda row: math.log(max(row['BER'], MIN_BER))))
+        value = self._scalar(self._ln_ber, distance)
+        return closed_form(distance, self.sigma)['BER'] if value is None else math.exp(value)
+
+    def quality(self, distance):
+        """2 / max(erfc, 1e-100) as in the closed form, i.e. 1 / max(BER, 5e-101)"""
+        if not isinstance(distance, (float, int)):
+            return 1 / np.maximum(self.ber(distance), 5e-101)
+        return 1 / max(self.ber(distance), 5e-101)
+
+
+# Built on first use (about 50 ms each), so importing this module stays cheap;
+# nodes call warm() in the background once they are serving
+TABLE_SIGMAS = (SPACE_SIGMA, GROUND_SIGMA)
+_tables = {}
+
+
+def table(sigma):
+    """The precomputed table for sigma, or None if sigma has none"""
+    link_table = _tables.get(sigma)
+    if link_table is None and sigma in TABLE_SIGMAS:
+        link_table = _tables.setdefault(sigma, LinkTable(sigma))
+    return link_table
+
+
+def warm():
+    for sigma in TABLE_SIGMAS:
+        table(sigma)
+
+
+def _nphi(sigma):
+    return 10*math.log10(1+(2*math.pi*2.4e8*sigma))
+
+
+def snr(distance, sigma=SPACE_SIGMA):
+    link_table = table(sigma)
+    if link_table is not None:
+        return link_table.snr(distance)
+    # Transit time noise does not depend on distance, so other sigmas are a constant shift
+    return table(SPACE_SIGMA).snr(distance) - (_nphi(sigma) - _nphi(SPACE_SIGMA))
+
+
+def ber(distance, sigma=SPACE_SIGMA):
+    """Bit error rate of a link, for a scalar distance or an array of them"""
+    link_table = table(sigma)
+    if link_table is not None:
+        return link_table.ber(distance)
+    value = snr(distance, sigma)
+    if not isinstance(value, float):
+        return 0.5 * np.array([math.erfc(x / math.sqrt(2)) for x in np.ravel(value)]).reshape(np.shape(value))
+    return 0.5 * math.erfc(value / math.sqrt(2))
+
+
+def path_ber(hops):
+    """
+    End-to-end bit error rate over (distance, sigma) hops that each flip bits
+    independently: a bit arrives wrong if it was flipped an odd number of times
+    """
+    survive = 1.0
+    for distance, sigma in hops:
+        survive *= 1 - 2 * ber(distance, sigma)
+    return (1 - survive) / 2
+
+
+def quality(distance, ground=False):
+    """Routing link quality (inverse BER) of a ground or inter-satellite link"""
+    return table(GROUND_SIGMA if ground else SPACE_SIGMA).quality(distance)
+
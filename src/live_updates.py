@@ -0,0 +1,109 @@
+import json
+import queue
+import threading
+import time
+
+
+class Broadcaster:
+    """
+    Fan-out of server-sent events to every connected browser.
+
+    Producers publish to a topic once per tick; the payload is serialised once
+    and queued to every subscriber of that topic, so the server's cost no longer
+    depends on how many tabs are open. For keyed state (e.g. device positions)
+    publish_state() only sends the entries that changed since the last tick and
+    nothing at all when nothing changed. New subscribers first receive the
+    current full state of their topics.
+    """
+
+    def __init__(self, max_queued=100, heartbeat=15.0):
+        self.max_queued = max_queued
+        self.heartbeat = heartbeat
+        self._subscribers = {}  # queue -> set of topics
+        self._state = {}  # topic -> {key: value}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def format_event(topic, data):
+        return f"event: {topic}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self, topics):
+        q = queue.Queue(maxsize=self.max_queued)
+        with self._lock:
+            self._subscribers[q] = set(topics)
+            for topic in topics:
+                if topic in self._state:
+                    q.put(self.format_event(topic, {'changed': self._state[topic], 'removed': []}))
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.pop(q, None)
+
+    def publish(self, topic, data):
+        message = self.format_event(topic, data)
+        with self._lock:
+            subscribers = [q for q, topics in self._subscribers.items() if topic in topics]
+        for q in subscribers:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # Slow client, drop it rather than buffer without bound
+                self.unsubscribe(q)
+
+    def publish_state(self, topic, state):
+        """
+        Publish only the keys of state that differ from the previous state, as
+        {"changed": {key: value}, "removed": [key]}. Clients merge these into
+        their local copy.
+        """
+        previous = self._state.get(topic, {})
+        changed = {key: value for key, value in state.items() if previous.get(key) != value}
+        removed = [key for key in previous if key not in state]
+        self._state[topic] = state
+        if changed or removed:
+            self.publish(topic, {'changed': changed, 'removed': removed})
+
+    def stream(self, topics):
+        """Generator of SSE text for one client, for use as a Flask streaming response"""
+        q = self.subscribe(topics)
+        try:
+            # A client dropped for falling behind is disconnected; the browser's
+            # EventSource reconnects and receives the full state again
+            while q in self._subscribers:
+                try:
+                    yield q.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(q)
+
+
+class Ticker:
+    """Calls tick() every interval seconds on a daemon thread while anyone is subscribed"""
+
+    def __init__(self, broadcaster, tick, interval=0.5):
+        self.broadcaster = broadcaster
+        self.tick = tick
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def ensure_running(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='live-updates', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            if self.broadcaster.subscriber_count():
+                try:
+                    self.tick()
+                except Exception as e:
+                    print(f"Live update tick failed: {e}")
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
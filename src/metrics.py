@@ -0,0 +1,147 @@
+import bisect
+import threading
+
+from flask import Response
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        return [(self.name, {}, self.value)]
+
+
+class Gauge:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def samples(self):
+        return [(self.name, {}, self.value)]
+
+
+# Log-spaced bucket bounds in seconds, from 10 us to 100 s (four per decade)
+LATENCY_BUCKETS = [10 ** (exponent / 4) for exponent in range(-20, 9)]
+
+
+class Histogram:
+    """Fixed-bucket histogram; bounds are the inclusive upper edges of each bucket"""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.bounds = list(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (capped at the max seen)"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'max': self.max if self.count else None,
+        }
+
+    def samples(self):
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            samples.append((f"{self.name}_bucket", {'le': f"{bound:.6g}"}, cumulative))
+        samples.append((f"{self.name}_bucket", {'le': '+Inf'}, self.count))
+        samples.append((f"{self.name}_sum", {}, self.total))
+        samples.append((f"{self.name}_count", {}, self.count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kwargs)
+            return metric
+
+    def render(self):
+        """Prometheus text exposition format"""
+        types = {Counter: 'counter', Gauge: 'gauge', Histogram: 'histogram'}
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {types[type(metric)]}")
+            for sample_name, labels, value in metric.samples():
+                label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"{sample_name}{{{label_text}}} {value}" if label_text else f"{sample_name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text):
+    return REGISTRY._get_or_create(Counter, name, help_text)
+
+
+def gauge(name, help_text):
+    return REGISTRY._get_or_create(Gauge, name, help_text)
+
+
+def histogram(name, help_text, buckets=LATENCY_BUCKETS):
+    return REGISTRY._get_or_create(Histogram, name, help_text, buckets=buckets)
+
+
+def register_metrics_endpoint(app):
+    """Add GET /metrics serving this process's metrics to a Flask app"""
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
@@ -1,48 +1,52 @@
-import requests
 from typing import Dict, Tuple, List
 import time
 import os
-import threading
 import random
 import update_satellite_positions
+from node_logging import get_logger
+
+logger = get_logger('network')
+
+# Network description files, overridable so test harnesses can supply their own
+ASSETS_DIR = os.environ.get('ASSETS_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), "assets"))
 
 def read_ips() -> List[str]:
     """Read IPs from file"""
     try:
         # filename is in assets, ip.txt
-        filename = os.path.join(os.path.dirname(os.path.dirname(__file__)), "assets", "ip.txt")
+        filename = os.path.join(ASSETS_DIR, "ip.txt")
         with open(filename, 'r') as f:
             return [ip.strip() for ip in f.readlines() if ip.strip()]
     except FileNotFoundError:
-        print(f"Warning: {filename} not found. Using localhost.")
+        logger.warning("%s not found. Using localhost.", filename)
         return ['0.0.0.0']
 
 def read_wf_and_gs() ->  Dict[int, Tuple[str, int]]:
     """Read windfarm and ground station from file"""
     try:
         # filename is in assets, wf_gs.txt
-        filename = os.path.join(os.path.dirname(os.path.dirname(__file__)), "assets", "wf_gs.txt")
+        filename = os.path.join(ASSETS_DIR, "wf_gs.txt")
         with open(filename, 'r') as f:
             lines = f.readlines()
             if not lines:
                 return {}
             return {int(line.split()[0]): (line.split()[1], int(line.split()[2])) for line in lines}
     except FileNotFoundError:
-        print(f"Warning: {filename} not found. Using empty dictionary.")
+        logger.warning("%s not found. Using empty dictionary.", filename)
         return {}
 
 def read_other_network_satellites() -> Dict[int, Tuple[str, int]]:
   """Read other network satellites from file"""
   try:
     # filename is in assets, other_network_satellites.txt
-    filename = os.path.join(os.path.dirname(os.path.dirname(__file__)), "assets", "other_satellites.txt")
+    filename = os.path.join(ASSETS_DIR, "other_satellites.txt")
     with open(filename, 'r') as f:
       lines = f.readlines()
       if not lines or all(not line.strip() for line in lines):
         return {}
       return {int(line.split()[0]): (line.split()[1], int(line.split()[2])) for line in lines if line.strip()}
   except FileNotFoundError:
-    print(f"Warning: {filename} not found. Using empty dictionary.")
+    logger.warning("%s not found. Using empty dictionary.", filename)
     return {}
 
 def scan_network(device_id, device_port, start_port: int = 33000, end_port: int = 33010, exclude_list = None) -> Dict[int, Tuple[str, int]]:
@@ -52,17 +56,18 @@ def scan_network(device_id, device_port, start_port: int = 33000, end_port: int
   """
   active_devices = {}
   active_devices.update(read_other_network_satellites())
+  import requests  # scans run once the node is serving, keep it off the import path
   ips = read_ips()
 
-  print(f"Scanning network for devices on ports {start_port}-{end_port}: {ips}")
-  print(f"{exclude_list = }")
+  logger.info("Scanning network for devices on ports %d-%d: %s", start_port, end_port, ips)
+  logger.debug("exclude_list = %s", exclude_list)
 
   device_positions = update_satellite_positions.calculate_satellite_positions(range(1, 11))
   # add yourself to the routing table
   for ip in ips:
     for port in list(range(start_port, end_port + 1)) + [33999]:
       if exclude_list is not None and f"{ip}:{port}" in exclude_list:
-        print(f"Skipping {ip}:{port}")
+        logger.debug("Skipping %s:%d", ip, port)
         continue
       try:
         next_id = start_port - 33000
@@ -75,7 +80,7 @@ def scan_network(device_id, device_port, start_port: int = 33000, end_port: int
           found_device_id = int(device_info.get('device-id'))
           if found_device_id is not None:
             active_devices[found_device_id] = (ip, port)
-            print(f"Found device {found_device_id} at {ip}:{port}")
+            logger.info("Found device %d at %s:%d", found_device_id, ip, port)
       except requests.exceptions.RequestException:
         continue
 
@@ -89,29 +94,3 @@ def simulate_leo_delay(device_positions,device_id,next_id) -> float:
     jitter = random.uniform(2, 8) # milliseconds
     leo_delay = (base_delay + jitter) / 1000 # seconds
     return leo_delay
-
-def send_down_device(routing_table, device_id, source_id):
-  """
-  Send to everyone except the device_id, that the device is down
-  """
-  device_positions = update_satellite_positions.calculate_satellite_positions(range(1, 11))
-  def notify_device(next_device_id, next_ip, next_port):
-    try:
-      delay = simulate_leo_delay(device_positions,next_device_id,source_id)
-      time.sleep(delay)
-      requests.get(f"http://{next_ip}:{next_port}/down", params={'device-id': device_id}, timeout=1, proxies={"http": None, "https": None})
-      time.sleep(delay)
-    except requests.exceptions.RequestException:
-      print(f"Error sending down message to device {next_device_id}")
-
-  threads = []
-  # exclude the device down and source
-  for next_device_id, (next_ip, next_port) in routing_table.items():
-    if next_device_id == device_id or next_device_id == source_id:
-      continue
-    thread = threading.Thread(target=notify_device, args=(next_device_id, next_ip, next_port))
-    threads.append(thread)
-    thread.start()
-
-  for thread in threads:
-    thread.join()
\ No newline at end of file
@@ -0,0 +1,36 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+# DEBUG, INFO, WARNING or ERROR. Below-level calls return before any formatting
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+
+_listener = None
+
+
+def _configure():
+    """
+    Route all node logging through a queue, so the calling thread only pays
+    for an enqueue and the stdout writes happen on a background thread
+    """
+    global _listener
+    log_queue = queue.SimpleQueue()
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    _listener = logging.handlers.QueueListener(log_queue, stream)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger('node')
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False
+
+
+def get_logger(name):
+    if _listener is None:
+        _configure()
+    return logging.getLogger(f'node.{name}')
@@ -0,0 +1,75 @@
+import collections
+import queue
+import threading
+import time
+
+# Traffic class of a status update, set by the wind farm and honoured by every hop
+PRIORITY_HEADER = 'X-Priority'
+# Most urgent first. 'alert' is a snapshot with a turbine far off its expected
+# power, 'normal' a fresh snapshot, 'bulk' one resent from the outbox
+PRIORITIES = ('alert', 'normal', 'bulk')
+DEFAULT_PRIORITY = 'normal'
+
+
+def parse_priority(value):
+    """Traffic class named by a header value, DEFAULT_PRIORITY if missing or unknown"""
+    return value if value in PRIORITIES else DEFAULT_PRIORITY
+
+
+class PriorityQueue(queue.Queue):
+    """
+    queue.Queue of (priority, item) entries with one FIFO per traffic class.
+    get() returns the oldest entry of the most urgent class that has one
+    (strict priority), so a backlog of bulk entries never delays an alert.
+    Unknown priorities are queued as DEFAULT_PRIORITY.
+    """
+
+    def _init(self, maxsize):
+        self.classes = {priority: collections.deque() for priority in PRIORITIES}
+
+    def _qsize(self):
+        return sum(len(entries) for entries in self.classes.values())
+
+    def _put(self, entry):
+        priority, item = entry
+        priority = parse_priority(priority)
+        self.classes[priority].append((priority, item))
+
+    def _get(self):
+        for entries in self.classes.values():
+            if entries:
+                return entries.popleft()
+
+    def peek(self):
+        """Priority of the entry get() would return, None if empty"""
+        with self.mutex:
+            return next((priority for priority, entries in self.classes.items() if entries), None)
+
+    def depths(self):
+        with self.mutex:
+            return {priority: len(entries) for priority, entries in self.classes.items()}
+
+
+class TokenBucket:
+    """
+    Allows `rate` events per second on average and bursts of up to `burst`.
+    take() spends a token if one is available and never blocks.
+    """
+
+    def __init__(self, rate, burst=1.0, clock=time.monotonic):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.clock = clock
+        self._tokens = self.burst
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
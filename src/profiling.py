@@ -0,0 +1,271 @@
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from flask import Response, jsonify, request
+
+import metrics
+
+# Off unless PROFILING is set to something other than 0. When off, timed()
+# returns the function unchanged and no profiling routes or hooks are added,
+# so a disabled node runs exactly the same code as before
+ENABLED = os.environ.get('PROFILING', '') not in ('', '0')
+
+MAX_SESSION_SECONDS = 600
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of every thread (via sys._current_frames) every interval
+    seconds and counts identical stacks. Cheap enough to run on a loaded node,
+    and unlike cProfile it sees every thread including ones already running.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        """Folded stacks, one 'frame;frame;frame count' per line (flamegraph.pl / speedscope input)"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class CallProfiler:
+    """
+    Deterministic cProfile session. cProfile only sees the thread it is enabled
+    in, so a profiler is enabled around each Flask request and each timed()
+    call on other threads, and the results are merged when the session stops.
+    """
+
+    def __init__(self):
+        self.profiles = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def enter(self):
+        """Start profiling this thread, unless it is already being profiled"""
+        if getattr(self._local, 'profile', None) is not None:
+            return False
+        profile = self._local.profile = cProfile.Profile()
+        profile.enable()
+        return True
+
+    def exit(self):
+        profile = self._local.profile
+        profile.disable()
+        self._local.profile = None
+        with self._lock:
+            self.profiles.append(profile)
+
+    def stats(self):
+        with self._lock:
+            profiles = list(self.profiles)
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+
+class ProfileSession:
+    """One profiling run of at most `seconds`, stopped early by stop()"""
+
+    def __init__(self, mode, seconds, interval):
+        self.mode = mode
+        self.seconds = seconds
+        self.started = time.time()
+        self.stopped = None
+        self.profiler = SamplingProfiler(interval) if mode == 'sample' else CallProfiler()
+        self._timer = threading.Timer(seconds, self.stop)
+        self._timer.daemon = True
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.profiler.start()
+        self._timer.start()
+        return self
+
+    def stop(self):
+        with self._lock:
+            if self.stopped is not None:
+                return
+            self.stopped = time.time()
+        self._timer.cancel()
+        self.profiler.stop()
+
+    @property
+    def running(self):
+        return self.stopped is None
+
+    def status(self):
+        status = {
+            'mode': self.mode,
+            'running': self.running,
+            'started': self.started,
+            'seconds': self.seconds,
+            'elapsed': (self.stopped or time.time()) - self.started,
+        }
+        if self.mode == 'sample':
+            status['samples'] = self.profiler.samples
+        else:
+            status['profiled_calls'] = len(self.profiler.profiles)
+        return status
+
+    def download(self, fmt=None):
+        """(body, mimetype, filename) of the session's results"""
+        if self.mode == 'sample':
+            return self.profiler.collapsed(), 'text/plain', 'profile.folded'
+        stats = self.profiler.stats()
+        if stats is None:
+            return '', 'text/plain', 'profile.txt'
+        if fmt == 'text':
+            out = io.StringIO()
+            stats.stream = out
+            stats.sort_stats('cumulative').print_stats(50)
+            return out.getvalue(), 'text/plain', 'profile.txt'
+        # Same format as cProfile's -o output, readable by pstats and snakeviz
+        return marshal.dumps(stats.stats), 'application/octet-stream', 'profile.prof'
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _call_profiler():
+    session = _session
+    if session is not None and session.running and session.mode == 'cprofile':
+        return session.profiler
+    return None
+
+
+def timed(name):
+    """
+    Record each call of the decorated function in the timed_<name>_seconds
+    histogram (served on /metrics), and include it in a running cProfile
+    session. Returns the function untouched when profiling is disabled.
+    """
+    def decorator(func):
+        if not ENABLED:
+            return func
+        histogram = metrics.histogram(f'timed_{name}_seconds', f'Time spent in {func.__qualname__}')
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _call_profiler()
+            entered = profiler is not None and profiler.enter()
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+                if entered:
+                    profiler.exit()
+        return wrapper
+    return decorator
+
+
+def register_profiling_endpoints(app):
+    """
+    Add the /profile routes to a Flask app when profiling is enabled:
+
+        POST /profile/start?mode=sample|cprofile&seconds=30&interval=0.005
+        POST /profile/stop
+        GET  /profile                   status of the current or last session
+        GET  /profile/download[?format=text]
+    """
+    if not ENABLED:
+        return
+
+    @app.before_request
+    def profile_request():
+        profiler = _call_profiler()
+        if profiler is not None and profiler.enter():
+            request.environ['profiling.entered'] = profiler
+
+    @app.teardown_request
+    def finish_request_profile(exc):
+        profiler = request.environ.pop('profiling.entered', None)
+        if profiler is not None:
+            profiler.exit()
+
+    @app.route('/profile/start', methods=['POST'])
+    def start_profile():
+        global _session
+        mode = request.args.get('mode', 'sample')
+        seconds = request.args.get('seconds', default=30.0, type=float)
+        interval = request.args.get('interval', default=0.005, type=float)
+        if mode not in ('sample', 'cprofile'):
+            return jsonify({'error': "mode must be 'sample' or 'cprofile'"}), 400
+        if not 0 < seconds <= MAX_SESSION_SECONDS or interval <= 0:
+            return jsonify({'error': f"seconds must be in (0, {MAX_SESSION_SECONDS}] and interval positive"}), 400
+        with _session_lock:
+            if _session is not None and _session.running:
+                return jsonify({'error': 'a profiling session is already running', **_session.status()}), 409
+            _session = ProfileSession(mode, seconds, interval).start()
+            return jsonify(_session.status())
+
+    @app.route('/profile/stop', methods=['POST'])
+    def stop_profile():
+        session = _session
+        if session is None:
+            return jsonify({'error': 'no profiling session'}), 404
+        session.stop()
+        return jsonify(session.status())
+
+    @app.route('/profile', methods=['GET'])
+    def get_profile_status():
+        session = _session
+        if session is None:
+            return jsonify({'error': 'no profiling session'}), 404
+        return jsonify(session.status())
+
+    @app.route('/profile/download', methods=['GET'])
+    def download_profile():
+        session = _session
+        if session is None:
+            return jsonify({'error': 'no profiling session'}), 404
+        if session.running:
+            return jsonify({'error': 'profiling session still running', **session.status()}), 409
+        body, mimetype, filename = session.download(request.args.get('format'))
+        return Response(body, mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
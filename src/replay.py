@@ -0,0 +1,97 @@
+import csv
+import json
+import time
+
+import metrics
+import storage
+from node_logging import get_logger
+
+logger = get_logger('replay')
+REPLAYED = metrics.counter('replay_snapshots_total', 'Recorded snapshots replayed')
+REPLAY_LAG = metrics.gauge('replay_lag_seconds', 'How far the replay is behind its schedule')
+
+READING_FIELDS = ('temperature', 'pressure', 'wind_speed', 'power_output')
+
+
+def group_rows(rows):
+    """
+    Rebuild snapshots from flat per-turbine rows (CSV or store), grouping
+    consecutive rows with the same timestamp and farm id
+    """
+    snapshot = None
+    for row in rows:
+        timestamp, farm_id = float(row['timestamp']), int(row['turbine_id'])
+        if snapshot is None or (snapshot['timestamp'], snapshot['turbine_id']) != (timestamp, farm_id):
+            if snapshot is not None:
+                yield snapshot
+            snapshot = {"timestamp": timestamp, "turbine_id": farm_id, "turbines": {}}
+        snapshot['turbines'][row['turbine']] = {field: float(row[field]) for field in READING_FIELDS}
+    if snapshot is not None:
+        yield snapshot
+
+
+def read_csv(path):
+    """Snapshots from the ground station's turbine_data.csv layout (one row per turbine)"""
+    with open(path, newline='') as f:
+        yield from group_rows(csv.DictReader(f))
+
+
+def read_jsonl(path):
+    """Snapshots from a JSONL capture with one status update per line; other lines are skipped"""
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and 'timestamp' in record and 'turbines' in record:
+                yield record
+
+
+def read_store(path):
+    """Snapshots from a ground station SQLite store"""
+    yield from group_rows(storage.TelemetryStore(path, readonly=True).scan())
+
+
+def read_snapshots(path):
+    """Lazy snapshot generator for a recording, picked by file extension"""
+    if path.endswith('.csv'):
+        return read_csv(path)
+    if path.endswith(('.jsonl', '.json')):
+        return read_jsonl(path)
+    if path.endswith(('.sqlite', '.db')):
+        return read_store(path)
+    raise ValueError(f"Don't know how to replay {path}, expected .csv, .jsonl or .sqlite")
+
+
+def paced(snapshots, speedup=1.0, max_rate=None, retime=True, clock=time.monotonic, sleep=time.sleep):
+    """
+    Yield snapshots on the recorded schedule compressed by speedup (0 means as
+    fast as possible), never faster than max_rate snapshots per second. Gaps
+    between snapshots are kept relative to each other, so a replay at a given
+    speedup is reproducible. With retime, each snapshot's timestamp is set to
+    when it is emitted, so end-to-end latency at the ground station stays
+    meaningful. If the consumer cannot keep up, the replay falls behind
+    schedule (replay_lag_seconds) rather than dropping snapshots.
+    """
+    min_gap = 1.0 / max_rate if max_rate else 0.0
+    first_recorded = None
+    started = None
+    last_emit = None
+    for snapshot in snapshots:
+        recorded = float(snapshot['timestamp'])
+        now = clock()
+        if first_recorded is None:
+            first_recorded, started = recorded, now
+        due = started + (recorded - first_recorded) / speedup if speedup > 0 else now
+        if last_emit is not None:
+            due = max(due, last_emit + min_gap)
+        if due > now:
+            sleep(due - now)
+            now = clock()
+        REPLAY_LAG.set(max(0.0, now - due))
+        last_emit = now
+        if retime:
+            snapshot = dict(snapshot, timestamp=time.time())
+        REPLAYED.inc()
+        yield snapshot
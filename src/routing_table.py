@@ -0,0 +1,228 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from types import MappingProxyType
+
+import metrics
+import update_satellite_positions
+from node_logging import get_logger
+from storage import DATA_DIR
+
+logger = get_logger('routing_table')
+TABLE_VERSION = metrics.gauge('routing_table_version', 'Changes made to the routing table since start')
+TABLE_SIZE = metrics.gauge('routing_table_devices', 'Devices in the routing table')
+CACHE_HITS = metrics.counter('route_cache_hits_total', 'Route lookups served from the route cache')
+CACHE_MISSES = metrics.counter('route_cache_misses_total', 'Route lookups that had to be computed')
+
+
+def snapshot_path(device_id):
+    """Where a node's routing table is persisted between runs"""
+    return os.path.join(DATA_DIR, f'routing_table_{device_id}.json')
+
+
+def load_snapshot(path):
+    """Devices from a persisted routing table, {} if there is none or it can't be read"""
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+        devices = {int(device_id): tuple(host) for device_id, host in saved['devices'].items()}
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        logger.warning("Ignoring unreadable routing table snapshot %s: %s", path, e)
+        return {}
+    logger.info("Warm start from %s: %d devices saved %.0fs ago", path, len(devices), time.time() - saved.get('saved_at', time.time()))
+    return devices
+
+
+class RoutingTable:
+    """
+    Device id -> (host, port) map shared by the Flask handlers, forwarding
+    threads and the rescan loop. Reads take no lock: the current mapping is
+    an immutable snapshot, and writers build a modified copy under a lock and
+    swap it in. Every write that actually changes the table bumps version
+    and calls the listeners with (version, snapshot) once the swap is done.
+    """
+
+    def __init__(self, devices=None):
+        self._state = (0, MappingProxyType(dict(devices or {})))
+        self._lock = threading.Lock()
+        self._listeners = []
+        TABLE_SIZE.set(len(self))
+
+    @property
+    def version(self):
+        return self._state[0]
+
+    def snapshot(self):
+        """(version, devices) as of one moment, devices is a read-only mapping"""
+        return self._state
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def persist(self, path):
+        """
+        Save the table to path now and after every change, replacing the file
+        atomically. Listeners can run concurrently, so an older version never
+        overwrites a newer one.
+        """
+        lock = threading.Lock()
+        saved_version = -1
+
+        def save(version, devices):
+            nonlocal saved_version
+            with lock:
+                if version <= saved_version:
+                    return
+                try:
+                    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                    with open(f"{path}.tmp", 'w') as f:
+                        json.dump({'version': version, 'saved_at': time.time(),
+                                   'devices': {str(device_id): list(host) for device_id, host in devices.items()}}, f)
+                    os.replace(f"{path}.tmp", path)
+                    saved_version = version
+                except OSError as e:
+                    logger.warning("Could not save routing table to %s: %s", path, e)
+
+        save(*self.snapshot())
+        self.subscribe(save)
+
+    def _write(self, change):
+        with self._lock:
+            version, devices = self._state
+            updated = dict(devices)
+            change(updated)
+            if updated == devices:
+                return False
+            state = self._state = (version + 1, MappingProxyType(updated))
+        TABLE_VERSION.set(state[0])
+        TABLE_SIZE.set(len(state[1]))
+        for listener in self._listeners:
+            try:
+                listener(*state)
+            except Exception:
+                logger.exception("Routing table listener failed")
+        return True
+
+    def set(self, device_id, host):
+        """Add or readdress a device, returns True if that changed the table"""
+        return self._write(lambda devices: devices.__setitem__(device_id, tuple(host)))
+
+    def discard(self, device_id):
+        """Remove a device if present, returns True if it was"""
+        return self._write(lambda devices: devices.pop(device_id, None))
+
+    def update(self, devices):
+        """Add or readdress several devices in one change"""
+        return self._write(lambda current: current.update({device_id: tuple(host) for device_id, host in devices.items()}))
+
+    def refresh(self, found, unconfirmed=()):
+        """
+        Merge the devices a network scan found, in one change, and drop the
+        unconfirmed ones (restored from a snapshot) that did not answer it
+        """
+        def change(devices):
+            devices.update({device_id: tuple(host) for device_id, host in found.items()})
+            for device_id in unconfirmed:
+                if device_id not in found:
+                    devices.pop(device_id, None)
+        return self._write(change)
+
+    # Read-only mapping interface over the current snapshot
+    def __getitem__(self, device_id):
+        return self._state[1][device_id]
+
+    def __contains__(self, device_id):
+        return device_id in self._state[1]
+
+    def __iter__(self):
+        return iter(self._state[1])
+
+    def __len__(self):
+        return len(self._state[1])
+
+    def __repr__(self):
+        return f"RoutingTable(v{self.version}, {dict(self._state[1])})"
+
+    def get(self, device_id, default=None):
+        return self._state[1].get(device_id, default)
+
+    def keys(self):
+        return self._state[1].keys()
+
+    def values(self):
+        return self._state[1].values()
+
+    def items(self):
+        return self._state[1].items()
+
+
+_MISSING = object()
+
+
+class RouteCache:
+    """
+    Satellite positions and routes computed from them, memoised per (routing
+    table version, time bucket). Positions only change once a second, so with
+    the default one second bucket a route is recomputed when the second ticks
+    over or the table's membership changes, instead of on every message. The
+    whole cache is dropped when the table changes.
+
+    Forwarding and multipath sender threads share it: lookups, inserts and
+    the swap to a new bucket happen under a lock, the computation outside it.
+    A value computed for a bucket that has since been replaced is returned
+    but not stored.
+    """
+
+    def __init__(self, table, bucket_seconds=1.0, clock=time.time):
+        self.table = table
+        self.bucket_seconds = bucket_seconds
+        self.clock = clock
+        self._stamp = None
+        self._entries = {}
+        self._lock = threading.Lock()
+        table.subscribe(lambda version, devices: self.clear())
+
+    def clear(self):
+        with self._lock:
+            self._stamp = None
+            self._entries = {}
+
+    def _current(self):
+        """(stamp, devices, entries) for the current table version and bucket; call with the lock held"""
+        version, devices = self.table.snapshot()
+        stamp = (version, int(self.clock() // self.bucket_seconds))
+        if stamp != self._stamp:
+            self._entries = {}
+            self._stamp = stamp
+        return stamp, devices, self._entries
+
+    def _store(self, entries, key, value):
+        """Keep value unless the bucket it was computed for has been replaced; returns the value to use"""
+        with self._lock:
+            if entries is not self._entries:
+                return value
+            return entries.setdefault(key, value)
+
+    def positions(self):
+        """Positions of the devices in the table (satellites only) at the current time bucket"""
+        return self.get('positions', lambda positions: positions)
+
+    def get(self, key, compute):
+        """compute(positions) for the current table and time bucket, computed about once per bucket"""
+        with self._lock:
+            stamp, devices, entries = self._current()
+            value = entries.get(key, _MISSING)
+            positions = entries.get('positions')
+        if value is not _MISSING:
+            CACHE_HITS.inc()
+            return value
+        CACHE_MISSES.inc()
+        if positions is None:
+            now = datetime.fromtimestamp(stamp[1] * self.bucket_seconds)
+            positions = self._store(entries, 'positions',
+                                    update_satellite_positions.calculate_satellite_positions(devices.keys(), now=now))
+        return self._store(entries, key, compute(positions))
@@ -1,15 +1,42 @@
-import random
 import time
 import threading
-import math
 import sys
 
 from flask import Flask, request, jsonify
-import requests
 
-from find_shortest_way import find_shortest_path
-import update_satellite_positions
+from find_shortest_way import find_shortest_path, haversine_alt_dist, parse_route, ROUTE_HEADER
 import network_manager
+import startup
+from routing_table import RoutingTable, RouteCache, load_snapshot, snapshot_path
+import tracing
+import codec
+import framing
+import gossip
+import channel
+import link_budget
+import metrics
+import profiling
+import logging
+from node_logging import get_logger
+from dedup import MESSAGE_ID_HEADER
+import priority
+
+logger = get_logger('satellite')
+MESSAGES_RECEIVED = metrics.counter('messages_received_total', 'Messages received for forwarding')
+MESSAGES_FORWARDED = metrics.counter('messages_forwarded_total', 'Messages forwarded to the next hop')
+FORWARD_FAILURES = metrics.counter('forward_failures_total', 'Forwarding attempts that failed and were retried')
+FORWARD_DROPPED = metrics.counter('forward_dropped_total', 'Messages dropped for lack of a next hop')
+FORWARD_QUEUE_DEPTH = metrics.gauge('forward_queue_depth', 'Messages received but not yet forwarded')
+SOURCE_ROUTED = metrics.counter('source_routed_total', 'Messages forwarded along their X-Route source route')
+FORWARD_SECONDS = metrics.histogram('forward_latency_seconds', 'Time from receipt to successful forward')
+CLASS_FORWARD_SECONDS = {traffic_class: metrics.histogram(f'forward_latency_{traffic_class}_seconds',
+                                                          f'Time from receipt to successful forward of {traffic_class} traffic')
+                         for traffic_class in priority.PRIORITIES}
+BITS_FLIPPED = metrics.counter('bits_flipped_total', 'Bits flipped by simulated channel noise')
+BITS_TRANSMITTED = metrics.counter('bits_transmitted_total', 'Bits passed through simulated channel noise')
+
+FORWARDERS = 16  # threads forwarding received messages, most urgent traffic class first
+FORWARD_TIMEOUT = 1  # seconds, a next hop that doesn't answer in time is down like one that refuses
 
 
 class Satellite:
@@ -21,22 +48,35 @@ class Satellite:
         self.gs_id = -1
         self.wf_id = 0
 
+        # Framed messages are checked and reassembled here, so damaged fragments are resent over one hop
+        self.reassembly = framing.Reassembler()
+        # Received messages wait here by X-Priority class for a free forwarder
+        self.forward_queue = priority.PriorityQueue()
+
         # Initialize Flask app
         self.app = Flask(self.name)
 
-        # routing_table is dictionary of device_id to (host, port) tuple
-        self.routing_table = network_manager.scan_network(device_id=self.sat_id,device_port=self.sat_host[1])
-        self.routing_table[self.sat_id] = self.sat_host
-
-        print(f"Routing table for {self.name}: {self.routing_table}")
+        # routing_table maps device_id to (host, port) tuple, routes are cached until it changes.
+        # It starts from the table saved by the last run; the network is scanned once serving
+        saved = load_snapshot(snapshot_path(self.sat_id))
+        self.unconfirmed = set(saved) - {self.sat_id}
+        self.routing_table = RoutingTable(saved)
+        self.routing_table.set(self.sat_id, self.sat_host)
+        self.routing_table.persist(snapshot_path(self.sat_id))
+        self.routes = RouteCache(self.routing_table)
+        self.gossip = gossip.Gossip(self.sat_id, self.sat_host, gossip.generation(startup.STARTED), self.routing_table,
+                                    rescan=lambda: network_manager.scan_network(device_id=self.sat_id, device_port=self.sat_host[1]))
+
+        logger.info("Routing table for %s: %s", self.name, self.routing_table)
         # Setup routes
         @self.app.route('/', methods=['GET'])
         def get_device():
             # Add device to routing table
             device_id = int(request.args.get('device-id'))
             device_port = request.args.get('device-port')
-            self.routing_table[device_id] = (request.remote_addr, device_port)
-            print(f"Added device {device_id} to routing table: {request.remote_addr}:{device_port}")
+            self.routing_table.set(device_id, (request.remote_addr, int(device_port)))
+            self.gossip.seed({device_id: (request.remote_addr, int(device_port))})
+            logger.info("Added device %d to routing table: %s:%s", device_id, request.remote_addr, device_port)
             return jsonify({
                 "device-type": 1,
                 "device-id": self.sat_id,
@@ -45,12 +85,10 @@ class Satellite:
 
         @self.app.route('/down', methods=['GET'])
         def remove_device():
-            # Remove device from routing table
+            # Sent by nodes that predate gossip, spread it like a failure seen here
             device_id = int(request.args.get('device-id'))
-            if device_id in self.routing_table:
-                del self.routing_table[device_id]
-                print(f"Removed device {device_id} from routing table")
-            print(f"Routing table for {self.name}: {self.routing_table}")
+            self.gossip.report_down(device_id)
+            logger.debug("Routing table for %s: %s", self.name, self.routing_table)
             return jsonify({
                 "message": f"Device {device_id} removed from routing table"
             })
@@ -59,187 +97,217 @@ class Satellite:
         def receive_data():
             headers = request.headers
             data = request.data
-            print(f"Data received at Satellite {self.sat_id} : {data[:24]}")
-            threading.Thread(target=self.forward_data, args=(headers, data)).start()
-            return jsonify({"message": f"Satellite {self.sat_id} received data"})
-
-        print(f"{self.name} listening on {self.sat_host}")
-
-
-    def update_nearest_satellite(self):
-        self.satellites_positions = update_satellite_positions.calculate_satellite_positions(self.routing_table.keys())
-        shortest_path, next_sat_distance = find_shortest_path(self.satellites_positions, self.sat_id, self.gs_id)
-
-        if shortest_path is None:
-            self.next_device = None
-            self.shortest_path = None
-            self.distance = None
-            return
-
-        next_sat_host = self.routing_table[shortest_path[1]]
-        self.next_device = next_sat_host
-        self.shortest_path = shortest_path
-        self.distance = next_sat_distance
+            if framing.FRAGMENT_COUNT_HEADER in headers:
+                if not framing.is_framed(headers):
+                    return jsonify({"message": "Malformed fragment headers"}), 400
+                missing, payload = self.reassembly.receive(headers, data)
+                if payload is None:
+                    return jsonify({"message": f"Satellite {self.sat_id} received fragments", "nack": missing})
+                data = framing.fragment(headers[MESSAGE_ID_HEADER], payload, int(headers[framing.FRAGMENT_SIZE_HEADER]),
+                                        headers.get(codec.FEC_HEADER, codec.DEFAULT_FEC))
+            span = tracing.continue_trace(self.sat_id, headers)
+            MESSAGES_RECEIVED.inc()
+            FORWARD_QUEUE_DEPTH.inc()
+            logger.debug("Data received at Satellite %d : %s", self.sat_id, data[:24])
+            self.forward_queue.put((priority.parse_priority(headers.get(priority.PRIORITY_HEADER)),
+                                    (headers, data, span, time.time())))
+            return jsonify({"message": f"Satellite {self.sat_id} received data", "nack": []})
+
+        gossip.register_gossip_endpoint(self.app, self.gossip)
+        metrics.register_metrics_endpoint(self.app)
+        profiling.register_profiling_endpoints(self.app)
+        logger.info("%s listening on %s", self.name, self.sat_host)
+
+
+    @profiling.timed('route')
+    def shortest_route(self):
+        """
+        (next hop host, path from here, distance to the next hop) along the
+        shortest path to the ground station, or None if there is no path.
+        Forwarders run concurrently, so routes are returned, never stored on
+        the satellite.
+        """
+        shortest_path, next_sat_distance = self.routes.get(
+            'shortest', lambda positions: find_shortest_path(positions, self.sat_id, self.gs_id))
+        next_sat_host = self.routing_table.get(shortest_path[1]) if shortest_path else None
+        if next_sat_host is None:
+            return None
+        return next_sat_host, shortest_path, next_sat_distance
+
+
+    def follow_source_route(self, route):
+        """
+        (next hop host, path from here, distance to the next hop) taken from a
+        source route (multipath copies carry one so they stay on disjoint
+        paths). Returns None, leaving routing to shortest_route, if this
+        satellite is not on the route or the next hop is not in the routing
+        table.
+        """
+        if route is None or self.sat_id not in route[:-1]:
+            return None
+        next_id = route[route.index(self.sat_id) + 1]
+        next_host = self.routing_table.get(next_id)
+        if next_host is None:
+            return None
+        positions = {pos['id']: pos for pos in self.routes.positions()}
+        if self.sat_id not in positions or next_id not in positions:
+            return None
+        SOURCE_ROUTED.inc()
+        return next_host, route[route.index(self.sat_id):], haversine_alt_dist(positions[self.sat_id], positions[next_id])
+
+
+    def direct_route(self, headers):
+        """
+        Route to the X-Destination-IP/Port of a message outside group 8. The
+        path names the destination device if the headers do, and the
+        distance is 0 when either position is unknown.
+        """
+        next_host = headers['X-Destination-IP'], headers['X-Destination-Port']
+        try:
+            destination = int(headers.get('X-Destination-ID'))
+        except (TypeError, ValueError):
+            return next_host, None, 0.0
+        positions = {pos['id']: pos for pos in self.routes.positions()}
+        distance = (haversine_alt_dist(positions[self.sat_id], positions[destination])
+                    if self.sat_id in positions and destination in positions else 0.0)
+        return next_host, [self.sat_id, destination], distance
 
 
-    def simulate_leo_delay(self):
+    def simulate_leo_delay(self, distance):
         """Simulate LEO transmission delay with jitter"""
-        C = 299_792_458 / 1000.0*1000.0  # kilometres per millisecond
-        base_delay = self.distance / C # milliseconds
-        jitter = random.uniform(2, 8) # milliseconds
-        leo_delay = (base_delay + jitter) / 1000 # seconds
-        print(f"Adding {leo_delay:0.4f}s delay")
+        leo_delay = channel.leo_delay(distance)
+        logger.debug("Adding %.4fs delay", leo_delay)
         return leo_delay
 
 
-    def simulate_noise(self, data: bytes) -> bytes:
-        f = 2.4e8 # frequency (2.4GHz)
-        C = 3e8 # speed of light [m/s^2]
-        Pt = 50 # transmit power [50W used by Starlink to overcome high attenuation wrt distance]
-        Pr = Pt * (C/(4 * math.pi * self.distance * 1000 * f))**2 # receiver power using FSPL model
-        Pt = 10*math.log10(Pt) + 30 # convert to dBm
-        Pr = 10*math.log10(Pr) + 30 # convert to dBm
-        print(f"Transmitting power {Pt:0.2f}dBm, Received power {Pr:0.2f}dBm")
-        T = 290 # Kelvin
-        k = 1.38e-23 # Boltzmann constant
-        B = 10e6 # 10MHz
-        Nt = 10*math.log10(T*k*B) + 30 # AWGN for ambient temperature at receiver
-        print(f"Noise due to temperature: {Nt:0.2f}dBm")
-        # Coeficient for transit time noise, influenced by atmospheric conditions
-        sigma = 1e-9 # Excellent conditions in space
-        Nphi = 10*math.log10(1+(2*math.pi*f*sigma)) # Transit time noise
-        print(f"Noise due to transit time: {Nphi:0.2f}dBm")
-        SNR = Pr - (Nt + Nphi) # Signal to Noise Ratio (dBm calculation form)
-        print(f"SNR: {SNR:0.2f}")
-        BER = 0.5*math.erfc(SNR/math.sqrt(2)) # Bit Error Rate, formula valid for BPKS/QPKS modulation
-        print(f"BER: {BER:0.2e}")
-
-        bits = "".join([f"{byte:08b}" for byte in data])
-        flipped_bits = []
-        tally = 0
-        for bit in bits:
-            if random.random() < BER:
-                bit = '1' if bit == '0' else '0' # Flip the bit
-                tally += 1
-            flipped_bits.append(bit)
-        flipped_data = bytes(int("".join(flipped_bits[i:i+8]), base=2) for i in range(0, len(flipped_bits), 8))
-        print(f"flipped {tally} bits")
+    def simulate_noise(self, data: bytes, distance) -> bytes:
+        sigma = link_budget.SPACE_SIGMA  # excellent conditions in space
+        ber = link_budget.ber(distance, sigma)
+        flipped_data, tally = channel.flip_bits(data, ber)
+        BITS_FLIPPED.inc(tally)
+        BITS_TRANSMITTED.inc(len(data) * 8)
+        if logger.isEnabledFor(logging.DEBUG):
+            link = link_budget.closed_form(distance, sigma)
+            logger.debug("Pt %.2fdBm Pr %.2fdBm Nt %.2fdBm Nphi %.2fdBm SNR %.2f BER %.2e, flipped %d bits",
+                         link['Pt'], link['Pr'], link['Nt'], link['Nphi'], link['SNR'], ber, tally)
 
         return flipped_data
 
 
     def hamming_decode_message(self, encoded_data: bytes) -> bytes:
-        decoded_nibbles = []
-
-        # Convert bytes into bit strings
-        bit_string = ''.join(f"{byte:08b}" for byte in encoded_data)
+        return codec.decode_message(encoded_data)
 
-        # Process each 7-bit block
-        for i in range(0, len(bit_string), 7):
-            block = bit_string[i:i+7].ljust(7, '0')  # Ensure block is 7 bits
-            decoded_nibble = self.hamming_decode(block)
-            decoded_nibbles.append(decoded_nibble)
 
-        # Combine decoded nibbles into bytes
-        decoded_message = []
-        for i in range(0, len(decoded_nibbles), 2):
-            if i + 1 < len(decoded_nibbles):
-                high_nibble = int(decoded_nibbles[i], 2) << 4
-                low_nibble = int(decoded_nibbles[i + 1], 2)
-                decoded_message.append(high_nibble | low_nibble)
-
-        return bytes(decoded_message)
-
-
-    def hamming_decode(str, encoded: str) -> str:
-        """Decodes a byte message using Hamming (7,4) code and corrects errors where possible"""
-        p1, p2, d1, p3, d2, d3, d4 = map(int, encoded)
-        c1 = p1 ^ d1 ^ d2 ^ d4  # Syndrome bit 1
-        c2 = p2 ^ d1 ^ d3 ^ d4  # Syndrome bit 2
-        c3 = p3 ^ d2 ^ d3 ^ d4  # Syndrome bit 3
-        err_pos = c1 * 1 + c2 * 2 + c3 * 4
+    def hamming_encode_message(self, data: bytes) -> bytes:
+        """Encodes a byte message using Hamming (7,4) code."""
+        return codec.encode_message(data)
 
-        corrected = list(encoded)
-        if err_pos != 0:  # If there is an error
-            corrected[err_pos-1] = '1' if corrected[err_pos-1] == '0' else '0'
 
-        # Extract original data bits
-        d1, d2, d3, d4 = corrected[2], corrected[4], corrected[5], corrected[6]
-        return f"{d1}{d2}{d3}{d4}"
+    def run_forwarder(self):
+        """Forward queued messages one at a time, alerts before normal traffic before bulk"""
+        while True:
+            _, message = self.forward_queue.get()
+            try:
+                self.forward_data(*message)
+            except Exception:
+                logger.exception("Forwarding failed")
+            finally:
+                # The one place a message leaves the queue depth, however forwarding ended
+                FORWARD_QUEUE_DEPTH.dec()
 
 
-    def hamming_encode(self, data: str) -> str:
-        """Encodes a 4-bit binary string using Hamming (7,4) code."""
-        d1, d2, d3, d4 = map(int, data)
-        p1 = d1 ^ d2 ^ d4  # Parity 1
-        p2 = d1 ^ d3 ^ d4  # Parity 2
-        p3 = d2 ^ d3 ^ d4  # Parity 3
-        return f"{p1}{p2}{d1}{p3}{d2}{d3}{d4}"
+    @profiling.timed('forward')
+    def forward_data(self, headers, data, span=None, received_at=None):
 
+        import requests  # imported once serving, forwarders are the only users
 
-    def hamming_encode_message(self, data: bytes) -> bytes:
-        """Encodes a byte message using Hamming (7,4) code."""
-        encoded_bits = []
-        for byte in data:
-            tophalf = (byte >> 4) & 0xF  # Upper 4 bits
-            encoded_bits.append(self.hamming_encode(f"{tophalf:04b}"))
-            bottomhalf = byte & 0xF      # Lower 4 bits
-            encoded_bits.append(self.hamming_encode(f"{bottomhalf:04b}"))
-
-        encoded_message = []
-        current_byte = ""
-        for bit_group in encoded_bits:
-            current_byte += bit_group
-            while len(current_byte) >= 8:
-                encoded_message.append(int(current_byte[:8], 2))
-                current_byte = current_byte[8:]
-        if current_byte:
-            encoded_message.append(int(current_byte.ljust(8, "0"), 2))
-        return bytes(encoded_message)
-
-
-    def forward_data(self, headers, data):
+        if span is not None and 'queue' not in span.stages:
+            span.add('queue', time.time() - span.arrival)
 
         if 'X-Destination-ID' in headers:
-            print(f"\n-----\nDestination ID: {headers['X-Destination-ID']}\n-----\n")
+            logger.debug("Destination ID: %s", headers['X-Destination-ID'])
 
-        if headers['X-Group-ID'] == '8':
-            self.update_nearest_satellite()
+        routed = headers['X-Group-ID'] == '8'
+        if routed:
+            with tracing.stage(span, 'route'):
+                route = self.follow_source_route(parse_route(headers.get(ROUTE_HEADER))) or self.shortest_route()
             # decoded_data = self.hamming_decode_message(data)
             # # check if message is corrupt (maybe implement AES if time)
             # encoded_data = self.hamming_encode_message(decoded_data)
-            # data = self.simulate_noise(encoded_data)
+            # data = self.simulate_noise(encoded_data, distance)
         else:
-            self.next_device = headers['X-Destination-IP'], headers['X-Destination-Port']
+            route = self.direct_route(headers)
 
-        if not self.next_device:
-            print("No next device to forward the message.")
+        if route is None:
+            FORWARD_DROPPED.inc()
+            logger.warning("No next device to forward the message.")
             return
 
+        (next_ip, next_port), path, distance = route
         try:
-            next_ip, next_port = self.next_device
             # Forward the HTTP request to the next device
-            print(f"Forwarding data to {next_ip}:{next_port}")
-            time.sleep(self.simulate_leo_delay())
-            response = requests.post(f"http://{next_ip}:{next_port}/", headers=headers, data=data, verify=False,proxies={"http": None, "https": None})
-            time.sleep(self.simulate_leo_delay())
-            print(f"Forwarded data to {next_ip}:{next_port}, response: {response.status_code}")
+            logger.debug("Forwarding data to %s:%s", next_ip, next_port)
+            with tracing.stage(span, 'delay'):
+                time.sleep(self.simulate_leo_delay(distance))
+            if span is not None:
+                headers = dict(headers)
+                headers[tracing.TRACE_HEADER] = span.header()
+            url = f"http://{next_ip}:{next_port}/"
+            if isinstance(data, list):
+                # Reassembled fragments, the next hop NACKs any it could not check. Every round goes over
+                # one connection, so a ground station worker that has the NACKed message gets the rest
+                with requests.Session() as session:
+                    missing = framing.send(lambda body: session.post(url, headers=headers, data=body, verify=False, timeout=FORWARD_TIMEOUT,
+                                                                     proxies={"http": None, "https": None}), data)
+                status = f"fragments missing {missing}" if missing else "all fragments received"
+            else:
+                status = requests.post(url, headers=headers, data=data, verify=False, timeout=FORWARD_TIMEOUT,
+                                       proxies={"http": None, "https": None}).status_code
+            time.sleep(self.simulate_leo_delay(distance))
+            MESSAGES_FORWARDED.inc()
+            if received_at is not None:
+                elapsed = time.time() - received_at
+                FORWARD_SECONDS.observe(elapsed)
+                CLASS_FORWARD_SECONDS[priority.parse_priority(headers.get(priority.PRIORITY_HEADER))].observe(elapsed)
+            logger.debug("Forwarded data to %s:%s, response: %s", next_ip, next_port, status)
         except Exception as e:
-            print(f"Error forwarding data: {e}")
-            network_manager.send_down_device(self.routing_table, self.shortest_path[1], self.sat_id)
-            if self.shortest_path[1] in self.routing_table:
-                del self.routing_table[int(self.shortest_path[1])]
-                print(f"Removed satellite {self.shortest_path[1]} from routing table")
-            self.forward_data(headers, data)
+            FORWARD_FAILURES.inc()
+            logger.warning("Error forwarding data to %s:%s: %s", next_ip, next_port, e)
+            if path is not None:
+                # Only the hop that was tried is known to be down
+                self.gossip.report_down(int(path[1]))
+            if not routed:
+                # Addressed to one device, there is no other way to it
+                FORWARD_DROPPED.inc()
+                return
+            # The source route is broken, route the retry normally
+            headers = {key: value for key, value in headers.items() if key != ROUTE_HEADER}
+            self.forward_data(headers, data, span, received_at)
 
 
     def start_flask_app(self):
+        for forwarder in range(FORWARDERS):
+            threading.Thread(target=self.run_forwarder, name=f'forwarder-{forwarder}', daemon=True).start()
         threading.Thread(target=self.app.run, kwargs={
             "host": self.sat_host[0],
             "port": self.sat_host[1],
             "use_reloader": False,
             "debug": False
         }, daemon=True).start()
+        startup.wait_until_serving(self.sat_host[1])
+        threading.Thread(target=self.warm_up, daemon=True).start()
+
+
+    def warm_up(self):
+        """Startup work deferred until the node is serving: link budget tables and the first network scan"""
+        link_budget.warm()
+        found = network_manager.scan_network(device_id=self.sat_id, device_port=self.sat_host[1])
+        self.routing_table.refresh(found, self.unconfirmed)
+        startup.discovered(len(found))
+        # From here on membership changes arrive by gossip instead of rescans and /down floods
+        self.gossip.seed(dict(self.routing_table.items()))
+        self.gossip.start()
+        logger.info("Routing table for %s: %s", self.name, self.routing_table)
 
 
 if __name__ == "__main__":
@@ -254,12 +322,8 @@ if __name__ == "__main__":
         satellite = Satellite(sat_id)
         satellite.start_flask_app()
         print(f"Satellite {sat_id} Online.")
+        # The first scan and gossip run in the background from start_flask_app
         while True:
-            network_manager.scan_network(
-                device_id=satellite.sat_id, 
-                device_port=satellite.sat_host[1], 
-                exclude_list={f"{ip}:{port}" for ip, port in satellite.routing_table.values()}
-            )
             time.sleep(60)
     except KeyboardInterrupt:
         print("-"*30+"\nSimulation stopped by user\n"+"-"*30)
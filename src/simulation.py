@@ -0,0 +1,492 @@
+import argparse
+import heapq
+import itertools
+import json
+import math
+import random
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import channel
+import codec
+import framing
+import link_budget
+import update_satellite_positions
+from find_shortest_way import find_shortest_path, find_disjoint_paths, haversine_alt_dist
+
+GS_ID = -1
+WF_ID = 0
+
+
+class Message:
+    __slots__ = ('id', 'created', 'data', 'flips', 'hops', 'route', 'fec', 'sigma')
+
+    def __init__(self, message_id, created, data, route=None, fec=codec.DEFAULT_FEC, sigma=None):
+        self.id = message_id
+        self.fec = fec
+        self.sigma = sigma  # uplink transit time noise when the message was sent
+        self.created = created
+        self.data = data
+        self.flips = 0
+        self.hops = [WF_ID]
+        self.route = route
+
+
+class Simulator:
+    """
+    Discrete-event simulation of the wind farm -> satellites -> ground station
+    network in one process. A virtual clock and an event heap replace the
+    nodes' sleeps and HTTP requests; routing, satellite motion, channel noise
+    and Hamming coding are the same functions the live nodes use.
+
+    Each node keeps its own view of which devices are up, like its routing
+    table: a failed next hop is only discovered when a transfer to it fails,
+    after which every node learns it is down (the live nodes gossip this to
+    everyone within a few one-second rounds), and views are refreshed from
+    the live set every rescan_interval.
+    Messages that cannot be routed from the wind farm wait in its outbox and
+    are resent with the next status update, as the live node does.
+
+    With paths > 1 every message is sent as that many copies over node-disjoint
+    paths, each source routed (X-Route) and seeing its own channel noise; the
+    ground station keeps the first intact copy and counts the rest as
+    duplicates. A copy whose next hop on its route is not in a node's view,
+    or whose transfer fails, falls back to shortest path routing.
+
+    With a fragment_size the noisy hops carry framed messages: each fragment
+    is FEC encoded and CRC checked on its own, and the receiver NACKs the
+    damaged ones, which are resent (with fresh noise) one round trip later,
+    up to framing.MAX_ROUNDS attempts. A message that still has damaged
+    fragments after that is kept in the wind farm's outbox, or dropped by a
+    satellite.
+
+    fec names the FEC scheme every message is encoded with, or 'adaptive' to
+    pick the cheapest one meeting codec.FEC_TARGET at the message's uplink
+    noise, as the live wind farm does (over every hop of the shortest path
+    with every-hop noise).
+
+    Payloads are not RSA encrypted: a residual bit error after decoding makes
+    the live ground station's decryption fail, so a message counts as
+    delivered only if it decodes bit-exact. Since Hamming decoding does not
+    depend on the data, one encoded payload is reused for every message and
+    only decoded when bits were actually flipped.
+    """
+
+    def __init__(self, satellites=range(1, 11), interval=5.0, payload_bytes=None, turbines=30,
+                 noise='first-hop', http_overhead=0.002, detect_delay=0.01, rescan_interval=60.0,
+                 start=datetime(2024, 1, 1), seed=None, paths=1, fragment_size=None, fec=codec.DEFAULT_FEC):
+        self.satellites = list(satellites)
+        self.paths = paths
+        self.fragment_size = fragment_size
+        self.fec = fec
+        self.interval = interval
+        self.noise = noise
+        self.http_overhead = http_overhead
+        self.detect_delay = detect_delay
+        self.rescan_interval = rescan_interval
+        self.start = start
+        self.random = random.Random(seed)
+        self.np_random = np.random.default_rng(seed)
+
+        if payload_bytes is None:
+            payload_bytes = encrypted_size(turbines)
+        self.payload = self.random.randbytes(payload_bytes)
+        self.payload_array = np.frombuffer(self.payload, dtype=np.uint8)
+        # Encoded payload and (with framing) one stand-in fragment per FEC scheme;
+        # fragments differ only in content
+        self.encoded = {scheme: codec.encode(self.payload, scheme) for scheme in codec.FEC_SCHEMES}
+        if fragment_size:
+            self.fragments = -(-payload_bytes // fragment_size)
+            self.fragment = {scheme: framing.fragment('simulated', self.payload[:fragment_size], fragment_size, scheme)[0]
+                             for scheme in codec.FEC_SCHEMES}
+        self._path_cache = {}
+
+        self.now = 0.0
+        self._events = []
+        self._sequence = itertools.count()
+        self._message_ids = itertools.count()
+        self._positions_cache = {}
+        self._route_cache = {}
+
+        devices = [GS_ID, WF_ID] + self.satellites
+        self.up = set(devices)
+        self.views = {device: set(devices) for device in devices}
+        self.outbox = []
+        self.delivered_ids = set()
+
+        self.stats = {
+            'sent': 0, 'delivered': 0, 'corrupted': 0, 'dropped': 0,
+            'bits_transmitted': 0, 'bits_flipped': 0, 'residual_bit_errors': 0,
+            'messages_with_flips': 0, 'messages_corrected': 0,
+            'failures_injected': 0, 'failures_detected': 0, 'reroutes': 0,
+            'copies': 0, 'duplicates': 0, 'source_routed': 0,
+            'fragments_sent': 0, 'fragments_retransmitted': 0, 'fragment_giveups': 0,
+        }
+        self.fec_counts = dict.fromkeys(codec.FEC_SCHEMES, 0)
+        self.latencies = []
+        self.hop_counts = {}
+
+    # ----------------------------------------------------------------- engine
+
+    def schedule(self, delay, callback, *args):
+        heapq.heappush(self._events, (self.now + delay, next(self._sequence), callback, args))
+
+    def run(self, duration):
+        """Advance the virtual clock by duration seconds, returns the report"""
+        wall_started = time.perf_counter()
+        end = self.now + duration
+        self.schedule(0.0, self.farm_tick)
+        self.schedule(self.rescan_interval, self.rescan)
+        while self._events and self._events[0][0] <= end:
+            self.now, _, callback, args = heapq.heappop(self._events)
+            callback(*args)
+        self.now = end
+        return self.report(duration, time.perf_counter() - wall_started)
+
+    # --------------------------------------------------------------- failures
+
+    def fail(self, device, at, until=None):
+        """Take a satellite down at `at` seconds, and back up at `until` if given"""
+        self.stats['failures_injected'] += 1
+        self.schedule(at - self.now, self._set_down, device)
+        if until is not None:
+            self.schedule(until - self.now, self._set_up, device)
+
+    def random_failures(self, duration, mtbf, mttr):
+        """Exponentially distributed up and down times for every satellite"""
+        for device in self.satellites:
+            t = self.random.expovariate(1 / mtbf)
+            while t < duration:
+                repair = t + self.random.expovariate(1 / mttr)
+                self.fail(device, t, repair)
+                t = repair + self.random.expovariate(1 / mtbf)
+
+    def _set_down(self, device):
+        self.up.discard(device)
+
+    def _set_up(self, device):
+        # A restarting node scans the network, so it learns the live set and everyone learns of it
+        self.up.add(device)
+        self.views[device] = set(self.up)
+        for view in self.views.values():
+            view.add(device)
+
+    def rescan(self):
+        for device in self.up:
+            self.views[device] = set(self.up)
+        self.schedule(self.rescan_interval, self.rescan)
+
+    # ---------------------------------------------------------------- routing
+
+    def positions(self, devices):
+        """
+        Device positions at the virtual time and a cache key for them. Positions
+        repeat every 6 minutes at 1 s resolution, so a simulated day only
+        computes each (second, device set) once
+        """
+        clock = self.start + timedelta(seconds=self.now)
+        key = ((clock.minute % 6) * 60 + clock.second, devices)
+        positions = self._positions_cache.get(key)
+        if positions is None:
+            positions = self._positions_cache[key] = update_satellite_positions.calculate_satellite_positions(
+                devices, now=clock)
+        return key, positions
+
+    def route(self, device):
+        """(next hop, distance) from device to the ground station over its own view, or (None, None)"""
+        view = self.views[device]
+        if GS_ID not in view:
+            return None, None
+        positions_key, positions = self.positions(frozenset(view))
+        key = (positions_key, device)
+        route = self._route_cache.get(key)
+        if route is None:
+            path, distance = find_shortest_path(positions, device, GS_ID)
+            route = self._route_cache[key] = (path[1], distance) if path else (None, None)
+        return route
+
+    def next_hop(self, message, device):
+        """Next hop along the message's source route if device's view allows it, else its shortest path"""
+        route = message.route
+        if route is not None and device in route[:-1]:
+            next_hop = route[route.index(device) + 1]
+            view = self.views[device]
+            if next_hop in view:
+                _, positions = self.positions(frozenset(view))
+                positions = {pos['id']: pos for pos in positions}
+                self.stats['source_routed'] += 1
+                return next_hop, haversine_alt_dist(positions[device], positions[next_hop])
+        return self.route(device)
+
+    def copies(self, message):
+        """The message as one copy per disjoint path from the wind farm, or just itself"""
+        if self.paths <= 1 or GS_ID not in self.views[WF_ID]:
+            return [message]
+        _, positions = self.positions(frozenset(self.views[WF_ID]))
+        routes = find_disjoint_paths(positions, WF_ID, GS_ID, self.paths)
+        if len(routes) <= 1:
+            return [message]
+        self.stats['copies'] += len(routes) - 1
+        return [Message(message.id, message.created, message.data, path, message.fec, message.sigma) for path, _ in routes]
+
+    def select_fec(self, sigma):
+        """FEC scheme for a new message, see the wind farm's select_fec"""
+        if self.fec != 'adaptive':
+            return self.fec
+        if GS_ID not in self.views[WF_ID]:
+            return codec.DEFAULT_FEC
+        key, positions = self.positions(frozenset(self.views[WF_ID]))
+        distances = self._path_cache.get(key)
+        if distances is None:
+            path, _ = find_shortest_path(positions, WF_ID, GS_ID)
+            by_id = {pos['id']: pos for pos in positions}
+            distances = self._path_cache[key] = [
+                haversine_alt_dist(by_id[a], by_id[b]) for a, b in zip(path, path[1:])] if path else []
+        if not distances:
+            return codec.DEFAULT_FEC
+        hops = [(distances[0], sigma)]
+        if self.noise == 'every-hop':
+            hops += [(distance, link_budget.SPACE_SIGMA) for distance in distances[1:]]
+        return codec.choose_fec(link_budget.path_ber(hops), self.fragment_size or len(self.payload))
+
+    # ------------------------------------------------------------------ nodes
+
+    def farm_tick(self):
+        message = Message(next(self._message_ids), self.now, None)
+        self.stats['sent'] += 1
+        pending, self.outbox = self.outbox + [message], []
+        for queued in pending:
+            self.encode(queued)
+            for copy in self.copies(queued):
+                self.transmit(copy, WF_ID)
+        self.schedule(self.interval, self.farm_tick)
+
+    def encode(self, message):
+        """
+        Draw the uplink conditions and FEC for a (re)send from the wind farm,
+        which encodes a message afresh every time it comes out of the outbox
+        """
+        message.sigma = channel.ground_sigma(self.random)
+        message.fec = self.select_fec(message.sigma)
+        message.data = self.encoded[message.fec]
+        message.flips = 0
+        self.fec_counts[message.fec] += 1
+
+    def transmit(self, message, sender):
+        next_hop, distance = self.next_hop(message, sender)
+        if next_hop is None:
+            if sender == WF_ID:
+                self.outbox.append(message)
+            else:
+                self.stats['dropped'] += 1
+            return
+
+        delay = channel.leo_delay(distance, self.random) + self.http_overhead
+        if sender == WF_ID or self.noise == 'every-hop':
+            sigma = message.sigma if sender == WF_ID else link_budget.SPACE_SIGMA
+            ber = link_budget.ber(distance, sigma)
+            if self.fragment_size:
+                rounds = self.selective_repeat(ber, message.fec)
+                if rounds is None:
+                    if sender == WF_ID:
+                        self.outbox.append(message)
+                    else:
+                        self.stats['dropped'] += 1
+                    return
+                # Each extra round waits for the NACK and the resent fragments
+                for _ in range(rounds - 1):
+                    delay += 2 * channel.leo_delay(distance, self.random) + self.http_overhead
+            else:
+                message.data, flips = channel.flip_bits(message.data, ber, self.np_random)
+                message.flips += flips
+                self.stats['bits_flipped'] += flips
+                self.stats['bits_transmitted'] += len(message.data) * 8
+
+        self.schedule(delay, self.arrive, message, sender, next_hop)
+
+    def selective_repeat(self, ber, fec):
+        """Rounds needed to get every fragment across a hop intact, or None if MAX_ROUNDS is not enough"""
+        pending = self.fragments
+        for attempt in range(framing.MAX_ROUNDS):
+            self.stats['fragments_sent'] += pending
+            if attempt:
+                self.stats['fragments_retransmitted'] += pending
+            damaged = 0
+            for _ in range(pending):
+                noisy, flips = channel.flip_bits(self.fragment[fec], ber, self.np_random)
+                self.stats['bits_flipped'] += flips
+                self.stats['bits_transmitted'] += len(noisy) * 8
+                if flips and framing.unpack('simulated', noisy, self.fragment_size, fec) is None:
+                    damaged += 1
+            pending = damaged
+            if not pending:
+                return attempt + 1
+        self.stats['fragment_giveups'] += 1
+        return None
+
+    def arrive(self, message, sender, device):
+        if device not in self.up:
+            # The sender's request fails; it drops the device from every routing table and reroutes
+            self.schedule(self.detect_delay, self.detect_failure, message, sender, device)
+            return
+        message.hops.append(device)
+        if device == GS_ID:
+            self.receive(message)
+        else:
+            self.transmit(message, device)
+
+    def detect_failure(self, message, sender, device):
+        self.stats['failures_detected'] += 1
+        self.stats['reroutes'] += 1
+        message.route = None
+        for view in self.views.values():
+            view.discard(device)
+        if sender in self.up:
+            if sender == WF_ID:
+                self.encode(message)
+            self.transmit(message, sender)
+        else:
+            self.stats['dropped'] += 1
+
+    def receive(self, message):
+        if message.id in self.delivered_ids:
+            self.stats['duplicates'] += 1
+            return
+        intact = True
+        if message.flips:
+            self.stats['messages_with_flips'] += 1
+            decoded = codec.decode(message.data, message.fec)
+            errors = int(np.unpackbits(np.frombuffer(decoded, dtype=np.uint8) ^ self.payload_array).sum())
+            self.stats['residual_bit_errors'] += errors
+            intact = errors == 0
+            if intact:
+                self.stats['messages_corrected'] += 1
+        if not intact:
+            self.stats['corrupted'] += 1
+            return
+        self.stats['delivered'] += 1
+        self.delivered_ids.add(message.id)
+        self.latencies.append(self.now - message.created)
+        hops = len(message.hops) - 1
+        self.hop_counts[hops] = self.hop_counts.get(hops, 0) + 1
+
+    # ----------------------------------------------------------------- report
+
+    def report(self, duration, wall_seconds):
+        stats = self.stats
+        latencies = np.array(self.latencies)
+        in_flight = sum(1 for event in self._events if event[2] in (self.arrive, self.detect_failure))
+        payload_bits = len(self.payload) * 8
+        return {
+            'simulated_s': duration,
+            'wall_s': round(wall_seconds, 3),
+            'speedup': round(duration / wall_seconds) if wall_seconds else None,
+            'messages': {
+                'sent': stats['sent'],
+                'delivered': stats['delivered'],
+                'corrupted': stats['corrupted'],
+                'dropped': stats['dropped'],
+                'queued': len(self.outbox),
+                'in_flight': in_flight,
+                'copies': stats['copies'],
+                'duplicates': stats['duplicates'],
+                'source_routed_hops': stats['source_routed'],
+            },
+            'delivery_ratio': round(stats['delivered'] / stats['sent'], 6) if stats['sent'] else None,
+            'latency_s': {
+                'mean': float(latencies.mean()) if latencies.size else None,
+                'p50': float(np.percentile(latencies, 50)) if latencies.size else None,
+                'p90': float(np.percentile(latencies, 90)) if latencies.size else None,
+                'p99': float(np.percentile(latencies, 99)) if latencies.size else None,
+                'max': float(latencies.max()) if latencies.size else None,
+            },
+            'hops': dict(sorted(self.hop_counts.items())),
+            'bits': {
+                'transmitted': stats['bits_transmitted'],
+                'flipped': stats['bits_flipped'],
+                'channel_ber': stats['bits_flipped'] / stats['bits_transmitted'] if stats['bits_transmitted'] else None,
+                'messages_with_flips': stats['messages_with_flips'],
+                'messages_corrected': stats['messages_corrected'],
+                'residual_bit_errors': stats['residual_bit_errors'],
+                'residual_ber': (stats['residual_bit_errors'] / (stats['messages_with_flips'] * payload_bits)
+                                 if stats['messages_with_flips'] else None),
+            },
+            'fec': self.fec_counts,
+            'fragments': {
+                'sent': stats['fragments_sent'],
+                'retransmitted': stats['fragments_retransmitted'],
+                'giveups': stats['fragment_giveups'],
+            },
+            'failures': {
+                'injected': stats['failures_injected'],
+                'detected': stats['failures_detected'],
+                'reroutes': stats['reroutes'],
+            },
+        }
+
+
+def encrypted_size(turbines):
+    """Bytes of an RSA encrypted status update with this many turbines (245 byte chunks -> 256)"""
+    sample = {
+        "timestamp": time.time(),
+        "turbine_id": WF_ID,
+        "epoch": 1_700_000_000_000,
+        "seq": 100_000,
+        "turbines": {
+            f"turbine {i+1}": {"temperature": 10.25, "wind_speed": 9.13, "pressure": 101325.42, "power_output": 3012.57}
+            for i in range(turbines)
+        },
+    }
+    return math.ceil(len(json.dumps(sample).encode()) / 245) * 256
+
+
+def parse_ids(text):
+    """'1-3,7' -> [1, 2, 3, 7]"""
+    ids = []
+    for part in text.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            ids.extend(range(int(first), int(last) + 1))
+        elif part:
+            ids.append(int(part))
+    return ids
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Discrete-event simulation of the satellite network")
+    parser.add_argument('--duration', type=float, default=86400, help="simulated seconds (default one day)")
+    parser.add_argument('--satellites', default='1-10', help="satellite ids, e.g. 1-10 or 1,2,5")
+    parser.add_argument('--interval', type=float, default=5.0, help="seconds between wind farm status updates")
+    parser.add_argument('--turbines', type=int, default=30, help="turbines per status update (sets payload size)")
+    parser.add_argument('--noise', choices=['first-hop', 'every-hop'], default='first-hop',
+                        help="apply channel noise on the wind farm uplink only (as the live nodes do) or on every hop")
+    parser.add_argument('--fail', action='append', default=[], metavar='ID:START[:END]',
+                        help="take a satellite down at START seconds (until END), repeatable")
+    parser.add_argument('--mtbf', type=float, help="mean seconds between random failures of each satellite")
+    parser.add_argument('--mttr', type=float, default=600.0, help="mean seconds to repair a random failure")
+    parser.add_argument('--paths', type=int, default=1, help="copies of each message over node-disjoint paths")
+    parser.add_argument('--detect-delay', type=float, default=0.01,
+                        help="seconds for a sender to notice a failed next hop (the live request timeout is 1 s)")
+    parser.add_argument('--fragment-size', type=int, help="frame messages into CRC checked fragments of this many bytes")
+    parser.add_argument('--fec', choices=['adaptive', *codec.FEC_SCHEMES], default=codec.DEFAULT_FEC,
+                        help="FEC scheme for every message, or adaptive")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--output', help="write the report as JSON")
+    args = parser.parse_args()
+
+    simulator = Simulator(parse_ids(args.satellites), interval=args.interval, turbines=args.turbines,
+                          noise=args.noise, detect_delay=args.detect_delay, seed=args.seed, paths=args.paths,
+                          fragment_size=args.fragment_size, fec=args.fec)
+    for spec in args.fail:
+        device, *window = (float(value) for value in spec.split(':'))
+        simulator.fail(int(device), window[0], window[1] if len(window) > 1 else None)
+    if args.mtbf:
+        simulator.random_failures(args.duration, args.mtbf, args.mttr)
+
+    result = simulator.run(args.duration)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
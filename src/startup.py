@@ -0,0 +1,51 @@
+import os
+import socket
+import time
+
+import metrics
+from node_logging import get_logger
+
+logger = get_logger('startup')
+SERVING_SECONDS = metrics.gauge('startup_serving_seconds', 'Seconds from process start until the HTTP server accepted connections')
+DISCOVERY_SECONDS = metrics.gauge('startup_discovery_seconds', 'Seconds from process start until the first network scan finished')
+
+
+def _process_start():
+    """Wall clock time this process was started, from /proc where available, otherwise now"""
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, IndexError, ValueError):
+        return time.time()
+
+
+STARTED = _process_start()
+
+
+def since_start():
+    return time.time() - STARTED
+
+
+def wait_until_serving(port, timeout=10.0):
+    """Block until the node's HTTP server accepts connections on port, then record time-to-serve"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            break
+        except OSError:
+            time.sleep(0.01)
+    else:
+        logger.warning("Nothing listening on port %d after %.0fs", port, timeout)
+        return
+    SERVING_SECONDS.set(since_start())
+    logger.info("Serving on port %d, %.3fs after process start", port, SERVING_SECONDS.value)
+
+
+def discovered(devices):
+    """Record time-to-discovery once the first background scan has merged its results"""
+    DISCOVERY_SECONDS.set(since_start())
+    logger.info("Network scan found %d devices, %.3fs after process start", devices, DISCOVERY_SECONDS.value)
@@ -0,0 +1,405 @@
+import glob
+import heapq
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from node_logging import get_logger
+
+logger = get_logger('storage')
+
+DATA_DIR = os.environ.get('DATA_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data'))
+DEFAULT_DB_PATH = os.path.join(DATA_DIR, 'turbine_data.sqlite')
+
+FIELDS = ['timestamp', 'received_at', 'turbine_id', 'turbine', 'temperature', 'pressure', 'wind_speed', 'power_output']
+PARTITION_PREFIX = 'readings_'
+
+
+def partition_name(timestamp):
+    """Name of the daily (UTC) partition table holding a given timestamp"""
+    return PARTITION_PREFIX + datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime('%Y%m%d')
+
+
+def shard_path(db_path, shard):
+    """Database file written by one ground station worker when ingestion is sharded"""
+    root, ext = os.path.splitext(db_path)
+    return f'{root}.shard{shard}{ext}'
+
+
+def shard_paths(db_path):
+    """db_path if it exists, then the shard files next to it in shard order"""
+    root, ext = os.path.splitext(db_path)
+    pattern = re.compile(re.escape(root) + r'\.shard(\d+)' + re.escape(ext) + '$')
+    shards = sorted((int(match.group(1)), path) for path in glob.glob(f'{glob.escape(root)}.shard*{ext}')
+                    if (match := pattern.match(path)))
+    return ([db_path] if os.path.exists(db_path) else []) + [path for _, path in shards]
+
+
+def message_to_rows(data, received_at=None):
+    """Flatten one decrypted turbine message into storage rows"""
+    if received_at is None:
+        received_at = time.time()
+    timestamp = data['timestamp']
+    farm_id = data['turbine_id']
+    return [
+        (timestamp, received_at, farm_id, turbine_name,
+         turbine_data['temperature'], turbine_data['pressure'],
+         turbine_data['wind_speed'], turbine_data['power_output'])
+        for turbine_name, turbine_data in data['turbines'].items()
+    ]
+
+
+class TelemetryStore:
+    """
+    Append-only turbine telemetry store backed by SQLite in WAL mode.
+
+    Rows are handed to a background writer thread which batches them by size
+    (batch_size rows) or age (flush_interval seconds) and commits each batch in
+    a single transaction. A batch that fails to commit is logged and dropped,
+    and the next flush() raises the error. Data is partitioned into one table
+    per UTC day and kept across restarts. Readers use their own connection and
+    see a consistent snapshot of all partitions for the duration of a read
+    transaction.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, batch_size=5000, flush_interval=1.0, readonly=False):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.readonly = readonly
+        self._queue = queue.Queue()
+        self._writer = None
+        self._partitions = set()
+        self._closed = False
+        self._error = None  # first failed batch since the last flush()
+
+        if not readonly:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            conn = self._connect()
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    # ------------------------------------------------------------------ writes
+
+    def start(self):
+        """Start the background writer thread"""
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name='telemetry-writer', daemon=True)
+            self._writer.start()
+        return self
+
+    def append(self, data, received_at=None):
+        """Queue one decrypted message for storage, returns the number of rows queued"""
+        rows = message_to_rows(data, received_at)
+        self.append_rows(rows)
+        return len(rows)
+
+    def append_rows(self, rows):
+        if self._closed:
+            raise RuntimeError('TelemetryStore is closed')
+        if self._writer is None:
+            self.start()
+        self._queue.put(rows)
+
+    def flush(self):
+        """Block until every row queued so far has been written, raises if a batch failed to commit"""
+        if self._writer is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+        error, self._error = self._error, None
+        if error is not None:
+            raise RuntimeError(f'Telemetry rows were dropped: {error}') from error
+
+    def close(self):
+        if self._writer is not None and not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+
+    def _write_loop(self):
+        conn = self._connect()
+        pending = []
+        waiters = []
+        deadline = None
+        running = True
+        while running:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False  # flush interval elapsed
+
+            if item is None:
+                running = False
+            elif isinstance(item, threading.Event):
+                waiters.append(item)
+            elif item is not False:
+                if not pending:
+                    deadline = time.monotonic() + self.flush_interval
+                pending.extend(item)
+                if len(pending) < self.batch_size:
+                    continue
+
+            if pending:
+                try:
+                    self._write_batch(conn, pending)
+                except Exception as e:
+                    # Disk full, locked database or a bad row: the writer carries on with the next batch
+                    logger.exception("Dropped a batch of %d telemetry rows", len(pending))
+                    if self._error is None:
+                        self._error = e
+                    self._partitions.clear()  # tables created in the rolled back transaction are gone
+                pending = []
+            deadline = None
+            for waiter in waiters:
+                waiter.set()
+            waiters = []
+        conn.close()
+
+    def _write_batch(self, conn, rows):
+        by_partition = {}
+        for row in rows:
+            by_partition.setdefault(partition_name(row[0]), []).append(row)
+        placeholders = ', '.join('?' * len(FIELDS))
+        with conn:
+            for table, table_rows in by_partition.items():
+                if table not in self._partitions:
+                    conn.execute(
+                        f'CREATE TABLE IF NOT EXISTS {table} ('
+                        'timestamp REAL, received_at REAL, turbine_id INTEGER, turbine TEXT, '
+                        'temperature REAL, pressure REAL, wind_speed REAL, power_output REAL)'
+                    )
+                    conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_ts ON {table} (timestamp)')
+                    self._partitions.add(table)
+                conn.executemany(f'INSERT INTO {table} VALUES ({placeholders})', table_rows)
+
+    # ------------------------------------------------------------------- reads
+
+    @contextmanager
+    def snapshot(self):
+        """Read connection holding one transaction, so all reads see the same data"""
+        if self.readonly:
+            conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True, timeout=30)
+        else:
+            conn = self._connect()
+        try:
+            conn.execute('BEGIN')
+            yield conn
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    @staticmethod
+    def partitions(conn):
+        """Partition table names in chronological order"""
+        cursor = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE ? ORDER BY name",
+            (PARTITION_PREFIX + '%',)
+        )
+        return [name for (name,) in cursor]
+
+    def query(self, start=None, end=None, turbine=None):
+        """Rows (as dicts) with start <= timestamp < end, optionally for one turbine name"""
+        start = 0.0 if start is None else start
+        end = float('inf') if end is None else end
+        first = partition_name(start) if start > 0 else ''
+        last = partition_name(end) if end != float('inf') else '~'
+        result = []
+        with self.snapshot() as conn:
+            for table in self.partitions(conn):
+                if not first <= table <= last:
+                    continue
+                sql = f'SELECT {", ".join(FIELDS)} FROM {table} WHERE timestamp >= ? AND timestamp < ?'
+                params = [start, end]
+                if turbine is not None:
+                    sql += ' AND turbine = ?'
+                    params.append(turbine)
+                result.extend(dict(zip(FIELDS, row)) for row in conn.execute(sql + ' ORDER BY rowid', params))
+        return result
+
+    def scan(self, start=None, end=None):
+        """Like query() but yields rows lazily, for reading more data than fits in memory"""
+        start = 0.0 if start is None else start
+        end = float('inf') if end is None else end
+        first = partition_name(start) if start > 0 else ''
+        last = partition_name(end) if end != float('inf') else '~'
+        with self.snapshot() as conn:
+            for table in self.partitions(conn):
+                if not first <= table <= last:
+                    continue
+                cursor = conn.execute(
+                    f'SELECT {", ".join(FIELDS)} FROM {table} WHERE timestamp >= ? AND timestamp < ? ORDER BY rowid',
+                    (start, end)
+                )
+                for row in cursor:
+                    yield dict(zip(FIELDS, row))
+
+    def latest(self, turbine):
+        """Most recent row (as a dict) for one turbine name, or None"""
+        with self.snapshot() as conn:
+            for table in reversed(self.partitions(conn)):
+                row = conn.execute(
+                    f'SELECT {", ".join(FIELDS)} FROM {table} WHERE turbine = ? ORDER BY rowid DESC LIMIT 1',
+                    (turbine,)
+                ).fetchone()
+                if row is not None:
+                    return dict(zip(FIELDS, row))
+        return None
+
+    def latest_per_turbine(self):
+        """
+        Most recent row of every turbine plus the tail offset they were read at,
+        used to bootstrap incremental readers before they switch to read_since
+        """
+        latest = {}
+        with self.snapshot() as conn:
+            tables = self.partitions(conn)
+            for table in reversed(tables):
+                cursor = conn.execute(
+                    f'SELECT {", ".join(FIELDS)} FROM {table} WHERE rowid IN '
+                    f'(SELECT MAX(rowid) FROM {table} GROUP BY turbine_id, turbine)'
+                )
+                for row in cursor:
+                    row = dict(zip(FIELDS, row))
+                    latest.setdefault((row['turbine_id'], row['turbine']), row)
+            offset = self._tail_offset(conn, tables)
+        return list(latest.values()), offset
+
+    def window_with_offset(self, start):
+        """Rows with timestamp >= start and the tail offset, read from one snapshot"""
+        rows = []
+        with self.snapshot() as conn:
+            tables = self.partitions(conn)
+            first = partition_name(start)
+            for table in tables:
+                if table < first:
+                    continue
+                cursor = conn.execute(
+                    f'SELECT {", ".join(FIELDS)} FROM {table} WHERE timestamp >= ? ORDER BY rowid', (start,)
+                )
+                rows.extend(dict(zip(FIELDS, row)) for row in cursor)
+            offset = self._tail_offset(conn, tables)
+        return rows, offset
+
+    def read_since(self, offset):
+        """
+        Rows committed after offset, partition by partition in insertion order,
+        and the new offset. An offset is {partition: last rowid read}, so rows
+        committed late into an earlier partition, e.g. just after midnight, are
+        still picked up; None reads from the beginning.
+        """
+        offset = offset or {}
+        rows = []
+        new_offset = {}
+        with self.snapshot() as conn:
+            for table in self.partitions(conn):
+                last = offset.get(table, 0)
+                cursor = conn.execute(
+                    f'SELECT rowid, {", ".join(FIELDS)} FROM {table} WHERE rowid > ? ORDER BY rowid', (last,)
+                )
+                for rowid, *row in cursor:
+                    rows.append(dict(zip(FIELDS, row)))
+                    last = rowid
+                new_offset[table] = last
+        return rows, new_offset
+
+    @staticmethod
+    def _tail_offset(conn, tables):
+        return {table: conn.execute(f'SELECT MAX(rowid) FROM {table}').fetchone()[0] or 0 for table in tables}
+
+    def count(self):
+        with self.snapshot() as conn:
+            return sum(conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in self.partitions(conn))
+
+    def drop_partitions_before(self, timestamp):
+        """Retention: drop whole daily partitions older than timestamp"""
+        cutoff = partition_name(timestamp)
+        conn = self._connect()
+        with conn:
+            for table in self.partitions(conn):
+                if table < cutoff:
+                    conn.execute(f'DROP TABLE {table}')
+                    self._partitions.discard(table)
+        conn.close()
+
+
+def _by_arrival(row):
+    return row['received_at']
+
+
+class ShardedStore:
+    """
+    Read-only view over a telemetry store and the shards written next to it
+    by ground station workers, with the TelemetryStore read API. Shards are
+    looked up on every read, so one created later is picked up. Rows from
+    different shards are merged in received_at order, and offsets for
+    read_since are kept per shard.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._stores = {}
+
+    def stores(self):
+        """(path, TelemetryStore) for every file holding data, in shard order"""
+        paths = shard_paths(self.db_path)
+        for path in paths:
+            if path not in self._stores:
+                self._stores[path] = TelemetryStore(path, readonly=True)
+        return [(path, self._stores[path]) for path in paths]
+
+    def query(self, start=None, end=None, turbine=None):
+        rows = [row for _, store in self.stores() for row in store.query(start, end, turbine)]
+        return sorted(rows, key=_by_arrival)
+
+    def scan(self, start=None, end=None):
+        return heapq.merge(*(store.scan(start, end) for _, store in self.stores()), key=_by_arrival)
+
+    def latest(self, turbine):
+        rows = [row for _, store in self.stores() if (row := store.latest(turbine)) is not None]
+        return max(rows, key=_by_arrival, default=None)
+
+    def latest_per_turbine(self):
+        latest = {}
+        offset = {}
+        for path, store in self.stores():
+            rows, offset[path] = store.latest_per_turbine()
+            for row in rows:
+                key = (row['turbine_id'], row['turbine'])
+                if key not in latest or latest[key]['received_at'] < row['received_at']:
+                    latest[key] = row
+        return list(latest.values()), offset
+
+    def window_with_offset(self, start):
+        rows = []
+        offset = {}
+        for path, store in self.stores():
+            shard_rows, offset[path] = store.window_with_offset(start)
+            rows.extend(shard_rows)
+        return sorted(rows, key=_by_arrival), offset
+
+    def read_since(self, offset):
+        """Rows committed after offset, a {shard path: offset} dict or None, and the new offset"""
+        offset = offset or {}
+        rows = []
+        new_offset = {}
+        for path, store in self.stores():
+            shard_rows, new_offset[path] = store.read_since(offset.get(path))
+            rows.extend(shard_rows)
+        return sorted(rows, key=_by_arrival), new_offset
+
+    def count(self):
+        return sum(store.count() for _, store in self.stores())
@@ -0,0 +1,80 @@
+import abc
+import sqlite3
+import threading
+import time
+
+
+def turbine_number(turbine_name):
+    """'turbine 12' -> 12"""
+    return int(turbine_name.split(' ')[1])
+
+
+class TailingIndex(abc.ABC):
+    """
+    In-memory view of the telemetry store kept current by tailing it.
+
+    The view is bootstrapped once from the store and then only reads the rows
+    committed after the last rowid it saw in each partition, so the cost of a
+    refresh is proportional to new rows rather than to the size of the history.
+    Refreshes are rate limited, so many dashboards polling at once share a
+    single tail read. Subclasses implement bootstrap() and apply().
+    """
+
+    def __init__(self, store, min_refresh_interval=0.5):
+        self.store = store
+        self.min_refresh_interval = min_refresh_interval
+        self._offset = None
+        self._bootstrapped = False
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def bootstrap(self):
+        """Load initial state from the store, returns the offset it was read at"""
+
+    @abc.abstractmethod
+    def apply(self, rows):
+        """Update the view with rows committed after the last offset, in commit order"""
+
+    def refresh(self, force=False):
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_refresh < self.min_refresh_interval:
+                return
+            self._last_refresh = now
+            try:
+                if not self._bootstrapped:
+                    self._offset = self.bootstrap()
+                    self._bootstrapped = True
+                    return
+                rows, self._offset = self.store.read_since(self._offset)
+            except sqlite3.OperationalError:
+                # Store not created yet, nothing to index
+                return
+            if rows:
+                self.apply(rows)
+
+
+class LatestIndex(TailingIndex):
+    """Latest reading per turbine, keyed by (farm id, turbine number)"""
+
+    def __init__(self, store, min_refresh_interval=0.5):
+        super().__init__(store, min_refresh_interval)
+        self._latest = {}
+
+    def bootstrap(self):
+        rows, offset = self.store.latest_per_turbine()
+        self.apply(rows)
+        return offset
+
+    def apply(self, rows):
+        for row in rows:
+            self._latest[(row['turbine_id'], turbine_number(row['turbine']))] = row
+
+    def get(self, turbine_id, farm_id=0):
+        self.refresh()
+        return self._latest.get((farm_id, turbine_id))
+
+    def all(self):
+        self.refresh()
+        return dict(self._latest)
@@ -0,0 +1,127 @@
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+import metrics
+
+TRACE_HEADER = 'X-Trace'
+
+# Fraction of messages the wind farm starts a trace for, every other node only
+# extends traces that arrive with the header, so unsampled messages cost nothing
+SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.01'))
+
+
+class Span:
+    """
+    One node's hop in a trace: arrival and departure wall-clock times plus the
+    time spent in each named stage. Hops travel with the message in the
+    X-Trace header as a JSON list of {"n": node, "a": arrival, "d": departure,
+    "s": {stage: seconds}}.
+    """
+
+    def __init__(self, node_id, hops, arrival=None):
+        self.node_id = node_id
+        self.hops = hops
+        self.arrival = time.time() if arrival is None else arrival
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def finish(self, departure=None):
+        """All hops including this one"""
+        hop = {
+            'n': self.node_id,
+            'a': round(self.arrival, 6),
+            'd': round(time.time() if departure is None else departure, 6),
+            's': {name: round(seconds, 6) for name, seconds in self.stages.items()},
+        }
+        return self.hops + [hop]
+
+    def header(self, departure=None):
+        return json.dumps(self.finish(departure), separators=(',', ':'))
+
+
+def start_trace(node_id, arrival=None, sample_rate=None):
+    """A new Span for a message originating here, or None if it is not sampled"""
+    rate = SAMPLE_RATE if sample_rate is None else sample_rate
+    if rate <= 0 or random.random() >= rate:
+        return None
+    return Span(node_id, [], arrival)
+
+
+def continue_trace(node_id, headers, arrival=None):
+    """A Span extending the trace carried in the headers, or None if there is none"""
+    value = headers.get(TRACE_HEADER)
+    if not value:
+        return None
+    try:
+        hops = json.loads(value)
+    except ValueError:
+        return None
+    return Span(node_id, hops if isinstance(hops, list) else [], arrival)
+
+
+def stage(span, name):
+    """span.stage(name), or a no-op context when the message is not traced"""
+    return span.stage(name) if span is not None else nullcontext()
+
+
+class TraceStats:
+    """
+    Aggregates completed traces at the ground station into histograms of
+    per-node residence time (departure - arrival), per-link transfer time
+    (arrival - previous departure, which includes simulated delay and HTTP),
+    per-stage time, and end-to-end time. Traces of messages that could not be
+    decoded are counted separately but still contribute their timings.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.traces = 0
+        self.undelivered = 0
+        self._lock = threading.Lock()
+
+    def _observe(self, key, value):
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = metrics.Histogram(key, key)
+        histogram.observe(max(0.0, value))
+
+    def record(self, hops, delivered=True):
+        if not hops:
+            return
+        with self._lock:
+            self.traces += 1
+            if not delivered:
+                self.undelivered += 1
+            previous = None
+            for hop in hops:
+                node = hop.get('n')
+                self._observe(f"node {node}", hop['d'] - hop['a'])
+                for stage, seconds in hop.get('s', {}).items():
+                    self._observe(f"stage {node}:{stage}", seconds)
+                if previous is not None:
+                    self._observe(f"link {previous['n']}->{node}", hop['a'] - previous['d'])
+                previous = hop
+            self._observe("end_to_end", hops[-1]['d'] - hops[0]['a'])
+
+    def summary(self):
+        with self._lock:
+            return {
+                'traces': self.traces,
+                'undelivered': self.undelivered,
+                'sample_rate': SAMPLE_RATE,
+                'histograms': {key: histogram.summary() for key, histogram in sorted(self.histograms.items())},
+            }
@@ -4,8 +4,10 @@ import numpy as np
 import os
 import csv  # Added import for csv
 
+ASSETS_DIR = os.environ.get('ASSETS_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), "assets"))
+
 def read_static_positions():
-    csv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "assets", "device_positions.csv")
+    csv_path = os.path.join(ASSETS_DIR, "device_positions.csv")
 
     static_positions = []
     with open(csv_path, mode='r', newline='') as csvfile:
@@ -34,15 +36,16 @@ def haversine_distance(lat1, lon1, lat2, lon2):
 
     return R * c
 
-def calculate_satellite_positions(device_ids):
+def calculate_satellite_positions(device_ids, now=None):
     ground_station, windfarm = read_static_positions()
 
     # Calculate middle point
     mid_lat = (ground_station['lat'] + windfarm['lat']) / 2
     mid_long = (ground_station['long'] + windfarm['long']) / 2
 
-    # Get current time
-    now = datetime.now()
+    # Get current time (the simulator passes its virtual clock)
+    if now is None:
+        now = datetime.now()
     time_factor = (now.minute % 6) * 60 + now.second
 
     # Parameters for satellite positioning
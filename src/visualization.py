@@ -1,8 +1,13 @@
-from flask import Flask, render_template, jsonify
+from flask import Flask, Response, render_template, jsonify, request, stream_with_context
+import time
 import update_satellite_positions
 from find_shortest_way import find_shortest_path
-import csv
 import os
+import storage
+import metrics
+from telemetry_index import LatestIndex, TailingIndex, turbine_number
+from history import HistoryIndex
+from live_updates import Broadcaster, Ticker
 from wind_farm import WindTurbineNode
 
 base_path = os.path.dirname(os.path.dirname(__file__))
@@ -11,6 +16,11 @@ template_path = os.path.join(base_path, 'templates')
 devices_path = os.path.join(base_path, 'assets', 'devices_ip.csv')
 
 app = Flask(__name__, template_folder=template_path, static_folder=static_path)
+metrics.register_metrics_endpoint(app)
+telemetry_store = storage.ShardedStore()
+latest_index = LatestIndex(telemetry_store)
+history_index = HistoryIndex(telemetry_store)
+broadcaster = Broadcaster()
 
 # Remove initialization of WindTurbineNode
 # turbine_node = WindTurbineNode()
@@ -19,8 +29,7 @@ app = Flask(__name__, template_folder=template_path, static_folder=static_path)
 def index():
     return render_template('index.html')
 
-@app.route('/get_positions')
-def get_positions():
+def named_positions():
     positions = update_satellite_positions.calculate_satellite_positions(range(1,11))
     for pos in positions:
         if pos['id'] == 0:
@@ -29,15 +38,12 @@ def get_positions():
             pos['name'] = "Ground Station"
         else:
             pos['name'] = f"Satellite {pos['id']}"
+    return positions
 
-    return jsonify(positions)
-
-@app.route('/get_shortest_path')
-def get_shortest_path():
-    positions = update_satellite_positions.calculate_satellite_positions(range(1,11))
+def shortest_path_coordinates(positions):
     path_nodes = find_shortest_path(positions, 0, -1)[0]
     if not path_nodes:
-        return jsonify([])
+        return []
 
     path_coordinates = []
     for node in path_nodes:
@@ -46,37 +52,110 @@ def get_shortest_path():
             'lat': float(node_pos['lat']),
             'long': float(node_pos['long'])
         })
+    return path_coordinates
 
-    return jsonify(path_coordinates)
+@app.route('/get_positions')
+def get_positions():
+    return jsonify(named_positions())
+
+@app.route('/get_shortest_path')
+def get_shortest_path():
+    positions = update_satellite_positions.calculate_satellite_positions(range(1,11))
+    return jsonify(shortest_path_coordinates(positions))
 
 @app.route('/dashboard/<int:turbine_id>')
 def dashboard(turbine_id):
     return render_template('dashboard.html', turbine_id=turbine_id)
 
+def format_reading(reading):
+    return {
+        'timestamp': float(reading['timestamp']),
+        'temperature': float(reading['temperature']),
+        'pressure': float(reading['pressure']),
+        'wind_speed': float(reading['wind_speed']),
+        'power_output': float(reading['power_output'])
+    }
+
 @app.route('/get_turbine_data/<int:turbine_id>')
 def get_turbine_data(turbine_id):
-    csv_file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'turbine_data.csv')
-    if not os.path.exists(csv_file_path):
+    if not storage.shard_paths(storage.DEFAULT_DB_PATH):
         return jsonify({'error': 'No data available'}), 404
 
-    # Read the latest data for the specified turbine
-    latest_data = None
-    with open(csv_file_path, mode='r') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            if int(row['turbine'].split(' ')[1]) == turbine_id:
-                latest_data = row
+    # Latest data for the specified turbine, O(1) from the index
+    latest_data = latest_index.get(turbine_id)
 
     if latest_data:
-        return jsonify({
-            'timestamp': float(latest_data['timestamp']),
-            'temperature': float(latest_data['temperature']),
-            'pressure': float(latest_data['pressure']),
-            'wind_speed': float(latest_data['wind_speed']),
-            'power_output': float(latest_data['power_output'])
-        })
+        return jsonify(format_reading(latest_data))
     else:
         return jsonify({'error': 'Turbine ID not found'}), 404
 
+@app.route('/get_fleet_data')
+def get_fleet_data():
+    if not storage.shard_paths(storage.DEFAULT_DB_PATH):
+        return jsonify({'error': 'No data available'}), 404
+
+    fleet = []
+    for (farm_id, turbine_id), reading in sorted(latest_index.all().items()):
+        fleet.append({'farm_id': farm_id, 'turbine_id': turbine_id, **format_reading(reading)})
+    return jsonify(fleet)
+
+@app.route('/get_history')
+def get_history():
+    """
+    Downsampled history for one or more turbines.
+    Query parameters: turbines (comma separated ids), start/end (unix seconds,
+    default the last hour) and bucket (seconds, default 60).
+    """
+    try:
+        turbine_ids = [int(t) for t in request.args.get('turbines', '').split(',') if t.strip()]
+        end = float(request.args.get('end', time.time()))
+        start = float(request.args.get('start', end - 3600))
+        bucket = float(request.args.get('bucket', 60))
+    except ValueError:
+        return jsonify({'error': 'Invalid query parameters'}), 400
+    if not turbine_ids or end <= start or bucket <= 0:
+        return jsonify({'error': 'Invalid query parameters'}), 400
+
+    series, bucket = history_index.query(turbine_ids, start, end, bucket)
+    return jsonify({'start': start, 'end': end, 'bucket': bucket, 'turbines': series})
+
+class ReadingFeed(TailingIndex):
+    """Pushes readings to "reading:<farm id>:<turbine id>" subscribers as they are ingested"""
+
+    def bootstrap(self):
+        rows, offset = self.store.latest_per_turbine()
+        self.apply(rows)
+        return offset
+
+    def apply(self, rows):
+        for row in rows:
+            topic = f"reading:{row['turbine_id']}:{turbine_number(row['turbine'])}"
+            broadcaster.publish_state(topic, {'reading': format_reading(row)})
+
+reading_feed = ReadingFeed(telemetry_store)
+
+def live_tick():
+    """Compute positions and the path once for all subscribers"""
+    positions = named_positions()
+    broadcaster.publish_state('positions', {str(pos['id']): pos for pos in positions})
+    broadcaster.publish_state('path', {'coordinates': shortest_path_coordinates(positions)})
+    reading_feed.refresh(force=True)
+
+live_ticker = Ticker(broadcaster, live_tick, interval=0.5)
+
+@app.route('/events')
+def events():
+    """
+    Server-sent events. Query parameter topics is a comma separated list of
+    "positions", "path" and "reading:<farm id>:<turbine id>".
+    """
+    topics = [t for t in request.args.get('topics', 'positions,path').split(',') if t]
+    live_ticker.ensure_running()
+    return Response(
+        stream_with_context(broadcaster.stream(topics)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
@@ -0,0 +1,190 @@
+import csv
+import math
+import os
+import random
+import threading
+import time
+
+
+import metrics
+from node_logging import get_logger
+
+logger = get_logger('weather')
+REFRESHES = metrics.counter('weather_refreshes_total', 'Successful weather provider refreshes')
+REFRESH_FAILURES = metrics.counter('weather_refresh_failures_total', 'Failed weather provider refreshes')
+FALLBACK_READS = metrics.counter('weather_fallback_reads_total', 'Weather reads served by the offline fallback')
+WEATHER_AGE = metrics.gauge('weather_age_seconds', 'Age of the cached weather when last read')
+
+# open-meteo (default), file or synthetic
+PROVIDER = os.environ.get('WEATHER_PROVIDER', 'open-meteo')
+OPEN_METEO_URL = os.environ.get('OPEN_METEO_URL', "https://api.open-meteo.com/v1/forecast")
+TTL = float(os.environ.get('WEATHER_TTL', '300'))
+TIMEOUT = float(os.environ.get('WEATHER_TIMEOUT', '5'))
+
+
+class WeatherProvider:
+    """
+    Source of current conditions as {'wind_speed': m/s, 'temperature': degC,
+    'pressure': Pa}. fetch() may block or raise; get() is what the wind farm
+    calls per snapshot, and for local providers it is just fetch()
+    """
+
+    def fetch(self):
+        raise NotImplementedError
+
+    def get(self):
+        return self.fetch()
+
+    def start(self):
+        return self
+
+
+class OpenMeteoProvider(WeatherProvider):
+    def __init__(self, latitude, longitude, base_url=OPEN_METEO_URL, timeout=TIMEOUT):
+        self.url = f"{base_url}?latitude={latitude}&longitude={longitude}&current=temperature_2m,surface_pressure,wind_speed_10m"
+        self.timeout = timeout
+
+    def fetch(self):
+        import requests  # not needed until the first refresh, which runs in the background
+        response = requests.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        current = response.json()['current']
+        return {
+            'wind_speed': current['wind_speed_10m'] / 3.6,
+            'temperature': current['temperature_2m'],
+            'pressure': current['surface_pressure'] * 100
+        }
+
+
+class FileProvider(WeatherProvider):
+    """Replays a CSV with wind_speed (m/s), temperature (degC) and pressure (Pa) columns, one row per fetch, looping"""
+
+    def __init__(self, path):
+        with open(path, newline='') as f:
+            self.rows = [
+                {key: float(row[key]) for key in ('wind_speed', 'temperature', 'pressure')}
+                for row in csv.DictReader(f)
+            ]
+        if not self.rows:
+            raise ValueError(f"No weather rows in {path}")
+        self.index = 0
+        self._lock = threading.Lock()
+
+    def fetch(self):
+        with self._lock:
+            row = self.rows[self.index]
+            self.index = (self.index + 1) % len(self.rows)
+        return dict(row)
+
+
+class SyntheticProvider(WeatherProvider):
+    """
+    Stochastic weather for offline runs: wind speed is an Ornstein-Uhlenbeck
+    process around mean_wind (so gusts persist for a while rather than jumping
+    every sample), temperature follows a daily cycle, and pressure drifts
+    slowly around its mean.
+    """
+
+    def __init__(self, mean_wind=9.0, wind_std=2.5, wind_timescale=600.0, mean_temperature=10.0,
+                 temperature_swing=3.0, mean_pressure=101300.0, pressure_std=400.0, seed=None):
+        self.mean_wind = mean_wind
+        self.wind_std = wind_std
+        self.wind_timescale = wind_timescale
+        self.mean_temperature = mean_temperature
+        self.temperature_swing = temperature_swing
+        self.mean_pressure = mean_pressure
+        self.pressure_std = pressure_std
+        self.random = random.Random(seed)
+        self.wind_speed = mean_wind
+        self.pressure = mean_pressure
+        self.last = None
+        self._lock = threading.Lock()
+
+    def fetch(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            if self.last is not None:
+                # Exact OU update over the elapsed time, valid for any step size
+                decay = math.exp(-max(0.0, now - self.last) / self.wind_timescale)
+                spread = math.sqrt(1 - decay ** 2)
+                self.wind_speed = (self.mean_wind + (self.wind_speed - self.mean_wind) * decay
+                                   + self.wind_std * spread * self.random.gauss(0, 1))
+                self.pressure = (self.mean_pressure + (self.pressure - self.mean_pressure) * decay
+                                 + self.pressure_std * spread * self.random.gauss(0, 1))
+            self.last = now
+            hour = (now % 86400) / 3600
+            temperature = self.mean_temperature + self.temperature_swing * math.sin(2 * math.pi * (hour - 9) / 24)
+            return {
+                'wind_speed': max(0.0, self.wind_speed),
+                'temperature': temperature,
+                'pressure': self.pressure,
+            }
+
+
+class CachedWeather(WeatherProvider):
+    """
+    Serves the last good reading of a slow provider without blocking. A
+    background thread refreshes it every ttl seconds (retrying sooner after a
+    failure). Readings older than max_stale, or none at all yet, are served
+    by the fallback provider instead, so callers always get a value.
+    """
+
+    def __init__(self, provider, ttl=TTL, max_stale=None, fallback=None, retry_interval=30.0):
+        self.provider = provider
+        self.ttl = ttl
+        self.max_stale = 4 * ttl if max_stale is None else max_stale
+        self.fallback = fallback
+        self.retry_interval = min(retry_interval, ttl)
+        self.value = None
+        self.fetched_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop, name='weather-refresh', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def refresh(self):
+        """Fetch from the provider now, returns True on success"""
+        try:
+            value = self.provider.fetch()
+        except Exception as e:
+            REFRESH_FAILURES.inc()
+            logger.warning("Weather refresh failed, keeping last known value: %s", e)
+            return False
+        self.value, self.fetched_at = value, time.time()
+        REFRESHES.inc()
+        return True
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            ok = self.refresh()
+            self._stop.wait(self.ttl if ok else self.retry_interval)
+
+    def fetch(self):
+        value, fetched_at = self.value, self.fetched_at
+        if value is not None:
+            age = time.time() - fetched_at
+            WEATHER_AGE.set(age)
+            if age <= self.max_stale or self.fallback is None:
+                return dict(value)
+        if self.fallback is not None:
+            FALLBACK_READS.inc()
+            return self.fallback.fetch()
+        return None
+
+
+def make_provider(latitude, longitude, name=PROVIDER):
+    """Weather source for a wind farm, chosen by WEATHER_PROVIDER; call start() on the result"""
+    if name == 'synthetic':
+        return SyntheticProvider()
+    if name == 'file':
+        return FileProvider(os.environ['WEATHER_FILE'])
+    if name == 'open-meteo':
+        return CachedWeather(OpenMeteoProvider(latitude, longitude), fallback=SyntheticProvider())
+    raise ValueError(f"Unknown WEATHER_PROVIDER {name!r}, expected open-meteo, file or synthetic")
@@ -1,42 +1,110 @@
 import time
 import json
 import random
-import requests
 import os
-import math
 import queue
+import argparse
+import uuid
+import heapq
+import itertools
+from collections import defaultdict
+import csv
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import sys
 
 from flask import Flask, request, jsonify
-from find_shortest_way import find_shortest_path
-import rsa
+from find_shortest_way import find_shortest_path, find_disjoint_paths, format_route, ROUTE_HEADER
 import threading
 import update_satellite_positions
 from wind_turbine_calculator import WindTurbineCalculator
 import network_manager
+import startup
+from routing_table import RoutingTable, RouteCache, load_snapshot, snapshot_path
+import tracing
+import codec
+import framing
+import gossip
+import channel
+import link_budget
+import weather
+import replay
+import priority
+from dedup import MESSAGE_ID_HEADER, SEQUENCE_HEADER, format_sequence
+import numpy as np
+import metrics
+import profiling
+import logging
+from node_logging import get_logger
+
+logger = get_logger('wind_farm')
+MESSAGES_SENT = metrics.counter('messages_sent_total', 'Status updates sent to the first hop')
+BYTES_SENT = metrics.counter('bytes_sent_total', 'Encoded payload bytes sent to the first hop')
+SEND_FAILURES = metrics.counter('send_failures_total', 'Status updates that failed to reach the first hop')
+OUTBOX_DEPTH = metrics.gauge('outbox_queue_depth', 'Status updates waiting for a path to the ground station')
+COPIES_SENT = metrics.counter('multipath_copies_sent_total', 'Copies sent over additional disjoint paths')
+BITS_FLIPPED = metrics.counter('bits_flipped_total', 'Bits flipped by simulated channel noise')
+BITS_TRANSMITTED = metrics.counter('bits_transmitted_total', 'Bits passed through simulated channel noise')
+GATEWAY_FARMS = metrics.gauge('gateway_farms', 'Farms hosted by this gateway')
+GATEWAY_TURNS = metrics.counter('gateway_turns_total', 'Farm turns (one snapshot plus a bounded outbox retry) run by the gateway')
+TURN_LAG_SECONDS = metrics.histogram('gateway_turn_lag_seconds', 'How late a farm turn started after it was due')
+PRIORITY_MESSAGES = {traffic_class: metrics.counter(f'{traffic_class}_messages_sent_total', f'Status updates sent as {traffic_class} traffic')
+                     for traffic_class in priority.PRIORITIES}
+FEC_MESSAGES = {scheme: metrics.counter(f'fec_{scheme}_messages_total', f'Status updates encoded with {scheme} FEC')
+                for scheme in codec.FEC_SCHEMES}
+# A turbine reporting power this far (kW) from what its own wind, temperature
+# and pressure predict makes the whole status update an 'alert' message
+ALERT_POWER_RESIDUAL = 1000.0
 
 
 class WindTurbineNode:
-    def __init__(self):
+    def __init__(self, num_turbines=30, multipath=None, fragment_size=None, fec=codec.DEFAULT_FEC, bulk_rate=None,
+                 bulk_burst=None):
         self.name = "Offshore Windfarm"
         self.wf_id = 0  # wind farm always has ID 0
+        self.farm_id = self.wf_id  # id the readings are reported under, see HostedFarm
         self.wf_host = ('0.0.0.0', 33000)  # wind farm always uses port 33000
         self.gs_id = -1  # ground station always has ID -1
-        self.num_turbines = 30
-        self.queue = queue.Queue()
-
-        # Initialize routing table
-        self.routing_table = network_manager.scan_network(device_id=self.wf_id, device_port=self.wf_host[1])
-        self.routing_table[self.wf_id] = self.wf_host
-        print(f"Routing table for {self.name}: {self.routing_table}")
+        self.num_turbines = num_turbines
+        # Outbox by traffic class: queued alerts are resent first, the stale rest drains as bulk
+        # at up to bulk_rate messages per second (None for no limit)
+        self.queue = priority.PriorityQueue()
+        self.bulk = priority.TokenBucket(bulk_rate, bulk_burst or bulk_rate) if bulk_rate else None
+        # Snapshots are numbered per reporting farm id within this run's epoch
+        self.epoch = gossip.generation(startup.STARTED)
+        self.sequences = defaultdict(itertools.count)
+
+        # Number of node-disjoint paths each message priority is sent over
+        self.multipath = multipath or {}
+        self.copy_senders = ThreadPoolExecutor(max(self.multipath.values(), default=1), thread_name_prefix='multipath')
+        # Payload bytes per fragment when framing is on, None sends one Hamming encoded frame
+        self.fragment_size = fragment_size
+        # FEC scheme name, or 'adaptive' to pick one per message from the path's link budget
+        self.fec = fec
+
+        # Initialize routing table from the one saved by the last run, routes are cached until it
+        # changes. The network is scanned in the background once serving
+        saved = load_snapshot(snapshot_path(self.wf_id))
+        self.unconfirmed = set(saved) - {self.wf_id}
+        self.routing_table = RoutingTable(saved)
+        self.routing_table.set(self.wf_id, self.wf_host)
+        self.routing_table.persist(snapshot_path(self.wf_id))
+        self.routes = RouteCache(self.routing_table)
+        self.gossip = gossip.Gossip(self.wf_id, self.wf_host, gossip.generation(startup.STARTED), self.routing_table,
+                                    rescan=lambda: network_manager.scan_network(device_id=self.wf_id, device_port=self.wf_host[1]))
+        logger.info("Routing table for %s: %s", self.name, self.routing_table)
 
         self.turbine = WindTurbineCalculator()
-        self.public_key = self.load_rsa_key()
+        self.http = None  # the requests module once the first update is sent, a farm gateway shares a session
 
         positions = update_satellite_positions.read_static_positions()
         self.latitude = positions[1]['lat']
         self.longitude = positions[1]['long']
         self.altitude = positions[1]['alt']
 
+        # Refreshed in the background, so snapshots never wait on the network
+        self.weather = weather.make_provider(self.latitude, self.longitude).start()
+
         self.app = Flask(self.name)
 
         @self.app.route('/', methods=['GET'])
@@ -44,8 +112,9 @@ class WindTurbineNode:
             # Add device to routing table
             device_id = int(request.args.get('device-id'))
             device_port = request.args.get('device-port')
-            self.routing_table[device_id] = (request.remote_addr, int(device_port))
-            print(f"Added device {device_id} to routing table: {request.remote_addr}:{device_port}")
+            self.routing_table.set(device_id, (request.remote_addr, int(device_port)))
+            self.gossip.seed({device_id: (request.remote_addr, int(device_port))})
+            logger.info("Added device %d to routing table: %s:%s", device_id, request.remote_addr, device_port)
             return jsonify({
                 "device-type": 0,
                 "device-id": self.wf_id,
@@ -54,34 +123,25 @@ class WindTurbineNode:
 
         @self.app.route('/down', methods=['GET'])
         def remove_device():
-            # Remove device from routing table
+            # Sent by nodes that predate gossip, spread it like a failure seen here
             device_id = int(request.args.get('device-id'))
-            if device_id in self.routing_table:
-                del self.routing_table[device_id]
-                print(f"Removed device {device_id} from routing table")
-            print(f"Routing table for {self.name}: {self.routing_table}")
+            self.gossip.report_down(device_id)
+            logger.debug("Routing table for %s: %s", self.name, self.routing_table)
             return jsonify({
                 "message": f"Device {device_id} removed from routing table"
             })
 
+        gossip.register_gossip_endpoint(self.app, self.gossip)
+        metrics.register_metrics_endpoint(self.app)
+        profiling.register_profiling_endpoints(self.app)
 
-    def get_weather_data(self):
-        """Get real weather data from Open-Meteo API with added jitter for realism"""
-        url = f"https://api.open-meteo.com/v1/forecast?latitude={self.latitude}&longitude={self.longitude}&current=temperature_2m,surface_pressure,wind_speed_10m"
 
+    def get_weather_data(self):
+        """Current weather from the configured provider (cached Open-Meteo by default)"""
         try:
-            response = requests.get(url)
-            data = response.json()
-            current = data['current']
-
-            return {
-                'wind_speed': current['wind_speed_10m'] / 3.6,
-                'temperature': current['temperature_2m'],
-                'pressure': current['surface_pressure'] * 100
-            }
-
+            return self.weather.get()
         except Exception as e:
-            print(f"Weather API error: {e}")
+            logger.warning("Weather provider error: %s", e)
             return None
 
     def generate_turbine_data(self):
@@ -94,7 +154,7 @@ class WindTurbineNode:
 
             data = {
                 "timestamp": time.time(),
-                "turbine_id": self.wf_id,
+                "turbine_id": self.farm_id,
                 "turbines": {
                     f"turbine {i+1}": {
                         "temperature": round(weather_data['temperature'] + random.uniform(-0.5, 0.5), 2),
@@ -112,12 +172,12 @@ class WindTurbineNode:
             return data
 
         except Exception as e:
-            print(f"Error generating turbine data: {e}")
+            logger.warning("Error generating turbine data: %s", e)
             # Fallback to random data if simulation fails
 
             data = {
                 "timestamp": time.time(),
-                "turbine_id": self.wf_id,
+                "turbine_id": self.farm_id,
                 "turbines": {
                     f"turbine {i+1}": {
                         "temperature": round(random.uniform(-10, 40), 2),
@@ -130,7 +190,22 @@ class WindTurbineNode:
             return data
 
 
+    @functools.cached_property
+    def public_key(self):
+        """Loaded on first use, warm_up() does that once the node is serving"""
+        return self.load_rsa_key()
+
+
+    def session(self):
+        """What status updates are posted with, requests is imported on first use to keep it off the startup path"""
+        if self.http is None:
+            import requests
+            self.http = requests
+        return self.http
+
+
     def load_rsa_key(self, private=False):
+        import rsa
         keypath = os.path.join(os.path.dirname(os.path.dirname(__file__)), "keys")
 
         if private:
@@ -142,9 +217,20 @@ class WindTurbineNode:
         return key
 
 
+    def outbox_changed(self):
+        OUTBOX_DEPTH.set(self.queue.qsize())
+
+
+    def route_positions(self, positions):
+        """Device positions this farm routes over"""
+        return positions
+
+
+    @profiling.timed('route')
     def update_nearest_satellite(self):
-        self.satellites_positions = update_satellite_positions.calculate_satellite_positions(self.routing_table.keys())
-        shortest_path, next_sat_distance = find_shortest_path(self.satellites_positions, self.wf_id, self.gs_id)
+        self.satellites_positions = self.routes.positions()
+        shortest_path, next_sat_distance = self.routes.get(
+            ('shortest', self.farm_id), lambda positions: find_shortest_path(self.route_positions(positions), self.wf_id, self.gs_id))
 
         if shortest_path is None:
             self.next_satellite = None
@@ -152,9 +238,9 @@ class WindTurbineNode:
             self.distance = None
             return
 
-        next_sat_id = shortest_path[1]
-        if next_sat_id in self.routing_table:
-            self.next_satellite = self.routing_table[next_sat_id]
+        next_sat_host = self.routing_table.get(shortest_path[1])
+        if next_sat_host is not None:
+            self.next_satellite = next_sat_host
             self.shortest_path = shortest_path
             self.distance = next_sat_distance
         else:
@@ -163,8 +249,10 @@ class WindTurbineNode:
             self.distance = None
 
 
+    @profiling.timed('encrypt')
     def encrypt_rsa_turbine_data(self, message: dict) -> bytes:
         ### need to start splitting the message up into chunks if message size > 245 bytes
+        import rsa
         text = json.dumps(message)
         utf8_text = text.encode("utf-8")
         encrypted_message = []
@@ -173,134 +261,296 @@ class WindTurbineNode:
         return bytes(b''.join(encrypted_message))
 
 
-    def hamming_encode(self, data: str) -> str:
-        """Encodes a 4-bit binary string using Hamming (7,4) code."""
-        d1, d2, d3, d4 = map(int, data)
-        p1 = d1 ^ d2 ^ d4  # Parity 1
-        p2 = d1 ^ d3 ^ d4  # Parity 2
-        p3 = d2 ^ d3 ^ d4  # Parity 3
-        return f"{p1}{p2}{d1}{p3}{d2}{d3}{d4}"
-
-
     def hamming_encode_message(self, data: bytes) -> bytes:
         """Encodes a byte message using Hamming (7,4) code."""
-        encoded_bits = []
-        for byte in data:
-            tophalf = (byte >> 4) & 0xF  # Upper 4 bits
-            encoded_bits.append(self.hamming_encode(f"{tophalf:04b}"))
-            bottomhalf = byte & 0xF      # Lower 4 bits
-            encoded_bits.append(self.hamming_encode(f"{bottomhalf:04b}"))
-
-        encoded_message = []
-        current_byte = ""
-        for bit_group in encoded_bits:
-            current_byte += bit_group
-            while len(current_byte) >= 8:
-                encoded_message.append(int(current_byte[:8], 2))
-                current_byte = current_byte[8:]
-        if current_byte:
-            encoded_message.append(int(current_byte.ljust(8, "0"), 2))
-        return bytes(encoded_message)
-
-
-    def simulate_leo_delay(self) -> float:
+        return codec.encode_message(data)
+
+
+    @profiling.timed('encode')
+    def fec_encode_message(self, data: bytes, fec=codec.DEFAULT_FEC) -> bytes:
+        return codec.encode(data, fec)
+
+
+    def select_fec(self, size, sigma):
+        """
+        The configured FEC scheme or, when adaptive, the cheapest one that gets
+        size bytes over the uplink to the next satellite within
+        codec.FEC_TARGET, at the uplink's current transit time noise. The
+        uplink is the only hop that adds noise, satellites forward bits as is.
+        """
+        if self.fec != 'adaptive':
+            return self.fec
+        return codec.choose_fec(link_budget.ber(self.distance, sigma), size)
+
+
+    def simulate_leo_delay(self, distance=None) -> float:
         """Simulate LEO transmission delay with jitter"""
-        C = 299_792_458 / 1000.0*1000.0  # kilometres per millisecond
-        base_delay = self.distance / C # milliseconds
-        jitter = random.uniform(2, 8) # milliseconds
-        leo_delay = (base_delay + jitter) / 1000 # seconds
-        print(f"Adding {leo_delay:0.4f}s delay")
+        leo_delay = channel.leo_delay(self.distance if distance is None else distance)
+        logger.debug("Adding %.4fs delay", leo_delay)
         return leo_delay
 
 
-    def simulate_noise(self, data: bytes) -> bytes:
-        f = 2.4e8 # frequency (2.4GHz)
-        C = 3e8 # speed of light [m/s^2]
-        Pt = 50 # transmit power [50W used by Starlink to overcome high attenuation wrt distance]
-        Pr = Pt * (C/(4 * math.pi * self.distance * 1000 * f))**2 # receiver power using FSPL model
-        Pt = 10*math.log10(Pt) + 30 # convert to dBm
-        Pr = 10*math.log10(Pr) + 30 # convert to dBm
-        print(f"Transmitting power {Pt:0.2f}dBm, Received power {Pr:0.2f}dBm")
-        T = 290 # Kelvin
-        k = 1.38e-23 # Boltzmann constant
-        B = 10e6 # 10MHz
-        Nt = 10*math.log10(T*k*B) + 30 # AWGN for ambient temperature at receiver
-        print(f"Noise due to temperature: {Nt:0.2f}dBm")
-        # Coeficient for transit time noise, influenced by atmospheric conditions
-        sigma = random.uniform(1e-9, 1e-8) # Excellent to Average atmospheric conditions
-        Nphi = 10*math.log10(1+(2*math.pi*f*sigma)) # Transit time noise
-        print(f"Noise due to transit time: {Nphi:0.2f}dBm")
-        SNR = Pr - (Nt + Nphi) # Signal to Noise Ratio (dBm calculation form)
-        print(f"SNR: {SNR:0.2f}")
-        BER = 0.5*math.erfc(SNR/math.sqrt(2)) # Bit Error Rate, formula valid for BPKS/QPKS modulation
-        print(f"BER: {BER:0.2e}")
-
-        bits = "".join([f"{byte:08b}" for byte in data])
-        flipped_bits = []
-        tally = 0
-        for bit in bits:
-            if random.random() < BER:
-                bit = '1' if bit == '0' else '0' # Flip the bit
-                tally += 1
-            flipped_bits.append(bit)
-        flipped_data = bytes(int("".join(flipped_bits[i:i+8]), base=2) for i in range(0, len(flipped_bits), 8))
-        print(f"flipped {tally} bits")
+    def simulate_noise(self, data: bytes, distance=None, sigma=None) -> bytes:
+        if distance is None:
+            distance = self.distance
+        if sigma is None:
+            sigma = channel.ground_sigma()
+        ber = link_budget.ber(distance, sigma)
+        flipped_data, tally = channel.flip_bits(data, ber)
+        BITS_FLIPPED.inc(tally)
+        BITS_TRANSMITTED.inc(len(data) * 8)
+        if logger.isEnabledFor(logging.DEBUG):
+            link = link_budget.closed_form(distance, sigma)
+            logger.debug("Pt %.2fdBm Pr %.2fdBm Nt %.2fdBm Nphi %.2fdBm SNR %.2f BER %.2e, flipped %d bits",
+                         link['Pt'], link['Pr'], link['Nt'], link['Nphi'], link['SNR'], ber, tally)
 
         return flipped_data
 
 
-    def send_status_update(self, generate=True):
-        """Send turbine status to the closest available satellite using HTTP"""
-        
-        if generate:
-            turbine_data = self.generate_turbine_data()
-        elif self.queue.empty():
-            print("Queue Cleared")
-            return
-        else:
-            turbine_data = self.queue.get()
-        print(f"Messages in queue: {self.queue.qsize()}")
-        
-        self.update_nearest_satellite()
-        if self.next_satellite is None or self.gs_id not in self.routing_table:
-            print("No path to ground station can be made. No message sent. Adding to Queue...")
-            self.queue.put(turbine_data)
-            return
-
-        encrypted_data = self.encrypt_rsa_turbine_data(turbine_data)
-        error_correct_data = self.hamming_encode_message(encrypted_data)
-        noisy_data = self.simulate_noise(error_correct_data)
-
-        dest_ip = self.routing_table[self.gs_id][0]
-        dest_port = str(self.routing_table[self.gs_id][1])
+    def send_status_update(self, generate=True, turbine_data=None):
+        """
+        Send turbine status to the closest available satellite using HTTP,
+        then resend from the outbox as far as drain_outbox allows. With
+        generate False only the outbox is drained.
+        """
+        span = tracing.start_trace(self.farm_id, time.time())
+        # turbine_data is passed in when replaying a recording
+        if turbine_data is None and generate:
+            with tracing.stage(span, 'generate'):
+                turbine_data = self.generate_turbine_data()
+        if turbine_data is not None:
+            # Numbered once: a resend from the outbox keeps its number, so the ground station can tell copies
+            # of a delivered snapshot whose response was lost from snapshots that never arrived
+            turbine_data = {**turbine_data, 'epoch': self.epoch, 'seq': next(self.sequences[turbine_data['turbine_id']])}
+            if not self.transmit(turbine_data, self.message_priority(turbine_data), span):
+                return
+        self.drain_outbox()
+
+
+    def drain_outbox(self):
+        """
+        Resend queued status updates one after another, most urgent first.
+        Stops once the outbox is empty, next_from_outbox holds the rest back
+        (bulk rate, a gateway farm's per-turn budget), or a resend shows the
+        ground station can't be reached for now.
+        """
+        drained = False
+        while not self.queue.empty():
+            queued = self.next_from_outbox()
+            if queued is None:
+                return
+            drained = True
+            self.outbox_changed()
+            logger.debug("Messages in queue: %d", self.queue.qsize())
+            traffic_class, turbine_data = queued
+            if not self.transmit(turbine_data, traffic_class, tracing.start_trace(self.farm_id, time.time())):
+                return
+        if drained:
+            logger.info("Queue Cleared")
+
+
+    def transmit(self, turbine_data, traffic_class, span=None):
+        """
+        Send one numbered status update. Updates that don't get through go
+        to the outbox. Returns False if draining the outbox should wait for
+        the next update: there is no path, or the path doesn't work.
+        """
+        with tracing.stage(span, 'route'):
+            self.update_nearest_satellite()
+        ground_station = self.routing_table.get(self.gs_id)
+        if self.next_satellite is None or ground_station is None:
+            logger.warning("No path to ground station can be made. No message sent. Adding to Queue...")
+            self.enqueue(turbine_data, traffic_class)
+            return False
+
+        with tracing.stage(span, 'encrypt'):
+            encrypted_data = self.encrypt_rsa_turbine_data(turbine_data)
+        message_id = uuid.uuid4().hex
+        # Uplink conditions for this message; every copy and retransmission sees them
+        sigma = channel.ground_sigma()
+        fec = self.select_fec(self.fragment_size or len(encrypted_data), sigma)
+        FEC_MESSAGES[fec].inc()
+        with tracing.stage(span, 'fec'):
+            if self.fragment_size:
+                error_correct_data = framing.fragment(message_id, encrypted_data, self.fragment_size, fec)
+            else:
+                error_correct_data = self.fec_encode_message(encrypted_data, fec)
+        framed = isinstance(error_correct_data, list)
+
+        dest_ip = ground_station[0]
+        dest_port = str(ground_station[1])
         headers = {
             'X-Destination-ID': str(self.gs_id),
             'X-Destination-IP': dest_ip,
             'X-Destination-Port': dest_port,
-            'X-Group-ID': '8'
+            'X-Group-ID': '8',
+            MESSAGE_ID_HEADER: message_id,
+            codec.FEC_HEADER: fec,
+            priority.PRIORITY_HEADER: traffic_class,
+            SEQUENCE_HEADER: format_sequence(turbine_data['turbine_id'], turbine_data['epoch'], turbine_data['seq']),
         }
+        if framed:
+            headers[framing.FRAGMENT_SIZE_HEADER] = str(self.fragment_size)
+            headers[framing.FRAGMENT_COUNT_HEADER] = str(len(error_correct_data))
+
+        routes = self.multipath_routes(traffic_class)
+        if len(routes) > 1:
+            if span is not None:
+                headers[tracing.TRACE_HEADER] = span.header()
+            if not self.send_copies(routes, error_correct_data, headers, sigma):
+                self.enqueue(turbine_data, traffic_class)
+                return False
+            MESSAGES_SENT.inc()
+            PRIORITY_MESSAGES[traffic_class].inc()
+            return True
+
+        if not framed:
+            with tracing.stage(span, 'noise'):
+                noisy_data = self.simulate_noise(error_correct_data, sigma=sigma)
 
         # Send HTTP POST request to the next satellite
         url = f"http://{self.next_satellite[0]}:{self.next_satellite[1]}/"
         try:
-            time.sleep(self.simulate_leo_delay())
-            response = requests.post(url, headers=headers, data=noisy_data, verify=False, timeout=1, proxies={"http": None, "https": None})
-            print("\033[92mStatus Update Sent:\033[0m", turbine_data.keys(), "to", self.next_satellite)
-            time.sleep(self.simulate_leo_delay())
-            print("\033[91mResponse Received:\033[0m", response.status_code, response.text)
+            with tracing.stage(span, 'delay'):
+                time.sleep(self.simulate_leo_delay())
+            if span is not None:
+                headers[tracing.TRACE_HEADER] = span.header()
+            if framed:
+                missing = self.send_framed(url, headers, error_correct_data, sigma=sigma)
+                if missing:
+                    logger.warning("Fragments %s still damaged after %d rounds, message queued", missing, framing.MAX_ROUNDS)
+                    self.enqueue(turbine_data, traffic_class)
+                    return False
+                MESSAGES_SENT.inc()
+                PRIORITY_MESSAGES[traffic_class].inc()
+                logger.debug("Status Update Sent: %s to %s", list(turbine_data.keys()), self.next_satellite)
+            else:
+                response = self.session().post(url, headers=headers, data=noisy_data, verify=False, timeout=1, proxies={"http": None, "https": None})
+                MESSAGES_SENT.inc()
+                PRIORITY_MESSAGES[traffic_class].inc()
+                BYTES_SENT.inc(len(noisy_data))
+                logger.debug("Status Update Sent: %s to %s", list(turbine_data.keys()), self.next_satellite)
+                time.sleep(self.simulate_leo_delay())
+                logger.debug("Response Received: %s %s", response.status_code, response.text)
 
         except Exception as e:
-            print(f"Error sending status update: {e}")
-            # remove satellite from routing table, it's down
-            network_manager.send_down_device(self.routing_table, self.shortest_path[1],self.wf_id)
-            if self.shortest_path[1] in self.routing_table:
-                del self.routing_table[int(self.shortest_path[1])]
-                print(f"Removed satellite {self.shortest_path[1]} from routing table")
-            self.queue.put(turbine_data)
-            self.send_status_update(generate=False)
+            SEND_FAILURES.inc()
+            logger.warning("Error sending status update: %s", e)
+            # remove satellite from routing table, it's down, and let the outbox retry over another one
+            self.gossip.report_down(int(self.shortest_path[1]))
+            self.enqueue(turbine_data, traffic_class)
+        return True
+
+
+    def enqueue(self, turbine_data, traffic_class):
+        """Keep a status update in the outbox for a later resend. Alerts stay alerts, the rest is stale by then and waits as bulk"""
+        self.queue.put((traffic_class if traffic_class == 'alert' else 'bulk', turbine_data))
+        self.outbox_changed()
+
+
+    def next_from_outbox(self):
+        """
+        (traffic class, status update) to resend next, or None. Queued alerts
+        always go, bulk only while the bulk token bucket has tokens, so a long
+        backlog is spread over later updates instead of delaying them.
+        """
+        next_class = self.queue.peek()
+        if next_class is None:
+            return None
+        if next_class != 'alert' and self.bulk is not None and not self.bulk.take():
+            logger.debug("Bulk rate reached, %d messages left in queue", self.queue.qsize())
+            return None
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            return None
 
-        if not self.queue.empty():
-            self.send_status_update(generate=False)
+
+    def message_priority(self, turbine_data):
+        """'alert' if any turbine's reported power is far from its expected output, else 'normal'"""
+        readings = list(turbine_data['turbines'].values())
+        expected = self.turbine.estimate_power_output_array(
+            [reading['wind_speed'] for reading in readings],
+            [reading['temperature'] for reading in readings],
+            [reading['pressure'] for reading in readings],
+        )
+        reported = np.array([reading['power_output'] for reading in readings])
+        return 'alert' if np.any(np.abs(reported - expected) > ALERT_POWER_RESIDUAL) else 'normal'
+
+
+    def multipath_routes(self, traffic_class):
+        """
+        Node-disjoint (path, first hop distance) routes to send a message of
+        this traffic class over, as many as the class is configured for. A
+        single route means the normal single-path send.
+        """
+        if not self.multipath:
+            return []
+        k = self.multipath.get(traffic_class, 1)
+        if k <= 1:
+            return []
+        routes = self.routes.get(('disjoint', k, self.farm_id),
+                                 lambda positions: find_disjoint_paths(self.route_positions(positions), self.wf_id, self.gs_id, k))
+        return [(path, distance) for path, distance in routes if path[1] in self.routing_table]
+
+
+    def send_copies(self, routes, data, headers, sigma=None):
+        """
+        Send the encoded frame along every route in parallel, each copy
+        source-routed with an X-Route header and seeing its own channel noise.
+        The ground station keeps the first intact copy by X-Message-ID.
+        Returns True if at least one first hop accepted a copy.
+        """
+        futures = [self.copy_senders.submit(self.send_copy, path, distance, data, headers, sigma) for path, distance in routes]
+        results = [future.result() for future in futures]
+        COPIES_SENT.inc(sum(results[1:]))
+        return any(results)
+
+
+    def send_copy(self, path, distance, data, headers, sigma=None):
+        next_hop = path[1]
+        try:
+            next_ip, next_port = self.routing_table[next_hop]
+            if isinstance(data, list):
+                time.sleep(self.simulate_leo_delay(distance))
+                missing = self.send_framed(f"http://{next_ip}:{next_port}/", {**headers, ROUTE_HEADER: format_route(path)},
+                                           data, distance, sigma)
+                logger.debug("Copy sent along %s, fragments missing: %s", path, missing)
+                return not missing
+            noisy_data = self.simulate_noise(data, distance, sigma)
+            time.sleep(self.simulate_leo_delay(distance))
+            response = self.session().post(f"http://{next_ip}:{next_port}/", headers={**headers, ROUTE_HEADER: format_route(path)},
+                                     data=noisy_data, verify=False, timeout=1, proxies={"http": None, "https": None})
+            BYTES_SENT.inc(len(noisy_data))
+            logger.debug("Copy sent along %s, response: %s", path, response.status_code)
+            return True
+        except Exception as e:
+            SEND_FAILURES.inc()
+            logger.warning("Error sending copy along %s: %s", path, e)
+            self.gossip.report_down(next_hop)
+            return False
+
+
+    def send_framed(self, url, headers, fragments, distance=None, sigma=None):
+        """
+        Send a framed status update over the noisy uplink with selective
+        repeat: every round sees fresh noise and only the fragments the
+        satellite NACKs go again. Returns the fragment indices still missing.
+        """
+        rounds = 0
+
+        def post(body):
+            nonlocal rounds
+            if rounds:
+                time.sleep(self.simulate_leo_delay(distance))
+            rounds += 1
+            noisy_data = self.simulate_noise(body, distance, sigma)
+            response = self.session().post(url, headers=headers, data=noisy_data, verify=False, timeout=1, proxies={"http": None, "https": None})
+            BYTES_SENT.inc(len(noisy_data))
+            time.sleep(self.simulate_leo_delay(distance))  # the NACK travels back
+            return response
+
+        return framing.send(post, fragments)
 
 
     def start_flask_app(self):
@@ -310,24 +560,261 @@ class WindTurbineNode:
             "use_reloader": False,
             "debug": False
         }, daemon=True).start()
+        startup.wait_until_serving(self.wf_host[1])
+        threading.Thread(target=self.warm_up, daemon=True).start()
+
+
+    def warm_up(self):
+        """Startup work deferred until the node is serving: link budget tables and the first network scan"""
+        link_budget.warm()
+        self.public_key  # load the key before the first update needs it
+        found = network_manager.scan_network(device_id=self.wf_id, device_port=self.wf_host[1])
+        self.routing_table.refresh(found, self.unconfirmed)
+        startup.discovered(len(found))
+        # From here on membership changes arrive by gossip instead of rescans and /down floods
+        self.gossip.seed(dict(self.routing_table.items()))
+        self.gossip.start()
+        logger.info("Routing table for %s: %s", self.name, self.routing_table)
+
+
+class HostedFarm(WindTurbineNode):
+    """
+    A farm run by a FarmGateway. It has its own id (reported as turbine_id),
+    position, turbine count and outbox. The routing view, gossip, key, weather
+    cache, pooled connections and FEC settings are the gateway's. It routes
+    as the gateway's device 0, with its own position standing in for it.
+    """
+
+    def __init__(self, gateway, farm_id, latitude, longitude, altitude=0.0, num_turbines=30):
+        # Not WindTurbineNode.__init__, which builds a whole node with its own table, gossip and app
+        self.gateway = gateway
+        self.name = f"Farm {farm_id}"
+        self.wf_id = gateway.wf_id
+        self.wf_host = gateway.wf_host
+        self.gs_id = gateway.gs_id
+        self.farm_id = farm_id
+        self.num_turbines = num_turbines
+        self.queue = priority.PriorityQueue()
+        self.bulk = priority.TokenBucket(gateway.bulk.rate, gateway.bulk.burst) if gateway.bulk else None
+        self.epoch = gateway.epoch
+        self.sequences = defaultdict(itertools.count)
+        self._outbox_size = 0
+        self.backlog_budget = 0
+        self.turns = 0
+        for shared in ('multipath', 'copy_senders', 'fragment_size', 'fec', 'routing_table', 'routes', 'gossip',
+                       'turbine', 'public_key', 'http'):
+            setattr(self, shared, getattr(gateway, shared))
+        self.latitude = latitude
+        self.longitude = longitude
+        self.altitude = altitude
+        self.position = {'id': self.wf_id, 'lat': latitude, 'long': longitude, 'alt': altitude}
+        self.weather = gateway.weather_for(latitude, longitude)
+        self.next_satellite = None
+
+
+    def outbox_changed(self):
+        # outbox_queue_depth counts every hosted farm's outbox
+        size = self.queue.qsize()
+        OUTBOX_DEPTH.inc(size - self._outbox_size)
+        self._outbox_size = size
+
+
+    def route_positions(self, positions):
+        return [self.position if position['id'] == self.wf_id else position for position in positions]
+
+
+    def next_from_outbox(self):
+        # The outbox is drained a few messages per turn, so one farm's backlog can't hold a sender.
+        # Queued alerts don't count against that
+        if self.queue.peek() != 'alert':
+            if self.backlog_budget <= 0:
+                return None
+            self.backlog_budget -= 1
+        return super().next_from_outbox()
+
+
+    def take_turn(self, backlog=1):
+        """One new snapshot, then up to `backlog` outbox retries"""
+        self.turns += 1
+        self.backlog_budget = backlog
+        self.send_status_update()
+
+
+class FairScheduler:
+    """
+    Runs farm turns on a fixed pool of sender threads, earliest due first.
+    Each farm is due every interval seconds. First turns are staggered over
+    one interval, so farms don't all send at once. A farm has at most one
+    turn in flight. A farm that falls behind skips the turns it missed rather
+    than bursting, so a slow uplink delays only its own farm, and an
+    overloaded gateway delays every farm alike.
+    """
+
+    def __init__(self, farms, interval, senders=8, backlog_per_turn=1, clock=time.monotonic):
+        self.interval = interval
+        self.senders = senders
+        self.backlog_per_turn = backlog_per_turn
+        self.clock = clock
+        now = clock()
+        self._due = [(now + interval * order / len(farms), order, farm) for order, farm in enumerate(farms)]
+        heapq.heapify(self._due)
+        self._condition = threading.Condition()
+
+    def _next(self):
+        with self._condition:
+            while True:
+                wait = self._due[0][0] - self.clock() if self._due else None
+                if wait is not None and wait <= 0:
+                    return heapq.heappop(self._due)
+                self._condition.wait(wait)
+
+    def _run(self):
+        while True:
+            due, order, farm = self._next()
+            TURN_LAG_SECONDS.observe(max(0.0, self.clock() - due))
+            try:
+                farm.take_turn(self.backlog_per_turn)
+            except Exception:
+                logger.exception("Turn of farm %s failed", farm.farm_id)
+            GATEWAY_TURNS.inc()
+            with self._condition:
+                heapq.heappush(self._due, (max(due + self.interval, self.clock()), order, farm))
+                self._condition.notify()
+
+    def start(self):
+        for sender in range(self.senders):
+            threading.Thread(target=self._run, name=f'farm-sender-{sender}', daemon=True).start()
+        return self
+
+
+class FarmGateway(WindTurbineNode):
+    """
+    One process hosting many farms behind a single wind farm node: one port,
+    routing table, gossip view, RSA key and pooled HTTP session. Farms in the
+    same weather_grid cell (degrees) share one weather provider. Snapshot
+    generation and uplink for all farms run on a FairScheduler with a fixed
+    number of sender threads, so the thread count doesn't grow with the farms.
+    """
+
+    def __init__(self, farms, interval=5.0, senders=8, weather_grid=0.5, **node_args):
+        super().__init__(**node_args)
+        self.name = "Wind Farm Gateway"
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.http = requests.Session()
+        self.http.mount('http://', HTTPAdapter(pool_connections=16, pool_maxsize=senders * max(self.multipath.values(), default=1)))
+        self.weather_grid = weather_grid
+        self._weather = {self.weather_cell(self.latitude, self.longitude): self.weather}
+
+        self.farms = [HostedFarm(self, farm['id'], farm['lat'], farm['long'], farm.get('alt', 0.0),
+                                 farm.get('turbines', self.num_turbines)) for farm in farms]
+        self.scheduler = FairScheduler(self.farms, interval, senders)
+        GATEWAY_FARMS.set(len(self.farms))
+        logger.info("Hosting %d farms on %d senders, %d weather providers", len(self.farms), senders, len(self._weather))
+
+        @self.app.route('/farms', methods=['GET'])
+        def get_farms():
+            return jsonify([{
+                "farm-id": farm.farm_id,
+                "lat": farm.latitude,
+                "long": farm.longitude,
+                "turbines": farm.num_turbines,
+                "turns": farm.turns,
+                "outbox": farm.queue.qsize(),
+            } for farm in self.farms])
+
+
+    def weather_cell(self, latitude, longitude):
+        return round(latitude / self.weather_grid), round(longitude / self.weather_grid)
+
+
+    def weather_for(self, latitude, longitude):
+        """The weather provider shared by farms in this position's grid cell"""
+        cell = self.weather_cell(latitude, longitude)
+        if cell not in self._weather:
+            self._weather[cell] = weather.make_provider(latitude, longitude).start()
+        return self._weather[cell]
+
+
+    def start(self):
+        self.scheduler.start()
+        return self
+
+
+def read_farms(path):
+    """Farms from a CSV with columns id, lat, long and optionally alt and turbines"""
+    with open(path, newline='') as f:
+        return [{'id': int(row['id']), 'lat': float(row['lat']), 'long': float(row['long']),
+                 **({'alt': float(row['alt'])} if row.get('alt') else {}),
+                 **({'turbines': int(row['turbines'])} if row.get('turbines') else {})}
+                for row in csv.DictReader(f)]
+
+
+def synthetic_farms(count, spread=1.0, seed=0):
+    """count farms with ids 1..count scattered up to spread degrees around the configured farm position"""
+    rng = random.Random(seed)
+    _, center = update_satellite_positions.read_static_positions()
+    return [{'id': farm_id, 'lat': center['lat'] + rng.uniform(-spread, spread),
+             'long': center['long'] + rng.uniform(-spread, spread)} for farm_id in range(1, count + 1)]
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offshore wind farm node")
+    parser.add_argument('--turbines', type=int, default=30, help="number of turbines per status update")
+    parser.add_argument('--interval', type=float, default=5.0, help="seconds between status updates")
+    parser.add_argument('--no-prompt', action='store_true', help="start sending without waiting for a key press")
+    parser.add_argument('--replay', help="send recorded snapshots (.csv, .jsonl or .sqlite) instead of generating them")
+    parser.add_argument('--speedup', type=float, default=1.0, help="replay speed-up factor, 0 for as fast as possible")
+    parser.add_argument('--max-rate', type=float, help="cap on replayed snapshots per second")
+    parser.add_argument('--multipath', default='',
+                        help="disjoint paths per message priority, e.g. alert=3,normal=1 (default single path)")
+    parser.add_argument('--fragment-size', type=int, nargs='?', const=framing.FRAGMENT_SIZE,
+                        help=f"split updates into CRC checked fragments of this many bytes (default {framing.FRAGMENT_SIZE}), "
+                             "resending only damaged ones")
+    parser.add_argument('--fec', choices=['adaptive', *codec.FEC_SCHEMES], default=codec.DEFAULT_FEC,
+                        help="forward error correction, 'adaptive' picks the cheapest code the path's link budget allows")
+    parser.add_argument('--bulk-rate', type=float, default=2.0,
+                        help="outbox backlog (not alerts) resent per second at most, spread over status updates; 0 for no limit")
+    parser.add_argument('--farms', type=int, help="gateway mode: host this many synthetic farms in one process")
+    parser.add_argument('--farms-file', help="gateway mode: host the farms in this CSV (id,lat,long[,alt][,turbines])")
+    parser.add_argument('--senders', type=int, default=8, help="gateway mode: sender threads shared by all farms")
+    parser.add_argument('--weather-grid', type=float, default=0.5,
+                        help="gateway mode: farms within the same cell of this many degrees share weather")
+    args = parser.parse_args()
+    gateway_mode = args.farms or args.farms_file
+    if gateway_mode and args.replay:
+        parser.error("--replay sends one farm's recording, it can't be combined with --farms")
+    multipath = {priority: int(k) for priority, k in (item.split('=') for item in args.multipath.split(',') if item)}
+
     try:
-        turbine = WindTurbineNode()
+        node_args = dict(num_turbines=args.turbines, multipath=multipath, fragment_size=args.fragment_size, fec=args.fec,
+                         bulk_rate=args.bulk_rate or None, bulk_burst=args.bulk_rate * args.interval)
+        if gateway_mode:
+            farms = read_farms(args.farms_file) if args.farms_file else synthetic_farms(args.farms)
+            turbine = FarmGateway(farms, interval=args.interval, senders=args.senders, weather_grid=args.weather_grid,
+                                  **node_args)
+        else:
+            turbine = WindTurbineNode(**node_args)
         turbine.start_flask_app()
 
-        input("\n"+"-"*30+"\nWind Turbine Online. Press any key to start...\n"+"-"*30+"\n\n")
+        if not args.no_prompt:
+            input("\n"+"-"*30+"\nWind Turbine Online. Press any key to start...\n"+"-"*30+"\n\n")
+
+        # Membership changes arrive by gossip in the background
+        if gateway_mode:
+            turbine.start()
+            while True:
+                time.sleep(60)
+
+        if args.replay:
+            for snapshot in replay.paced(replay.read_snapshots(args.replay), args.speedup, args.max_rate):
+                turbine.send_status_update(turbine_data=snapshot)
+            logger.info("Replay of %s finished", args.replay)
+            sys.exit(0)
 
         while True:
-            for _ in range(12):
-                turbine.send_status_update()
-                time.sleep(5)
-            network_manager.scan_network(
-                device_id=turbine.wf_id, 
-                device_port=turbine.wf_host[1],
-                exclude_list={f"{ip}:{port}" for ip, port in turbine.routing_table.values()}
-            )
+            turbine.send_status_update()
+            time.sleep(args.interval)
 
     except KeyboardInterrupt:
         print("-"*30+"\nSimulation stopped by user\n"+"-"*30)
\ No newline at end of file
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class WindTurbineCalculator:
     def __init__(self):
         # Siewind SWT-6.0-154 specifications
@@ -55,3 +58,31 @@ class WindTurbineCalculator:
 
         # Adjust power for air density
         return power * air_density_ratio
+
+    def estimate_power_output_array(self, wind_speed, temperature_celsius, pressure_pascal):
+        """
+        Vectorised estimate_power_output for numpy arrays of readings
+        Returns power in kW
+        """
+        wind_speed = np.asarray(wind_speed, dtype=np.float64)
+        power = np.select(
+            [
+                wind_speed < self.cut_in_speed,
+                wind_speed < 5.0,
+                wind_speed < 10.0,
+                wind_speed < self.rated_speed,
+                wind_speed <= self.cut_out_speed,
+            ],
+            [
+                0.0,
+                self.rated_power * 0.2 * (wind_speed - self.cut_in_speed) / (5.0 - self.cut_in_speed),
+                self.rated_power * (0.2 + 0.6 * ((wind_speed - 5.0) / (10.0 - 5.0)) ** 2),
+                self.rated_power * (0.8 + 0.2 * (wind_speed - 10.0) / (self.rated_speed - 10.0)),
+                self.rated_power,
+            ],
+            default=0.0
+        )
+        air_density = self.calculate_air_density(np.asarray(temperature_celsius, dtype=np.float64),
+                                                 np.asarray(pressure_pascal, dtype=np.float64))
+        return power * (air_density / 1.225)
+
@@ -0,0 +1,31 @@
+from anomaly import AnomalyEngine
+from wind_turbine_calculator import WindTurbineCalculator
+
+
+def snapshot(timestamp, power, wind_speed=9.0):
+    return {"timestamp": timestamp, "turbine_id": 0, "turbines": {
+        "turbine 1": {"temperature": 10.0, "wind_speed": wind_speed, "pressure": 101325.0, "power_output": power}}}
+
+
+def rate_alerts(engine, *snapshots):
+    return [alert for data in snapshots for alert in engine.evaluate(data) if alert['kind'] == 'rate']
+
+
+def test_default_rate_threshold_follows_rated_power_and_interval():
+    calculator = WindTurbineCalculator()
+    assert AnomalyEngine(calculator).rate_threshold == 0.25 * calculator.rated_power / 5.0
+    assert AnomalyEngine(calculator, interval=1.0).rate_threshold == 0.25 * calculator.rated_power
+    assert AnomalyEngine(calculator, rate_threshold=50.0).rate_threshold == 50.0
+
+
+def test_realistic_ramp_trips_rate_rule():
+    # A gust front taking a 6 MW turbine from half to 80% of rated power between two 5 s updates
+    engine = AnomalyEngine(WindTurbineCalculator())
+    alerts = rate_alerts(engine, snapshot(0.0, 3000.0), snapshot(5.0, 4800.0, wind_speed=11.0))
+    assert len(alerts) == 1
+    assert alerts[0]['rate'] == 360.0
+
+
+def test_normal_fluctuation_does_not_trip_rate_rule():
+    engine = AnomalyEngine(WindTurbineCalculator())
+    assert rate_alerts(engine, *(snapshot(5.0 * i, 3000.0 + (-1) ** i * 200.0) for i in range(10))) == []
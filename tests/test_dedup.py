@@ -0,0 +1,49 @@
+from dedup import RecentIds, SequenceWindow
+
+
+def test_resend_inside_the_window_is_a_duplicate():
+    window = SequenceWindow(size=8, ids=RecentIds())
+    assert window.add((1, 0, 0))
+    assert window.seen((1, 0, 0))
+    assert not window.add((1, 0, 0))
+    assert window.summary()[1]['duplicates'] == 2
+
+
+def test_resend_below_the_window_is_checked_against_the_ids():
+    window = SequenceWindow(size=8, ids=RecentIds())
+    for seq in range(20):
+        assert window.add((1, 0, seq))
+    assert window.seen((1, 0, 2))
+    assert not window.add((1, 0, 2))
+    farm = window.summary()[1]
+    assert (farm['received'], farm['duplicates'], farm['missing']) == (20, 2, 0)
+
+
+def test_late_number_delivered_for_the_first_time_is_kept():
+    window = SequenceWindow(size=8, ids=RecentIds())
+    for seq in range(10, 30):
+        window.add((1, 0, seq))
+    assert not window.seen((1, 0, 3))
+    assert window.add((1, 0, 3))
+    assert not window.add((1, 0, 3))
+    farm = window.summary()[1]
+    assert (farm['first'], farm['late'], farm['missing']) == (3, 1, 6)
+
+
+def test_older_epoch_is_checked_against_the_ids():
+    window = SequenceWindow(size=8, ids=RecentIds())
+    window.add((1, 0, 5))
+    window.add((1, 1, 0))
+    assert window.seen((1, 0, 5))
+    assert not window.add((1, 0, 5))
+    assert window.add((1, 0, 6))
+
+
+def test_late_numbers_are_refused_without_ids():
+    window = SequenceWindow(size=8)
+    for seq in range(20):
+        window.add((1, 0, seq))
+    assert window.seen((1, 0, 2))
+    assert not window.add((1, 0, 3))
+    window.add((1, 1, 0))
+    assert not window.add((1, 0, 19))
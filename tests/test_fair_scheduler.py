@@ -0,0 +1,53 @@
+import threading
+import time
+
+from wind_farm import FairScheduler
+
+
+class Farm:
+    def __init__(self, farm_id, duration=0.0):
+        self.farm_id = farm_id
+        self.duration = duration
+        self.turns = []
+        self.in_flight = 0
+        self.overlapped = False
+        self._lock = threading.Lock()
+
+    def take_turn(self, backlog=1):
+        with self._lock:
+            self.in_flight += 1
+            self.overlapped |= self.in_flight > 1
+            self.turns.append(time.monotonic())
+        time.sleep(self.duration)
+        with self._lock:
+            self.in_flight -= 1
+
+
+def run(farms, interval, senders, seconds):
+    FairScheduler(farms, interval, senders).start()
+    time.sleep(seconds)
+    return [len(farm.turns) for farm in farms]
+
+
+def test_first_turns_are_staggered_over_one_interval():
+    farms = [Farm(farm_id) for farm_id in range(4)]
+    run(farms, 0.4, 2, 0.5)
+    firsts = [farm.turns[0] for farm in farms]
+    assert firsts == sorted(firsts)
+    assert 0.2 < firsts[-1] - firsts[0] < 0.4
+
+
+def test_every_farm_gets_a_turn_each_interval():
+    farms = [Farm(farm_id) for farm_id in range(5)]
+    turns = run(farms, 0.1, 2, 1.0)
+    assert all(8 <= count <= 12 for count in turns), turns
+    assert not any(farm.overlapped for farm in farms)
+
+
+def test_slow_farm_skips_missed_turns_without_delaying_the_others():
+    slow = Farm('slow', duration=0.35)
+    farms = [slow] + [Farm(farm_id) for farm_id in range(3)]
+    turns = run(farms, 0.1, 2, 1.0)
+    assert 2 <= turns[0] <= 3
+    assert all(8 <= count <= 12 for count in turns[1:]), turns
+    assert not slow.overlapped
@@ -0,0 +1,27 @@
+from find_shortest_way import find_disjoint_paths, find_shortest_path
+
+
+def position(device_id, lat, long, alt):
+    return {'id': device_id, 'lat': lat, 'long': long, 'alt': alt}
+
+
+# Wind farm 0 and ground station -1 can't reach each other directly, satellites 1-3 relay
+POSITIONS = [position(0, 0.0, 0.0, 0.0), position(-1, 0.0, 4.0, 0.0),
+             position(1, 0.0, 2.0, 550.0), position(2, 1.0, 2.0, 550.0), position(3, -1.0, 2.0, 550.0)]
+
+
+def test_shortest_path_goes_through_a_satellite():
+    path, distance = find_shortest_path(POSITIONS, 0, -1)
+    assert path[0] == 0 and path[-1] == -1 and path[1] == 1
+    assert distance > 550
+
+
+def test_no_path_when_an_endpoint_is_broken():
+    assert find_shortest_path(POSITIONS, 0, -1, broken_devices={-1}) == (None, None)
+    assert find_shortest_path(POSITIONS, 0, -1, broken_devices={'0'}) == (None, None)
+    assert find_disjoint_paths(POSITIONS, 0, -1, 3, broken_devices=[0]) == []
+
+
+def test_disjoint_paths_share_no_satellite():
+    paths = find_disjoint_paths(POSITIONS, 0, -1, 5, broken_devices=[3])
+    assert [path for path, _ in paths] == [[0, 1, -1], [0, 2, -1]]
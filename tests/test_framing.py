@@ -0,0 +1,94 @@
+import os
+
+import codec
+import framing
+from dedup import MESSAGE_ID_HEADER
+
+
+def headers(message_id, count, fragment_size=framing.FRAGMENT_SIZE, fec=codec.DEFAULT_FEC):
+    return {MESSAGE_ID_HEADER: message_id, framing.FRAGMENT_SIZE_HEADER: str(fragment_size),
+            framing.FRAGMENT_COUNT_HEADER: str(count), codec.FEC_HEADER: fec}
+
+
+def flip(fragment, position):
+    """Corrupt a fragment beyond what FEC corrects"""
+    damaged = bytearray(fragment)
+    for index in range(position, position + 16):
+        damaged[index] ^= 0xff
+    return bytes(damaged)
+
+
+def test_fragments_round_trip_with_every_fec_scheme():
+    data = os.urandom(700)
+    for fec in codec.FEC_SCHEMES:
+        fragments = framing.fragment('m1', data, 256, fec)
+        assert len(fragments) == 3
+        assert all(len(fragment) == framing.encoded_size(256, fec) for fragment in fragments)
+        unpacked = [framing.unpack('m1', fragment, 256, fec) for fragment in fragments]
+        assert [index for index, _, _ in unpacked] == [0, 1, 2]
+        assert b''.join(payload for _, _, payload in unpacked) == data
+
+
+def test_crc_rejects_corruption_and_fragments_of_another_message():
+    fragment = framing.fragment('m1', b'status update')[0]
+    assert framing.unpack('m1', flip(fragment, 40)) is None
+    assert framing.unpack('m2', fragment) is None
+
+
+def test_reassembler_nacks_damaged_fragments_until_all_arrive():
+    data = os.urandom(600)
+    fragments = framing.fragment('m1', data)
+    reassembler = framing.Reassembler()
+    missing, payload = reassembler.receive(headers('m1', 3), fragments[0] + flip(fragments[1], 40) + fragments[2])
+    assert (missing, payload) == ([1], None)
+    assert len(reassembler) == 1
+    missing, payload = reassembler.receive(headers('m1', 3), fragments[1])
+    assert (missing, payload) == ([], data)
+    assert len(reassembler) == 0
+    # A late retransmission of a completed message does not start it over
+    assert reassembler.receive(headers('m1', 3), fragments[2]) == ([], None)
+
+
+def test_reassembler_drops_the_oldest_and_abandoned_messages():
+    now = [0.0]
+    reassembler = framing.Reassembler(max_messages=2, max_age=10.0, clock=lambda: now[0])
+    for message_id in ('a', 'b', 'c'):
+        fragments = framing.fragment(message_id, bytes(600))
+        reassembler.receive(headers(message_id, 3), fragments[0])
+    assert list(reassembler._pending) == ['b', 'c']
+    now[0] = 20.0
+    reassembler.receive(headers('d', 3), framing.fragment('d', bytes(600))[0])
+    assert list(reassembler._pending) == ['d']
+
+
+def test_send_repeats_only_the_nacked_fragments():
+    fragments = framing.fragment('m1', os.urandom(600))
+    reassembler = framing.Reassembler()
+    bodies = []
+
+    class Response:
+        def __init__(self, missing):
+            self.missing = missing
+
+        def json(self):
+            return {'nack': self.missing}
+
+    def post(body):
+        bodies.append(body)
+        if len(bodies) == 1:
+            # Fragment 1 is damaged on the way
+            size = len(fragments[0])
+            body = body[:size] + flip(body[size:2 * size], 40) + body[2 * size:]
+        return Response(reassembler.receive(headers('m1', 3), body)[0])
+
+    assert framing.send(post, fragments) == []
+    assert bodies[1] == fragments[1]
+
+
+def test_send_gives_up_after_the_last_round():
+    class Response:
+        def json(self):
+            return {'nack': [0]}
+
+    assert framing.send(lambda body: Response(), framing.fragment('m1', b'x'), rounds=2) == [0]
+
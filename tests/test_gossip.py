@@ -0,0 +1,110 @@
+import threading
+
+import pytest
+from flask import Flask
+
+import gossip
+from gossip import ALIVE, DOWN, Gossip
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeTable:
+    def __init__(self):
+        self.devices = {}
+
+    def set(self, member_id, host):
+        self.devices[member_id] = host
+
+    def discard(self, member_id):
+        return self.devices.pop(member_id, None) is not None
+
+
+def node(node_id, generation=1000, **kwargs):
+    return Gossip(node_id, ('0.0.0.0', 33000 + node_id), generation, clock=Clock(), **kwargs)
+
+
+def test_merge_keeps_the_newest_version_and_readdresses_the_sender():
+    table = FakeTable()
+    a = node(1, routing_table=table)
+    assert a.merge([[2, '0.0.0.0', 33002, 500, 0, ALIVE], [3, '10.0.0.3', 33003, 700, 0, ALIVE]], sender_ip='10.0.0.2')
+    assert table.devices == {2: ('10.0.0.2', 33002), 3: ('10.0.0.3', 33003)}
+    # An older run of member 3 does not replace what we know
+    a.merge([[3, '10.0.0.3', 33003, 600, 5, DOWN]])
+    assert a.members[3]['version'] == (700, 0, ALIVE)
+    a.merge([[3, '10.0.0.3', 33003, 700, 0, DOWN]])
+    assert a.members[3]['version'] == (700, 0, DOWN)
+    assert 3 not in table.devices
+    assert sorted(a.alive()) == [2]
+
+
+def test_down_report_about_itself_is_refuted_with_a_higher_incarnation():
+    a, b = node(1), node(2)
+    b.merge([[1, '10.0.0.1', 33001, 1000, 0, ALIVE]])
+    b.report_down(1)
+    a.merge(b.handle({'entries': []}, '10.0.0.1')['entries'][1:])
+    assert a.members[1]['version'] == (1000, 1, ALIVE)
+    b.merge(a.handle({'entries': []}, '10.0.0.2')['entries'])
+    assert b.members[1]['version'] == (1000, 1, ALIVE)
+    assert b.alive() == [1]
+
+
+def test_exchange_with_a_member_forgotten_meanwhile_is_skipped():
+    posts = []
+    a = node(1, post=lambda host, payload: posts.append(host) or {'entries': []})
+    a.merge([[2, '10.0.0.2', 33002, 500, 0, ALIVE]])
+    a.report_down(2)
+    a.clock.now = a.forget_after + 1
+    a.round()
+    a.exchange(2)
+    assert 2 not in a.members and posts == []
+
+
+def test_alive_count_is_taken_under_the_lock():
+    a = node(1)
+    stop = threading.Event()
+    errors = []
+
+    def churn():
+        member_id = 100
+        try:
+            while not stop.is_set():
+                a.merge([[member_id, '10.0.0.9', 33000, 1, 0, ALIVE]])
+                with a._lock:
+                    del a.members[member_id]
+                member_id += 1
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=churn)
+    thread.start()
+    try:
+        for member_id in range(2000):
+            a.merge([[member_id + 10_000, '10.0.0.8', 33000, 1, 0, ALIVE]])
+    finally:
+        stop.set()
+        thread.join()
+    assert errors == []
+
+
+@pytest.mark.parametrize('body', [b'[1, 2]', b'"entries"', b'{"entries": 3}', b'not json'])
+def test_malformed_gossip_requests_get_400(body):
+    app = Flask(__name__)
+    gossip.register_gossip_endpoint(app, node(1))
+    response = app.test_client().post(gossip.GOSSIP_PATH, data=body)
+    assert response.status_code == 400
+
+
+def test_gossip_request_gets_the_full_view_when_the_sender_is_new():
+    app = Flask(__name__)
+    a = node(1)
+    a.merge([[3, '10.0.0.3', 33003, 700, 0, ALIVE]])
+    gossip.register_gossip_endpoint(app, a)
+    response = app.test_client().post(gossip.GOSSIP_PATH, json={'entries': [[2, '0.0.0.0', 33002, 500, 0, ALIVE]]})
+    assert sorted(entry[0] for entry in response.get_json()['entries']) == [1, 2, 3]
@@ -0,0 +1,49 @@
+import numpy as np
+
+from history import HistoryIndex, RingBuffer, downsample
+
+
+def row(farm_id, turbine, timestamp, power=1000.0):
+    return {'turbine_id': farm_id, 'turbine': f'turbine {turbine}', 'timestamp': timestamp,
+            'power_output': power, 'wind_speed': 9.0, 'temperature': 10.0, 'pressure': 101325.0}
+
+
+def test_ring_buffer_grows_up_to_capacity_then_overwrites_the_oldest():
+    buffer = RingBuffer(100, initial=4)
+    for timestamp in range(60):
+        buffer.append(timestamp, [timestamp] * 4)
+    assert buffer.allocated == 64
+    assert buffer.ordered()[0].tolist() == list(range(60))
+    for timestamp in range(60, 250):
+        buffer.append(timestamp, [timestamp] * 4)
+    assert buffer.allocated == 100
+    timestamps, values = buffer.ordered()
+    assert timestamps.tolist() == list(range(150, 250))
+    assert values[:, 0].tolist() == list(range(150, 250))
+
+
+def test_window_sorts_out_of_order_samples():
+    buffer = RingBuffer(8, initial=2)
+    for timestamp in (5, 1, 3, 7, 2):
+        buffer.append(timestamp, [timestamp] * 4)
+    timestamps, _ = buffer.window(2, 7)
+    assert timestamps.tolist() == [2, 3, 5]
+
+
+def test_downsample_min_max_mean_per_bucket():
+    timestamps = np.array([0.0, 1.0, 5.0, 6.0, 14.0])
+    values = np.array([[1.0], [3.0], [2.0], [4.0], [9.0]])
+    starts, mins, maxs, means = downsample(timestamps, values, 0.0, 5.0)
+    assert starts.tolist() == [0.0, 5.0, 10.0]
+    assert (mins[:, 0].tolist(), maxs[:, 0].tolist(), means[:, 0].tolist()) == ([1, 2, 9], [3, 4, 9], [2, 3, 9])
+
+
+def test_history_drops_the_least_recently_updated_turbines_over_budget():
+    index = HistoryIndex(store=None, capacity=1000, max_samples=150)
+    index.apply([row(0, 1, t) for t in range(60)])
+    index.apply([row(0, 2, t) for t in range(60)])
+    index.apply([row(0, 1, 60)])
+    assert index.allocated == 128
+    index.apply([row(1, 1, t) for t in range(10)])
+    assert list(index.buffers) == [(0, 1), (1, 1)]
+    assert index.allocated == sum(buffer.allocated for buffer in index.buffers.values()) == 128
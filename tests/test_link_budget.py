@@ -0,0 +1,57 @@
+import math
+
+import numpy as np
+import pytest
+
+import link_budget
+from link_budget import MIN_BER, TABLE_SIGMAS, closed_form
+
+TOLERANCE = 1e-4
+
+
+def distances():
+    """Random distances across the table, its edges and grid points, and distances outside it"""
+    link_table = link_budget.table(link_budget.SPACE_SIGMA)
+    low, high = 10 ** link_table.log_min, 10 ** link_table.log_max
+    edges = [low, low * (1 + 1e-9), 10 ** link_table.log_distances[1], 10 ** link_table.log_distances[-2],
+             high * (1 - 1e-9), high]
+    outside = [0.01, 0.5, low * (1 - 1e-6), high * (1 + 1e-6), 250_000.0]
+    rng = np.random.default_rng(0)
+    return np.concatenate([10 ** rng.uniform(link_table.log_min, link_table.log_max, 5000), edges, outside])
+
+
+def expected(name, distance, sigma):
+    row = closed_form(distance, sigma)
+    return {'snr': row['SNR'], 'ber': max(row['BER'], MIN_BER), 'quality': row['quality']}[name]
+
+
+def relative_errors(values, exact):
+    return np.abs(np.asarray(values) - exact) / np.maximum(np.abs(exact), 1e-12)
+
+
+@pytest.mark.parametrize('sigma', TABLE_SIGMAS)
+@pytest.mark.parametrize('name', ['snr', 'ber', 'quality'])
+def test_table_matches_closed_form(sigma, name):
+    link_table = link_budget.table(sigma)
+    lookup = getattr(link_table, name)
+    points = distances()
+    exact = np.array([expected(name, float(d), sigma) for d in points])
+
+    scalar = [lookup(float(d)) for d in points]
+    assert relative_errors(scalar, exact).max() <= TOLERANCE
+    assert relative_errors(lookup(points), exact).max() <= TOLERANCE
+
+
+@pytest.mark.parametrize('distance', [0.5, 1.0, 100_000.0, 250_000.0])
+def test_out_of_range_and_edges_use_closed_form_values(distance):
+    for sigma in TABLE_SIGMAS:
+        assert link_budget.ber(distance, sigma) == pytest.approx(max(closed_form(distance, sigma)['BER'], MIN_BER),
+                                                                  rel=TOLERANCE)
+
+
+def test_sigma_without_table_is_shifted_space_table():
+    sigma = 5e-9
+    for distance in (500.0, 2000.0, 4000.0):
+        row = closed_form(distance, sigma)
+        assert link_budget.snr(distance, sigma) == pytest.approx(row['SNR'], rel=TOLERANCE)
+        assert link_budget.ber(distance, sigma) == pytest.approx(0.5 * math.erfc(row['SNR'] / math.sqrt(2)), rel=1e-3)
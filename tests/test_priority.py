@@ -0,0 +1,35 @@
+from priority import DEFAULT_PRIORITY, PriorityQueue, TokenBucket, parse_priority
+
+
+def test_unknown_or_missing_priority_is_the_default():
+    assert parse_priority('alert') == 'alert'
+    assert parse_priority(None) == parse_priority('urgent') == DEFAULT_PRIORITY
+
+
+def test_queue_serves_the_most_urgent_class_first_and_fifo_within_it():
+    queue = PriorityQueue()
+    for entry in [('bulk', 1), ('normal', 2), ('bulk', 3), ('alert', 4), ('urgent', 5), ('alert', 6)]:
+        queue.put(entry)
+    assert queue.depths() == {'alert': 2, 'normal': 2, 'bulk': 2}
+    assert queue.peek() == 'alert'
+    assert [queue.get() for _ in range(6)] == [('alert', 4), ('alert', 6), ('normal', 2), ('normal', 5),
+                                              ('bulk', 1), ('bulk', 3)]
+    assert queue.empty() and queue.peek() is None
+
+
+def test_token_bucket_allows_a_burst_then_the_rate():
+    now = [0.0]
+    bucket = TokenBucket(rate=2.0, burst=3.0, clock=lambda: now[0])
+    assert [bucket.take() for _ in range(4)] == [True, True, True, False]
+    now[0] = 0.5
+    assert [bucket.take() for _ in range(2)] == [True, False]
+    now[0] = 100.0
+    assert sum(bucket.take() for _ in range(10)) == 3
+
+
+def test_token_bucket_burst_is_at_least_one():
+    now = [0.0]
+    bucket = TokenBucket(rate=0.5, burst=0.1, clock=lambda: now[0])
+    assert bucket.take() and not bucket.take()
+    now[0] = 2.0
+    assert bucket.take()
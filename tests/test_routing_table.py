@@ -0,0 +1,62 @@
+from routing_table import RouteCache, RoutingTable, load_snapshot
+
+
+def test_writes_bump_the_version_only_when_they_change_the_table():
+    table = RoutingTable({1: ('10.0.0.1', 33001)})
+    changes = []
+    table.subscribe(lambda version, devices: changes.append((version, dict(devices))))
+    assert table.set(2, ['10.0.0.2', 33002])
+    assert not table.set(2, ('10.0.0.2', 33002))
+    assert not table.discard(5)
+    assert table.discard(1)
+    assert table.version == 2
+    assert changes == [(1, {1: ('10.0.0.1', 33001), 2: ('10.0.0.2', 33002)}), (2, {2: ('10.0.0.2', 33002)})]
+
+
+def test_snapshots_are_not_affected_by_later_writes():
+    table = RoutingTable({1: ('10.0.0.1', 33001)})
+    version, devices = table.snapshot()
+    table.set(2, ('10.0.0.2', 33002))
+    assert (version, dict(devices)) == (0, {1: ('10.0.0.1', 33001)})
+    assert 2 in table and len(table) == 2
+
+
+def test_refresh_drops_unconfirmed_devices_the_scan_did_not_find():
+    table = RoutingTable({1: ('10.0.0.1', 33001), 2: ('10.0.0.2', 33002), 3: ('10.0.0.3', 33003)})
+    table.refresh({1: ('10.0.0.1', 33001), 4: ('10.0.0.4', 33004)}, unconfirmed={1, 2})
+    assert dict(table.items()) == {1: ('10.0.0.1', 33001), 3: ('10.0.0.3', 33003), 4: ('10.0.0.4', 33004)}
+    assert table.version == 1
+
+
+def test_persisted_table_is_loaded_back(tmp_path):
+    path = str(tmp_path / 'routing_table_1.json')
+    table = RoutingTable({1: ('10.0.0.1', 33001)})
+    table.persist(path)
+    table.set(2, ('10.0.0.2', 33002))
+    assert load_snapshot(path) == {1: ('10.0.0.1', 33001), 2: ('10.0.0.2', 33002)}
+
+
+def test_missing_or_unreadable_snapshot_loads_empty(tmp_path):
+    assert load_snapshot(str(tmp_path / 'missing.json')) == {}
+    (tmp_path / 'bad.json').write_text('{"devices": [1, 2]')
+    assert load_snapshot(str(tmp_path / 'bad.json')) == {}
+
+
+def test_route_cache_computes_once_per_table_version_and_time_bucket():
+    now = [1000.0]
+    table = RoutingTable({1: ('10.0.0.1', 33001), 2: ('10.0.0.2', 33002)})
+    cache = RouteCache(table, clock=lambda: now[0])
+    calls = []
+
+    def compute(positions):
+        calls.append(sorted(pos['id'] for pos in positions if pos['id'] > 0))
+        return None  # no route is a result too
+
+    assert cache.get('route', compute) is None
+    assert cache.get('route', compute) is None
+    assert calls == [[1, 2]]
+    now[0] += 1
+    cache.get('route', compute)
+    table.set(3, ('10.0.0.3', 33003))
+    cache.get('route', compute)
+    assert calls == [[1, 2], [1, 2], [1, 2, 3]]
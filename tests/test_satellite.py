@@ -0,0 +1,32 @@
+import socket
+
+import pytest
+
+import routing_table
+import satellite
+
+
+@pytest.fixture
+def sat(tmp_path, monkeypatch):
+    monkeypatch.setattr(routing_table, 'DATA_DIR', str(tmp_path))
+    return satellite.Satellite(3)
+
+
+def test_fragments_without_a_size_header_are_rejected(sat):
+    response = sat.app.test_client().post('/', data=b'x', headers={'X-Fragment-Count': '2', 'X-Message-ID': 'a'})
+    assert response.status_code == 400
+    assert sat.forward_queue.qsize() == 0
+
+
+def test_hop_that_never_answers_is_reported_down(sat, monkeypatch):
+    monkeypatch.setattr(satellite, 'FORWARD_TIMEOUT', 0.2)
+    down = []
+    monkeypatch.setattr(sat.gossip, 'report_down', down.append)
+    with socket.socket() as listener:
+        # Accepts connections but never answers
+        listener.bind(('127.0.0.1', 0))
+        listener.listen()
+        headers = {'X-Group-ID': '1', 'X-Destination-ID': '5',
+                   'X-Destination-IP': '127.0.0.1', 'X-Destination-Port': str(listener.getsockname()[1])}
+        sat.forward_data(headers, b'status')
+    assert down == [5]
@@ -0,0 +1,95 @@
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+import storage
+
+DAY = datetime(2026, 3, 1, 12, tzinfo=timezone.utc).timestamp()
+
+
+def message(timestamp, farm_id=1, power=1000.0):
+    return {'timestamp': timestamp, 'turbine_id': farm_id, 'turbines': {
+        'turbine 1': {'temperature': 10.0, 'pressure': 101325.0, 'wind_speed': 9.0, 'power_output': power},
+        'turbine 2': {'temperature': 11.0, 'pressure': 101325.0, 'wind_speed': 8.0, 'power_output': power / 2}}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = storage.TelemetryStore(str(tmp_path / 'telemetry.sqlite'), batch_size=3, flush_interval=0.05).start()
+    yield store
+    store.close()
+
+
+def test_partition_name_is_the_utc_day():
+    assert storage.partition_name(DAY) == 'readings_20260301'
+    assert storage.partition_name(DAY + 12 * 3600) == 'readings_20260302'
+
+
+def test_rows_are_partitioned_by_day_and_read_back_in_order(store):
+    assert store.append(message(DAY)) == 2
+    store.append(message(DAY + 86400, power=2000.0))
+    store.append(message(DAY + 60))
+    store.flush()
+    with store.snapshot() as conn:
+        assert store.partitions(conn) == ['readings_20260301', 'readings_20260302']
+    assert store.count() == 6
+    assert [row['timestamp'] for row in store.query(end=DAY + 86400)] == [DAY, DAY, DAY + 60, DAY + 60]
+    assert [row['power_output'] for row in store.query(start=DAY + 86400, turbine='turbine 1')] == [2000.0]
+    assert store.latest('turbine 2')['timestamp'] == DAY + 86400
+    assert list(store.scan()) == store.query()
+
+
+def test_flush_interval_commits_a_partial_batch(store, tmp_path):
+    store.append(message(DAY))
+    reader = storage.TelemetryStore(str(tmp_path / 'telemetry.sqlite'), readonly=True)
+    for _ in range(100):
+        if reader.count() == 2:
+            break
+        time.sleep(0.01)
+    assert reader.count() == 2
+
+
+def test_failed_batch_is_reported_and_the_writer_carries_on(store):
+    store.append_rows([(None, 0.0, 1, 'turbine 1', 10.0, 101325.0, 9.0, 1000.0)])
+    with pytest.raises(RuntimeError):
+        store.flush()
+    store.append(message(DAY))
+    store.flush()
+    assert store.count() == 2
+
+
+def test_drop_partitions_before(store):
+    store.append(message(DAY))
+    store.append(message(DAY + 86400))
+    store.flush()
+    store.drop_partitions_before(DAY + 86400)
+    assert {row['timestamp'] for row in store.query()} == {DAY + 86400}
+
+
+def test_read_since_picks_up_rows_committed_late_into_an_earlier_partition(store):
+    store.append(message(DAY))
+    store.flush()
+    rows, offset = store.read_since(None)
+    assert len(rows) == 2
+    store.append(message(DAY + 86400))
+    store.flush()
+    rows, offset = store.read_since(offset)
+    assert {row['timestamp'] for row in rows} == {DAY + 86400}
+    # A snapshot from before midnight that arrives after the first one from the next day
+    store.append(message(DAY + 600))
+    store.flush()
+    rows, offset = store.read_since(offset)
+    assert [row['timestamp'] for row in rows] == [DAY + 600, DAY + 600]
+    assert store.read_since(offset) == ([], offset)
+
+
+def test_bootstrap_offsets_cover_every_partition(store):
+    store.append(message(DAY))
+    store.append(message(DAY + 86400))
+    store.flush()
+    _, offset = store.window_with_offset(DAY + 86400)
+    assert offset == {'readings_20260301': 2, 'readings_20260302': 2}
+    latest, offset = store.latest_per_turbine()
+    assert {row['timestamp'] for row in latest} == {DAY + 86400}
+    assert store.read_since(offset) == ([], offset)
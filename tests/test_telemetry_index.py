@@ -0,0 +1,39 @@
+import pytest
+
+from telemetry_index import LatestIndex, TailingIndex, turbine_number
+
+
+class FakeStore:
+    def __init__(self, rows):
+        self.rows = rows
+        self.reads = []
+
+    def latest_per_turbine(self):
+        return self.rows, {'readings_20260301': len(self.rows)}
+
+    def read_since(self, offset):
+        self.reads.append(offset)
+        return [], offset
+
+
+def reading(farm_id, turbine, timestamp):
+    return {'turbine_id': farm_id, 'turbine': f'turbine {turbine}', 'timestamp': timestamp}
+
+
+def test_tailing_index_needs_bootstrap_and_apply():
+    class Incomplete(TailingIndex):
+        def apply(self, rows):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete(FakeStore([]))
+
+
+def test_latest_index_bootstraps_then_tails_from_the_offset():
+    store = FakeStore([reading(0, 1, 10.0), reading(2, 1, 11.0)])
+    index = LatestIndex(store, min_refresh_interval=0.0)
+    assert index.get(1, farm_id=2)['timestamp'] == 11.0
+    index.apply([reading(2, 1, 12.0)])
+    assert index.get(1, farm_id=2)['timestamp'] == 12.0
+    assert store.reads == [{'readings_20260301': 2}]
+    assert turbine_number('turbine 12') == 12